@@ -0,0 +1,139 @@
+"""End-to-end benchmark of the polling, dispatch and reply loop.
+
+A bot polls a local :class:`~telegram.ext.commands.testing.FakeBotAPI`
+over HTTP, and every update is an ``/echo`` whose reply is matched back
+to it, so latency covers the whole round trip through the real network
+stack::
+
+    python benchmarks/e2e.py --updates 500 --rate 100 --api-latency 0.02
+    python benchmarks/e2e.py --mode pipelined --api-latency 0.02
+"""
+
+import sys
+import json
+import time
+import argparse
+import platform
+import threading
+
+from telegram.ext import commands
+from telegram.ext.commands.testing import FakeBotAPI
+
+from loadgen import percentile
+from run import git_commit
+
+
+class TimedFakeBotAPI(FakeBotAPI):
+    """Records when the reply to each pushed update arrives."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pushed = {}
+        self.replied = {}
+        self.lock = threading.Lock()
+
+    def handle(self, endpoint, data):
+        if endpoint == "sendMessage":
+            with self.lock:
+                self.replied[str(data.get("text"))] = time.perf_counter()
+        return super().handle(endpoint, data)
+
+    def push(self, key):
+        with self.lock:
+            self.pushed[key] = time.perf_counter()
+        self.push_update("/echo " + key, chat_id=int(key) % 100 + 1)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--updates", type=int, default=500)
+    parser.add_argument("--rate", type=float, default=100.0, help="updates per second")
+    parser.add_argument(
+        "--api-latency", type=float, default=0.0, help="seconds per Bot API request"
+    )
+    parser.add_argument("--mode", choices=("polling", "pipelined"), default="polling")
+    parser.add_argument("--poll-timeout", type=int, default=1)
+    parser.add_argument("--drain-timeout", type=float, default=30.0)
+    parser.add_argument("--output", help="write the report as JSON to this file")
+    args = parser.parse_args(argv)
+
+    with TimedFakeBotAPI(latency=args.api_latency) as api:
+        bot = commands.Bot("123456:BENCH", owner_ids=[1], base_url=api.base_url)
+
+        @bot.command()
+        def echo(ctx, *, text):
+            ctx.send(text)
+
+        if args.mode == "pipelined":
+            bot.start_pipelined_polling(timeout=args.poll_timeout)
+        else:
+            bot.updater.start_polling(poll_interval=0, timeout=args.poll_timeout)
+
+        started = time.perf_counter()
+        for i in range(args.updates):
+            delay = started + i / args.rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            api.push(str(1000 + i))
+
+        deadline = time.perf_counter() + args.drain_timeout
+        while len(api.replied) < args.updates and time.perf_counter() < deadline:
+            time.sleep(0.01)
+        ended = time.perf_counter()
+
+        bot.stop()
+
+    with api.lock:
+        latencies = sorted(
+            api.replied[key] - sent
+            for key, sent in api.pushed.items()
+            if key in api.replied
+        )
+
+    def ms(value):
+        return None if value is None else value * 1000
+
+    results = {
+        "sent": args.updates,
+        "completed": len(latencies),
+        "throughput": len(latencies) / (ended - started),
+        "latency_ms": {
+            "p50": ms(percentile(latencies, 0.50)),
+            "p99": ms(percentile(latencies, 0.99)),
+            "p999": ms(percentile(latencies, 0.999)),
+            "max": ms(latencies[-1] if latencies else None),
+        },
+        "api_calls": dict(api.call_counts),
+    }
+
+    print(
+        "{completed}/{sent} replies, {throughput:.1f}/s, p50 {p50:.2f} ms, p99 {p99:.2f} ms".format(
+            **results, **results["latency_ms"]
+        ),
+        file=sys.stderr,
+    )
+
+    report = {
+        "meta": {
+            "timestamp": time.time(),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "platform": platform.platform(),
+            "mode": args.mode,
+            "rate": args.rate,
+            "api_latency": args.api_latency,
+        },
+        "results": results,
+    }
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,294 @@
+"""Synthetic end-to-end load for a bot, without Telegram.
+
+Updates are pushed into ``Bot.dispatcher.update_queue`` at a fixed rate
+and command mix, exactly where polling would put them, and every Bot API
+request the commands make is answered by a local stub. The report has the
+sustained throughput, p50/p99/p999 latency from enqueue to the end of
+handling, and how much the update queue grew::
+
+    python benchmarks/loadgen.py --rate 500 --duration 10 --mix echo=5,parse=3,help=1
+    python benchmarks/loadgen.py --extension mybot.cogs.fun --mix roll=1 --api-latency 0.05
+
+The schedule is open loop: updates are sent when they are due no matter
+how far behind the bot is, so overload shows up as queue growth and
+latency instead of a lower send rate.
+"""
+
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import threading
+
+import telegram
+from telegram.ext import TypeHandler
+from telegram.ext import commands
+from telegram.ext.commands import testing
+
+from run import git_commit, make_bot
+
+# text sent for the built in synthetic commands, other names are sent bare
+TEMPLATES = {
+    "noop": "/noop",
+    "echo": "/echo hello there, this is a load test",
+    "parse": "/parse 1 2 3 4 5 6 7 8 done",
+    "help": "/help",
+    "unknown": "/doesnotexist with arguments",
+}
+
+
+def add_synthetic_commands(bot):
+    @bot.command()
+    def noop(ctx):
+        pass
+
+    @bot.command()
+    def echo(ctx, *, text):
+        ctx.send(text)
+
+    @bot.command()
+    def parse(ctx, numbers: commands.Greedy[int], word: str):
+        pass
+
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+def percentile(ordered, fraction):
+    if not ordered:
+        return None
+    index = min(len(ordered) - 1, int(fraction * len(ordered)))
+    return ordered[index]
+
+
+class LoadGenerator:
+    """Drives a bot's dispatcher with synthetic updates and measures it.
+
+    Completion is recorded by a handler in a dispatcher group after the
+    bot's own, so latency covers everything the dispatcher thread does for
+    an update. Commands that hand work off to other threads are only
+    measured up to that hand-off.
+
+    Parameters
+    -----------
+    bot: :class:`telegram.ext.commands.Bot`
+        The bot to load. Its Bot API requests should already be stubbed.
+    stub: :class:`telegram.ext.commands.testing.StubBot`
+        The stub updates are bound to.
+    mix: Dict[:class:`str`, :class:`float`]
+        Command names and their relative weights.
+    rate: :class:`float`
+        Updates per second.
+    duration: :class:`float`
+        How long to send for, in seconds.
+    chats: :class:`int`
+        How many distinct chats and users updates come from.
+    seed: Optional[:class:`int`]
+        Seed for the command and chat choices, for repeatable runs.
+    """
+
+    def __init__(self, bot, stub, mix, *, rate, duration, chats=100, seed=None):
+        self.bot = bot
+        self.stub = stub
+        self.rate = rate
+        self.duration = duration
+        self.chats = chats
+        self._random = random.Random(seed)
+        self._texts = [TEMPLATES.get(name, "/" + name) for name in mix]
+        self._weights = list(mix.values())
+        # update_id: enqueue time
+        self._sent = {}
+        self._latencies = []
+        self._queue_samples = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+        bot.dispatcher.add_handler(TypeHandler(object, self._completed), group=1)
+        # an exception escaping a handler skips the later groups
+        bot.dispatcher.add_error_handler(self._completed)
+
+    def _completed(self, update, context):
+        now = time.perf_counter()
+        update_id = getattr(update, "update_id", None)
+        with self._lock:
+            sent = self._sent.pop(update_id, None)
+            if sent is not None:
+                self._latencies.append(now - sent)
+
+    def _sample_queue(self, started):
+        queue = self.bot.dispatcher.update_queue
+        while not self._stop.wait(0.1):
+            self._queue_samples.append((time.perf_counter() - started, queue.qsize()))
+
+    def _make_update(self, update_id):
+        text = self._random.choices(self._texts, self._weights)[0]
+        chat_id = self._random.randrange(1, self.chats + 1)
+        data = testing.update_data(
+            text, update_id=update_id, chat_id=chat_id, user_id=chat_id
+        )
+        return telegram.Update.de_json(data, self.stub)
+
+    def run(self, drain_timeout=30.0):
+        dispatcher = self.bot.dispatcher
+        ready = threading.Event()
+        thread = threading.Thread(
+            target=dispatcher.start, kwargs={"ready": ready}, name="Dispatcher"
+        )
+        thread.start()
+        ready.wait()
+
+        started = time.perf_counter()
+        sampler = threading.Thread(target=self._sample_queue, args=(started,))
+        sampler.start()
+
+        total = int(self.rate * self.duration)
+        for i in range(total):
+            due = started + i / self.rate
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+            update = self._make_update(i + 1)
+            with self._lock:
+                self._sent[update.update_id] = time.perf_counter()
+            dispatcher.update_queue.put(update)
+
+        sending_ended = time.perf_counter()
+        deadline = sending_ended + drain_timeout
+        while time.perf_counter() < deadline:
+            with self._lock:
+                if not self._sent:
+                    break
+            time.sleep(0.01)
+        ended = time.perf_counter()
+
+        self._stop.set()
+        sampler.join()
+        dispatcher.stop()
+        thread.join()
+
+        return self._report(total, started, sending_ended, ended)
+
+    def _report(self, total, started, sending_ended, ended):
+        with self._lock:
+            latencies = sorted(self._latencies)
+            lost = len(self._sent)
+
+        samples = self._queue_samples
+        sending = [size for at, size in samples if at <= sending_ended - started]
+        growth = 0.0
+        if len(sending) > 1:
+            growth = (sending[-1] - sending[0]) / (sending_ended - started)
+
+        def ms(value):
+            return None if value is None else value * 1000
+
+        return {
+            "sent": total,
+            "completed": len(latencies),
+            "lost": lost,
+            "send_rate": total / (sending_ended - started),
+            "throughput": len(latencies) / (ended - started),
+            "latency_ms": {
+                "p50": ms(percentile(latencies, 0.50)),
+                "p99": ms(percentile(latencies, 0.99)),
+                "p999": ms(percentile(latencies, 0.999)),
+                "max": ms(latencies[-1] if latencies else None),
+            },
+            "queue": {
+                "max": max((size for at, size in samples), default=0),
+                "end_of_sending": sending[-1] if sending else 0,
+                "growth_per_second": growth,
+            },
+            "api_calls": dict(self.stub.call_counts),
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--rate", type=float, default=200.0, help="updates per second")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds")
+    parser.add_argument(
+        "--mix",
+        type=parse_mix,
+        default="noop=1,echo=3,parse=2,help=1,unknown=1",
+        help="comma separated command=weight pairs",
+    )
+    parser.add_argument(
+        "--extension",
+        action="append",
+        default=[],
+        help="load this extension before starting, can be repeated",
+    )
+    parser.add_argument("--chats", type=int, default=100)
+    parser.add_argument(
+        "--api-latency", type=float, default=0.0, help="seconds per Bot API request"
+    )
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--output", help="write the report as JSON to this file")
+    args = parser.parse_args(argv)
+
+    bot, stub = make_bot()
+    stub.latency = args.api_latency
+    add_synthetic_commands(bot)
+    for name in args.extension:
+        bot.load_extension(name)
+
+    generator = LoadGenerator(
+        bot,
+        stub,
+        args.mix,
+        rate=args.rate,
+        duration=args.duration,
+        chats=args.chats,
+        seed=args.seed,
+    )
+    results = generator.run()
+
+    latency = results["latency_ms"]
+    print(
+        "{completed}/{sent} updates, {throughput:.1f}/s, queue max {max}".format(
+            max=results["queue"]["max"], **results
+        ),
+        file=sys.stderr,
+    )
+    print(
+        "latency p50 {p50:.2f} ms, p99 {p99:.2f} ms, p999 {p999:.2f} ms".format(
+            **latency
+        ),
+        file=sys.stderr,
+    )
+
+    report = {
+        "meta": {
+            "timestamp": time.time(),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "platform": platform.platform(),
+            "rate": args.rate,
+            "duration": args.duration,
+            "mix": args.mix,
+            "api_latency": args.api_latency,
+            "extensions": args.extension,
+        },
+        "results": results,
+    }
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == "__main__":
+    main()
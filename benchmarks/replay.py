@@ -0,0 +1,202 @@
+"""Replays a recording made with ``Bot.record_updates`` through the dispatcher.
+
+The updates are put on ``Bot.dispatcher.update_queue`` with their original
+spacing divided by ``--speed`` (``0`` sends them as fast as possible), with
+every Bot API request answered by a local stub. The report has the time
+spent handling each command, so parser and router changes can be compared
+against real traffic::
+
+    python benchmarks/replay.py updates.jsonl.gz --extension mybot.cogs.fun --speed 10
+"""
+
+import sys
+import json
+import time
+import argparse
+import platform
+import threading
+import statistics
+
+import telegram
+from telegram.ext import TypeHandler
+from telegram.ext.commands.recorder import read_recording
+from telegram.ext.commands.registry import _parse_command_name
+
+from loadgen import percentile
+from run import git_commit, make_bot
+
+
+class Replayer:
+    """Feeds recorded updates to a bot and times how they are handled."""
+
+    def __init__(self, bot, stub):
+        self.bot = bot
+        self.stub = stub
+        # update_id: [enqueued, handling started]
+        self._times = {}
+        # command name (or None): [handling seconds]
+        self.handling = {}
+        self.latencies = []
+        self._lock = threading.Lock()
+
+        bot.dispatcher.add_handler(TypeHandler(object, self._started), group=-2)
+        bot.dispatcher.add_handler(TypeHandler(object, self._completed), group=1)
+        bot.dispatcher.add_error_handler(self._completed)
+
+    def _started(self, update, context):
+        with self._lock:
+            times = self._times.get(getattr(update, "update_id", None))
+            if times is not None:
+                times[1] = time.perf_counter()
+
+    def _completed(self, update, context):
+        now = time.perf_counter()
+        with self._lock:
+            times = self._times.pop(getattr(update, "update_id", None), None)
+            if times is None:
+                return
+            self.latencies.append(now - times[0])
+            name = _parse_command_name(update)
+            self.handling.setdefault(name, []).append(now - times[1])
+
+    def run(self, recording, *, speed=1.0, drain_timeout=30.0):
+        dispatcher = self.bot.dispatcher
+        ready = threading.Event()
+        thread = threading.Thread(
+            target=dispatcher.start, kwargs={"ready": ready}, name="Dispatcher"
+        )
+        thread.start()
+        ready.wait()
+
+        try:
+            started = time.perf_counter()
+            first = None
+            sent = 0
+            for recorded_at, data in recording:
+                if first is None:
+                    first = recorded_at
+                if speed > 0:
+                    delay = (
+                        started + (recorded_at - first) / speed - time.perf_counter()
+                    )
+                    if delay > 0:
+                        time.sleep(delay)
+
+                update = telegram.Update.de_json(data, self.stub)
+                with self._lock:
+                    self._times[update.update_id] = [time.perf_counter(), None]
+                dispatcher.update_queue.put(update)
+                sent += 1
+
+            deadline = time.perf_counter() + drain_timeout
+            while time.perf_counter() < deadline:
+                with self._lock:
+                    if not self._times:
+                        break
+                time.sleep(0.01)
+            ended = time.perf_counter()
+        finally:
+            dispatcher.stop()
+            thread.join()
+
+        return self._report(sent, ended - started)
+
+    def _report(self, sent, elapsed):
+        def summary(values):
+            values = sorted(values)
+            return {
+                "count": len(values),
+                "mean_us": statistics.mean(values) * 1e6,
+                "p50_us": percentile(values, 0.50) * 1e6,
+                "p99_us": percentile(values, 0.99) * 1e6,
+                "max_us": values[-1] * 1e6,
+            }
+
+        with self._lock:
+            latencies = list(self.latencies)
+            handling = {
+                # updates that are not commands are grouped under ""
+                name or "": summary(values)
+                for name, values in self.handling.items()
+            }
+
+        return {
+            "sent": sent,
+            "completed": len(latencies),
+            "elapsed": elapsed,
+            "throughput": len(latencies) / elapsed if elapsed else None,
+            "latency": summary(latencies) if latencies else None,
+            "commands": dict(sorted(handling.items())),
+            "api_calls": dict(self.stub.call_counts),
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("recording", help="a file written by Bot.record_updates")
+    parser.add_argument(
+        "--speed",
+        type=float,
+        default=1.0,
+        help="how many times faster than recorded, 0 for as fast as possible",
+    )
+    parser.add_argument(
+        "--extension",
+        action="append",
+        default=[],
+        help="load this extension before replaying, can be repeated",
+    )
+    parser.add_argument(
+        "--api-latency", type=float, default=0.0, help="seconds per Bot API request"
+    )
+    parser.add_argument("--output", help="write the report as JSON to this file")
+    args = parser.parse_args(argv)
+
+    bot, stub = make_bot()
+    stub.latency = args.api_latency
+    for name in args.extension:
+        bot.load_extension(name)
+
+    replayer = Replayer(bot, stub)
+    results = replayer.run(read_recording(args.recording), speed=args.speed)
+
+    print(
+        "{completed}/{sent} updates in {elapsed:.2f}s".format(**results),
+        file=sys.stderr,
+    )
+    for name, timing in results["commands"].items():
+        print(
+            "{:<24} {:>7} {:>12.1f} us p50 {:>12.1f} us p99".format(
+                "/" + name if name else "(other)",
+                timing["count"],
+                timing["p50_us"],
+                timing["p99_us"],
+            ),
+            file=sys.stderr,
+        )
+
+    report = {
+        "meta": {
+            "timestamp": time.time(),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "platform": platform.platform(),
+            "recording": args.recording,
+            "speed": args.speed,
+            "api_latency": args.api_latency,
+            "extensions": args.extension,
+        },
+        "results": results,
+    }
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == "__main__":
+    main()
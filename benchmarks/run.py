@@ -0,0 +1,316 @@
+"""Microbenchmarks for the parsing and dispatch hot paths.
+
+Everything runs against a stubbed Bot API, so no network access or real
+token is needed. Results are printed, and can be written as JSON with
+``--output`` and compared to an earlier run with ``--compare``::
+
+    python benchmarks/run.py --output before.json
+    # change something
+    python benchmarks/run.py --compare before.json
+"""
+
+import os
+import sys
+import json
+import time
+import typing
+import argparse
+import platform
+import statistics
+import subprocess
+
+from telegram.ext import commands
+from telegram.ext.commands import testing
+from telegram.ext.commands.view import StringView
+
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    """Registers a setup function that returns the callable to time."""
+
+    def decorator(setup):
+        BENCHMARKS[name] = setup
+        return setup
+
+    return decorator
+
+
+def make_bot(command_count=0):
+    bot = commands.Bot("123456:BENCH", owner_ids=[1])
+    stub = testing.use_stub_api(bot)
+
+    def callback(ctx):
+        pass
+
+    for i in range(command_count):
+        bot.add_command(
+            commands.command(
+                name="command{}".format(i), help="Does thing number {}.".format(i)
+            )(callback)
+        )
+
+    return bot, stub
+
+
+# StringView tokenization
+
+
+def _tokenize(content):
+    def run():
+        view = StringView(content)
+        while not view.eof:
+            view.skip_ws()
+            view.get_quoted_word()
+
+    return run
+
+
+@benchmark("view.words")
+def bench_view_words():
+    return _tokenize("hello world these are some plain words")
+
+
+@benchmark("view.quoted")
+def bench_view_quoted():
+    return _tokenize(
+        '"hello world" "an \\"escaped\\" quote" «unicode quotes» 「and more」'
+    )
+
+
+@benchmark("view.long")
+def bench_view_long():
+    return _tokenize(" ".join("word{}".format(i) for i in range(200)))
+
+
+# Command._parse_arguments
+
+
+def _parse(func, content):
+    bot, stub = make_bot()
+    command = commands.command()(func)
+    bot.add_command(command)
+    update = testing.make_update("/{} {}".format(command.name, content), stub)
+    ctx = bot.get_context(command, update, testing.make_context(bot, update))
+
+    def run():
+        ctx.view = StringView(content)
+        command._parse_arguments(ctx)
+
+    return run
+
+
+@benchmark("parse.positional")
+def bench_parse_positional():
+    def positional(ctx, a: int, b: str, c: float):
+        pass
+
+    return _parse(positional, "1 two 3.0")
+
+
+@benchmark("parse.greedy")
+def bench_parse_greedy():
+    def greedy(ctx, numbers: commands.Greedy[int], rest: str):
+        pass
+
+    return _parse(greedy, "1 2 3 4 5 6 7 8 end")
+
+
+@benchmark("parse.union")
+def bench_parse_union():
+    def union(ctx, a: typing.Union[int, float, str], b: typing.Union[int, str]):
+        pass
+
+    return _parse(union, "word other")
+
+
+@benchmark("parse.optional")
+def bench_parse_optional():
+    def optional(ctx, a: typing.Optional[int], b: str):
+        pass
+
+    return _parse(optional, "notanumber word")
+
+
+@benchmark("parse.keyword_rest")
+def bench_parse_keyword_rest():
+    def keyword_rest(ctx, a: int, *, rest: str):
+        pass
+
+    return _parse(keyword_rest, "1 the rest of the message goes here")
+
+
+@benchmark("parse.var_positional")
+def bench_parse_var_positional():
+    def var_positional(ctx, *numbers: int):
+        pass
+
+    return _parse(var_positional, "1 2 3 4 5 6 7 8")
+
+
+# Bot.get_context and Command.__call__
+
+
+@benchmark("bot.get_context")
+def bench_get_context():
+    bot, stub = make_bot(1)
+    command = bot.commands["command0"]
+    update = testing.make_update("/command0 some arguments here", stub)
+    context = testing.make_context(bot, update)
+
+    def run():
+        bot.get_context(command, update, context)
+
+    return run
+
+
+def _call(func, text):
+    bot, stub = make_bot()
+    command = commands.command()(func)
+    bot.add_command(command)
+    update = testing.make_update(text, stub)
+    context = testing.make_context(bot, update)
+
+    def run():
+        command(update, context)
+
+    return run
+
+
+@benchmark("command.call")
+def bench_call():
+    def noop(ctx, a: int, b: str):
+        pass
+
+    return _call(noop, "/noop 1 two")
+
+
+@benchmark("command.call_send")
+def bench_call_send():
+    def echo(ctx, *, text):
+        ctx.send(text)
+
+    return _call(echo, "/echo hello there")
+
+
+# DefaultHelpCommand rendering
+
+
+def _help(command_count):
+    bot, stub = make_bot(command_count)
+    command = bot.commands["help"]
+    update = testing.make_update("/help", stub)
+    context = testing.make_context(bot, update)
+
+    def run():
+        command(update, context)
+
+    return run
+
+
+@benchmark("help.10")
+def bench_help_10():
+    return _help(10)
+
+
+@benchmark("help.100")
+def bench_help_100():
+    return _help(100)
+
+
+@benchmark("help.1000")
+def bench_help_1000():
+    return _help(1000)
+
+
+def measure(func, *, min_time, repeats):
+    # find a loop count that makes one repeat take about min_time
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            break
+        loops *= 2 if elapsed == 0 else max(2, int(min_time / elapsed) + 1)
+
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for _ in range(loops):
+            func()
+        timings.append((time.perf_counter() - start) / loops * 1e6)
+
+    return {
+        "loops": loops,
+        "repeats": repeats,
+        "min_us": min(timings),
+        "median_us": statistics.median(timings),
+        "mean_us": statistics.mean(timings),
+        "stdev_us": statistics.stdev(timings) if repeats > 1 else 0.0,
+    }
+
+
+def git_commit():
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True,
+            text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        )
+    except OSError:
+        return None
+    return out.stdout.strip() or None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--compare", help="a JSON file from an earlier run")
+    parser.add_argument("--filter", default="", help="only run matching benchmarks")
+    parser.add_argument("--min-time", type=float, default=0.1)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+
+    results = {}
+    for name, setup in BENCHMARKS.items():
+        if args.filter not in name:
+            continue
+
+        result = results[name] = measure(
+            setup(), min_time=args.min_time, repeats=args.repeats
+        )
+        line = "{:<24} {:>12.2f} us".format(name, result["median_us"])
+        if name in baseline:
+            before = baseline[name]["median_us"]
+            line += "  {:+7.1f}%".format((result["median_us"] - before) / before * 100)
+        print(line, file=sys.stderr)
+
+    report = {
+        "meta": {
+            "timestamp": time.time(),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "platform": platform.platform(),
+        },
+        "results": results,
+    }
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == "__main__":
+    main()
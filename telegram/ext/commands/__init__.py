@@ -1,9 +1,23 @@
 __version__ = "0.1.0a"
 
 from .bot import Bot
-from .core import Command, command, check, is_owner
+from .core import Command, command, check, is_owner, cooldown, cached
 from .context import Context
 from .cog import Cog
 from .converter import *
 from .errors import *
 from .help import HelpCommand, DefaultHelpCommand
+from .watcher import ExtensionWatcher
+from .metrics import MetricsRegistry, MetricsServer
+from .recorder import UpdateRecorder
+from .webhook import WebhookServer
+from .polling import PipelinedPoller
+from .admission import AdmissionController, PriorityUpdateQueue
+from .watchdog import CommandWatchdog
+from .executor import AdaptiveExecutor
+from .state import StateBackend, MemoryBackend, SQLiteBackend
+from .cooldowns import BucketType, Cooldown
+from .cache import ResultCache
+from .sharding import ShardSupervisor, SharedRateLimiter
+from .tracing import Tracer, Span, SpanExporter, RingBufferExporter, JSONLinesExporter
+from .profiling import SamplingProfiler, AllocationProfiler, Profiling
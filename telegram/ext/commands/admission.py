@@ -0,0 +1,137 @@
+import time
+import heapq
+import queue
+import itertools
+
+from telegram.error import TelegramError
+
+
+class PriorityUpdateQueue(queue.Queue):
+    """An update queue that hands out the highest priority update first.
+
+    ``priority_of`` returns the priority of an update, updates with the same
+    priority are handed out in the order they came in. Without it this is a
+    plain FIFO queue. The bot uses it as the dispatcher's update queue with
+    the priority of each update's command, so commands with a higher
+    ``priority`` skip ahead of a backlog.
+
+    ``on_put``, when set, is called with every item as it is put on the
+    queue, before it can be reordered.
+    """
+
+    def __init__(self, priority_of=None):
+        self.priority_of = priority_of
+        self.on_put = None
+        self._sequence = itertools.count()
+        # how long the update taken last waited in the queue
+        self.waited = 0.0
+        super().__init__()
+
+    def put(self, item, block=True, timeout=None):
+        on_put = self.on_put
+        if on_put is not None:
+            on_put(item)
+        super().put(item, block, timeout)
+
+    def _init(self, maxsize):
+        self.queue = []
+
+    def _qsize(self):
+        return len(self.queue)
+
+    def _put(self, item):
+        priority = self.priority_of(item) if self.priority_of is not None else 0
+        entry = (-priority, next(self._sequence), time.monotonic(), item)
+        heapq.heappush(self.queue, entry)
+
+    def _get(self):
+        _, _, queued, item = heapq.heappop(self.queue)
+        self.waited = time.monotonic() - queued
+        return item
+
+    def clear(self):
+        """Drops everything queued and returns how many items that was."""
+        with self.mutex:
+            dropped = len(self.queue)
+            self.queue.clear()
+            self.unfinished_tasks -= dropped
+            if not self.unfinished_tasks:
+                self.all_tasks_done.notify_all()
+            self.not_full.notify_all()
+            return dropped
+
+
+class AdmissionController:
+    """Turns low priority commands away while the bot is overloaded.
+
+    The bot counts as overloaded while its update queue holds more than
+    ``max_queue_depth`` updates, or while updates wait longer than
+    ``max_queue_latency`` seconds before they are processed. Invocations of
+    commands with a ``priority`` below ``min_priority`` are then rejected
+    before parsing or checks: the user gets ``rejection_message`` as a
+    reply and the command is not run. Other commands always run, and their
+    updates skip ahead of the backlog anyway, so commands needed to deal
+    with the overload should get a ``priority`` of at least ``min_priority``::
+
+        bot.admission = commands.AdmissionController(max_queue_depth=500)
+
+        @bot.command(priority=10)
+        @commands.is_owner()
+        def maintenance(ctx):
+            ...
+
+    Rejections are counted in ``telegram_commands_shed_total``.
+
+    Parameters
+    -----------
+    max_queue_depth: Optional[:class:`int`]
+        The most queued updates before shedding starts.
+    max_queue_latency: Optional[:class:`float`]
+        The longest time in seconds an update may wait in the queue
+        before shedding starts.
+    min_priority: :class:`int`
+        Commands with a lower priority are shed. Commands default to 0.
+    rejection_message: Optional[:class:`str`]
+        The reply to a rejected invocation. ``None`` drops it silently.
+    """
+
+    def __init__(
+        self,
+        *,
+        max_queue_depth=1000,
+        max_queue_latency=None,
+        min_priority=1,
+        rejection_message="The bot is very busy right now, please try again later.",
+    ):
+        self.max_queue_depth = max_queue_depth
+        self.max_queue_latency = max_queue_latency
+        self.min_priority = min_priority
+        self.rejection_message = rejection_message
+
+    def overloaded(self, bot):
+        update_queue = bot.dispatcher.update_queue
+        depth = update_queue.qsize()
+        waited = getattr(update_queue, "waited", 0.0)
+        if bot.executor is not None:
+            # commands queued for the executor wait a second time
+            depth += bot.executor.pending
+            waited += bot.executor.waited
+
+        if self.max_queue_depth is not None and depth > self.max_queue_depth:
+            return True
+        return self.max_queue_latency is not None and waited > self.max_queue_latency
+
+    def admit(self, ctx):
+        """Returns whether ``ctx.command`` may run. Replies if it may not."""
+        command = ctx.command
+        if command.priority >= self.min_priority or not self.overloaded(ctx.bot):
+            return True
+
+        ctx.bot._command_metrics.shed.inc(command.qualified_name)
+        if self.rejection_message is not None and ctx.message is not None:
+            try:
+                ctx.send(self.rejection_message)
+            except TelegramError:
+                # likely rate limited, which is part of being overloaded
+                pass
+        return False
@@ -1,9 +1,18 @@
+from telegram.error import TelegramError
 from telegram.ext import Updater, CommandHandler
 
+import os
 import sys
+import json
+import functools
+import contextlib
+import threading
 import importlib.util
+import time
 import inspect
+import signal
 import traceback
+import concurrent.futures
 
 from . import errors
 from .core import command
@@ -12,6 +21,22 @@ from .context import Context
 from .view import StringView
 from .help import HelpCommand, DefaultHelpCommand
 from .errors import CommandError
+from .registry import (
+    RegistrySnapshot,
+    RegistryHandler,
+    InflightTracker,
+    UpdateDeduplicator,
+    _parse_command_name,
+)
+from .watcher import ExtensionWatcher
+from .recorder import UpdateRecorder
+from .webhook import WebhookServer
+from .polling import PipelinedPoller
+from .admission import PriorityUpdateQueue
+from .watchdog import CommandWatchdog
+from .coalesce import SingleFlight
+from .state import MemoryBackend
+from .metrics import MetricsRegistry, MetricsServer, CommandMetrics
 
 
 class _DefaultRepr:
@@ -22,18 +47,145 @@ class _DefaultRepr:
 _default = _DefaultRepr()
 
 
+class _ExtensionIndex:
+    """The cogs, commands and modules owned by a loaded extension."""
+
+    __slots__ = ("cogs", "commands", "modules")
+
+    def __init__(self, modules=()):
+        self.cogs = set()
+        self.commands = set()
+        # filled in by _submodules as the extension imports them
+        self.modules = modules if isinstance(modules, set) else set(modules)
+
+
+class _SubmoduleRecorder:
+    """A meta path finder that records the submodules of extensions.
+
+    It never finds anything itself, it only adds the name of every module
+    imported under a tracked extension to that extension's set, whether
+    that happens during ``setup`` or later, e.g. inside a command to defer
+    a heavy import. Unloading then knows exactly which modules to drop
+    without searching :data:`sys.modules`.
+    """
+
+    def __init__(self):
+        # extension_name: set of module names
+        self._tracked = {}
+
+    def find_spec(self, fullname, path=None, target=None):
+        tracked = self._tracked
+        name = fullname
+        while name:
+            modules = tracked.get(name)
+            if modules is not None:
+                modules.add(fullname)
+            name = name.rpartition(".")[0]
+        return None
+
+    def track(self, name, modules):
+        if self not in sys.meta_path:
+            # first, so imports that other finders resolve are seen too
+            sys.meta_path.insert(0, self)
+        self._tracked[name] = modules
+
+    def untrack(self, name, modules):
+        # only if a newer load did not take the name over
+        if self._tracked.get(name) is modules:
+            del self._tracked[name]
+
+
+_submodules = _SubmoduleRecorder()
+
+
+class _LazyExtension:
+    """An extension that has been registered but not imported yet.
+
+    Holds one placeholder handler for every command name the extension
+    provides. The real module is loaded the first time any of them is used.
+    """
+
+    def __init__(self, bot, name, commands, cogs):
+        self.name = name
+        # handlers are keyed by the lowercased name, like CommandHandler matches
+        self.commands = [command_name.lower() for command_name in commands]
+        self.cogs = list(cogs)
+        self.handlers = {
+            command_name: CommandHandler(
+                command_name, functools.partial(bot._invoke_lazy, name)
+            )
+            for command_name in self.commands
+        }
+
+
 class Bot:
     def __init__(
-        self, token, owner_ids=None, *, help_command=_default, description=None
+        self,
+        token,
+        owner_ids=None,
+        *,
+        help_command=_default,
+        description=None,
+        extension_manifest=None,
+        base_url=None,
+        state=None,
+        dedup_window=1024,
+        dedup_shared=False,
+        dedup_ttl=600.0,
     ):
-        # name: command
-        self.commands = {}
-        # command_name: handler
-        self._handlers = {}
+        # commands, handlers and cogs live in an immutable snapshot
+        # that is swapped as a whole, see _edit_registry
+        self._registry = RegistrySnapshot()
+        self._registry_draft = None
+        self._registry_writer = None
+        # guards the draft as well as the extension bookkeeping below
+        self._registry_lock = threading.RLock()
         # extension_name: extension
         self._extensions = {}
-        # cog_name: cog
-        self._cogs = {}
+        # extension_name: _ExtensionIndex
+        self._extension_index = {}
+        # extension_name: _LazyExtension
+        self._lazy_extensions = {}
+        # command or cog name: extension_name
+        self._lazy_names = {}
+        self._inflight = InflightTracker()
+        self.extension_watcher = None
+        self.metrics = MetricsRegistry()
+        self._command_metrics = CommandMetrics(self.metrics)
+        self.metrics_server = None
+        # set to a Tracer to enable tracing spans
+        self.tracer = None
+        # set to an AllocationProfiler to measure command allocations
+        self.allocation_profiler = None
+        # set to an AdmissionController to shed load when overloaded
+        self.admission = None
+        # runs the callbacks of commands with a timeout
+        self.watchdog = CommandWatchdog()
+        # set to an AdaptiveExecutor to run several commands at once
+        self.executor = None
+        # the running invocations of commands with coalesce=True
+        self._single_flight = SingleFlight()
+        self.recorder = None
+        self.webhook_server = None
+        self.poller = None
+        # cooldowns and other state; pass a backend shared between
+        # processes, like SQLiteBackend, when running several of them
+        self.state = state if state is not None else MemoryBackend()
+        if dedup_shared and not self.state.shared:
+            raise ValueError("dedup_shared needs a state backend that is shared")
+        # drops commands from updates that were already handled, with
+        # dedup_shared also by other processes; dedup_window=None turns
+        # it off
+        self.deduplicator = (
+            UpdateDeduplicator(
+                dedup_window,
+                state=self.state if dedup_shared else None,
+                ttl=dedup_ttl,
+            )
+            if dedup_window
+            else None
+        )
+        self.extension_manifest = extension_manifest
         self._checks = []
         self._check_once = []
         self._before_invoke = None
@@ -41,9 +193,15 @@ class Bot:
         self.owner_ids = owner_ids or []
         self._help_command = None
 
-        self.updater = Updater(token=token, use_context=True)
+        # base_url points the bot at another Bot API server,
+        # like a local one or testing.FakeBotAPI
+        self.updater = Updater(token=token, base_url=base_url, use_context=True)
         self.dispatcher = self.updater.dispatcher
         self.job_queue = self.updater.job_queue
+        # hands out the updates of high priority commands first
+        update_queue = PriorityUpdateQueue(self._update_priority)
+        self.updater.update_queue = self.dispatcher.update_queue = update_queue
+        self.dispatcher.add_handler(RegistryHandler(self))
 
         self.description = inspect.cleandoc(description) if description else ""
 
@@ -59,6 +217,56 @@ class Bot:
 
         self.dispatcher.add_error_handler(self.error_handler)
 
+    def _current_registry(self):
+        # the thread that is editing the registry sees its own draft,
+        # everyone else sees the last published snapshot
+        if self._registry_writer == threading.get_ident():
+            return self._registry_draft
+        return self._registry
+
+    @contextlib.contextmanager
+    def _edit_registry(self):
+        """Context manager that yields a mutable draft of the registry.
+
+        Nested edits share the outermost draft. The draft is published as a
+        new snapshot when the outermost edit exits, so other threads see
+        either all of the changes made inside it or none of them. If it
+        exits with an exception the draft is thrown away, so code that
+        cleans up after a failure and re-raises has to do it outside.
+        """
+        with self._registry_lock:
+            if self._registry_draft is not None:
+                yield self._registry_draft
+                return
+
+            self._registry_draft = self._registry.draft()
+            self._registry_writer = threading.get_ident()
+            try:
+                yield self._registry_draft
+                self._registry = self._registry_draft.freeze()
+            finally:
+                self._registry_draft = None
+                self._registry_writer = None
+
+    @property
+    def commands(self):
+        """Mapping[:class:`str`, :class:`Command`]: A read-only mapping of command names to commands.
+
+        This used to be a plain dict. It is a read-only view of the current
+        registry snapshot now, so use :meth:`add_command` and
+        :meth:`remove_command` to change it, and copy it with ``dict()``
+        to keep it as it is.
+        """
+        return self._current_registry().commands
+
+    @property
+    def _handlers(self):
+        return self._current_registry().handlers
+
+    @property
+    def _cogs(self):
+        return self._current_registry().cogs
+
     @property
     def help_command(self):
         return self._help_command
@@ -89,38 +297,68 @@ class Bot:
         ctx = cls(command, update, context, view=view)
         return ctx
 
+    def _update_priority(self, update):
+        name = _parse_command_name(update)
+        if name is None:
+            return 0
+
+        handler = self._registry.handlers.get(name)
+        # the placeholders of lazy extensions have no priority yet
+        return getattr(handler and handler.callback, "priority", 0)
+
     def get_commands(self):
         return [c for c in self.commands.values() if not c.parent and not c.cog]
 
     def add_command(self, command):
-        if command.name in self.commands.keys():
-            raise ValueError("There is already a command with that name")
-
-        if not command.bot:
-            command.bot = self
-
-        self.commands[command.name] = command
-
-        self._handlers[command.name] = CommandHandler(command.name, command)
-        self.dispatcher.add_handler(self._handlers[command.name])
-
-        if command.aliases:
-            for alias in command.aliases:
-                self._handlers[alias] = CommandHandler(alias, command)
-                self.dispatcher.add_handler(self._handlers[alias])
+        with self._edit_registry() as registry:
+            if command.name in registry.commands:
+                raise ValueError("There is already a command with that name")
+
+            names = [name.lower() for name in [command.name, *command.aliases]]
+            for name in names:
+                # the placeholder of a pending lazy extension
+                extension = self._lazy_names.get(name)
+                if extension in self._lazy_extensions and name in registry.handlers:
+                    raise ValueError(
+                        "The lazy extension {!r} already provides a command "
+                        "named {!r}".format(extension, name)
+                    )
+                if name in registry.handlers:
+                    raise ValueError(
+                        "There is already a command with the name or alias "
+                        "{!r}".format(name)
+                    )
+
+            if not command.bot:
+                command.bot = self
+
+            registry.commands[command.name] = command
+
+            index = self._get_extension_index(command.module)
+            if index is not None:
+                index.commands.add(command.name)
+
+            # CommandHandler matches case insensitively, so
+            # the handlers are keyed by the lowercased name
+            for name in names:
+                registry.handlers[name] = CommandHandler(name, command)
 
     def remove_command(self, command_name):
-        if command_name not in self.commands.keys():
-            raise ValueError("There is no command with that name")
+        with self._edit_registry() as registry:
+            if command_name not in registry.commands:
+                raise ValueError("There is no command with that name")
+
+            command = registry.commands.pop(command_name)
 
-        command = self.commands.pop(command_name)
-        self._handlers.pop(command_name)
-        self.dispatcher.remove_handler(command_name)
+            index = self._get_extension_index(command.module)
+            if index is not None:
+                index.commands.discard(command_name)
 
-        if command.aliases:
-            for alias in command.aliases:
-                self._handlers.pop(alias)
-                self.dispatcher.remove_handler(alias)
+            for name in [command.name, *command.aliases]:
+                handler = registry.handlers.get(name.lower())
+                # leave the names another command owns alone
+                if handler is not None and handler.callback is command:
+                    del registry.handlers[name.lower()]
 
     def command(self, *args, **kwargs):
         def decorater(func):
@@ -187,33 +425,65 @@ class Bot:
         if not isinstance(cog, Cog):
             raise TypeError("cogs must subclass Cog")
 
-        cog = cog._inject(self)
-        self._cogs[cog.__cog_name__] = cog
+        with self._edit_registry() as registry:
+            cog = cog._inject(self)
+            registry.cogs[cog.__cog_name__] = cog
+
+            index = self._get_extension_index(cog.__module__)
+            if index is not None:
+                index.cogs.add(cog.__cog_name__)
 
     def get_cog(self, name):
         return self._cogs.get(name)
 
     def remove_cog(self, name):
-        cog = self._cogs.pop(name, None)
-        if cog is None:
-            return
+        with self._edit_registry() as registry:
+            cog = registry.cogs.pop(name, None)
+            if cog is None:
+                return
+
+            index = self._get_extension_index(cog.__module__)
+            if index is not None:
+                index.cogs.discard(name)
 
-        cog._eject(self)
+            cog._eject(self)
 
     def _is_submodule(self, parent, child):
         return parent == child or child.startswith(parent + ".")
 
+    def _get_extension_index(self, module):
+        # walk up the dotted path so a command defined in a
+        # submodule is attributed to the extension that owns it
+        while module:
+            index = self._extension_index.get(module)
+            if index is not None:
+                return index
+            module = module.rpartition(".")[0]
+        return None
+
+    def _index_extension(self, key, modules):
+        index = self._extension_index[key] = _ExtensionIndex(modules)
+        _submodules.track(key, index.modules)
+        return index
+
+    def _discard_modules(self, key, modules):
+        _submodules.untrack(key, modules)
+        for module in list(modules):
+            sys.modules.pop(module, None)
+
     def _remove_module_references(self, name):
-        # find all references to the module
+        index = self._extension_index.get(name)
+        if index is None:
+            return
+
         # remove the cogs registered from the module
-        for cogname, cog in self._cogs.copy().items():
-            if self._is_submodule(name, cog.__module__):
-                self.remove_cog(cogname)
+        for cogname in list(index.cogs):
+            self.remove_cog(cogname)
 
         # remove commands
-        for cmd in self.commands.copy().values():
-            if cmd.module is not None and self._is_submodule(name, cmd.module):
-                self.remove_command(cmd.name)
+        for command_name in list(index.commands):
+            if command_name in self.commands:
+                self.remove_command(command_name)
 
     def _call_module_finalizers(self, lib, key):
         try:
@@ -228,83 +498,509 @@ class Bot:
         finally:
             self._extensions.pop(key, None)
             sys.modules.pop(key, None)
-            name = lib.__name__
-            for module in list(sys.modules.keys()):
-                if self._is_submodule(name, module):
-                    del sys.modules[module]
+            index = self._extension_index.pop(key, None)
+            if index is not None:
+                self._discard_modules(key, index.modules)
 
     def _load_from_module_spec(self, spec, key):
         # precondition: key not in self._extensions
+        modules = {key}
+        _submodules.track(key, modules)
         lib = importlib.util.module_from_spec(spec)
         sys.modules[key] = lib
         try:
             spec.loader.exec_module(lib)
         except Exception as e:
-            del sys.modules[key]
+            self._discard_modules(key, modules)
             raise errors.ExtensionFailed(key, e) from e
 
+        self._setup_extension(lib, key, modules)
+
+    def _setup_extension(self, lib, key, modules):
         try:
             setup = getattr(lib, "setup")
         except AttributeError:
-            del sys.modules[key]
+            self._discard_modules(key, modules)
             raise errors.NoEntryPointError(key)
 
+        # everything setup registers becomes visible at once
+        with self._edit_registry():
+            self._index_extension(key, modules)
+            try:
+                setup(self)
+            except Exception as e:
+                del sys.modules[key]
+                self._remove_module_references(key)
+                self._call_module_finalizers(lib, key)
+                raise errors.ExtensionFailed(key, e) from e
+            else:
+                self._extensions[key] = lib
+
+    def _read_manifest(self):
+        path = self.extension_manifest
+        if path is None or not os.path.exists(path):
+            return {}
+
         try:
-            setup(self)
-        except Exception as e:
-            del sys.modules[key]
-            self._remove_module_references(lib.__name__)
-            self._call_module_finalizers(lib, key)
-            raise errors.ExtensionFailed(key, e) from e
-        else:
-            self._extensions[key] = lib
+            with open(path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            # a corrupt manifest only costs us an eager load
+            return {}
+
+    def _write_manifest_entry(self, name, commands, cogs):
+        path = self.extension_manifest
+        if path is None:
+            return
+
+        manifest = self._read_manifest()
+        entry = {"commands": sorted(commands), "cogs": sorted(cogs)}
+        if manifest.get(name) == entry:
+            return
 
-    def load_extension(self, name):
-        if name in self._extensions:
+        manifest[name] = entry
+        tmp = "{}.tmp".format(path)
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+        os.replace(tmp, path)
+
+    def _load_and_record(self, name):
+        # Loads the extension eagerly and remembers which command
+        # and cog names it provided so the next start can be lazy.
+        handlers_before = set(self._handlers)
+        cogs_before = set(self._cogs)
+
+        self.load_extension(name)
+
+        self._write_manifest_entry(
+            name,
+            set(self._handlers) - handlers_before,
+            set(self._cogs) - cogs_before,
+        )
+
+    def _add_lazy_extension(self, name, commands, cogs):
+        lazy = _LazyExtension(self, name, commands, cogs)
+
+        with self._edit_registry() as registry:
+            for command_name in lazy.commands:
+                if command_name in registry.handlers:
+                    raise ValueError(
+                        "There is already a command with the name {!r}".format(
+                            command_name
+                        )
+                    )
+
+            self._lazy_extensions[name] = lazy
+            for command_name, handler in lazy.handlers.items():
+                registry.handlers[command_name] = handler
+                self._lazy_names[command_name] = name
+
+        for cog_name in lazy.cogs:
+            self._lazy_names.setdefault(cog_name, name)
+
+    def _remove_lazy_extension(self, name):
+        lazy = self._lazy_extensions.pop(name)
+
+        with self._edit_registry() as registry:
+            for command_name in lazy.handlers:
+                registry.handlers.pop(command_name, None)
+
+        for key in lazy.commands + lazy.cogs:
+            if self._lazy_names.get(key) == name:
+                del self._lazy_names[key]
+
+        return lazy
+
+    def _resolve_lazy_extension(self, name):
+        # swapping the placeholders for the real commands is published
+        # as a single registry update
+        with self._edit_registry() as registry:
+            # another thread may have beaten us to it
+            if name not in self._lazy_extensions:
+                return
+
+            lazy = self._remove_lazy_extension(name)
+            try:
+                self._load_and_record(name)
+            except Exception:
+                # keep it pending, so the next use tries again
+                self._lazy_extensions[name] = lazy
+                for command_name, handler in lazy.handlers.items():
+                    registry.handlers[command_name] = handler
+                    self._lazy_names[command_name] = name
+                for cog_name in lazy.cogs:
+                    self._lazy_names.setdefault(cog_name, name)
+                raise
+
+    def _invoke_lazy(self, extension, update, context):
+        self._resolve_lazy_extension(extension)
+
+        handler = self._handlers.get(_parse_command_name(update))
+        if handler is None:
+            # the manifest was stale and the extension
+            # no longer provides this command
+            return
+
+        return handler.callback(update, context)
+
+    def resolve_lazy_name(self, name):
+        """Loads the lazy extension that provides the command or cog ``name``.
+
+        This is a no-op if no pending lazy extension provides it.
+        """
+        extension = self._lazy_names.get(name) or self._lazy_names.get(name.lower())
+        if extension is not None:
+            self._resolve_lazy_extension(extension)
+
+    def load_lazy_extensions(self):
+        """Loads every extension that is still waiting to be used."""
+        for name in list(self._lazy_extensions):
+            self._resolve_lazy_extension(name)
+
+    def load_extension(self, name, *, lazy=False, commands=None, cogs=None):
+        """Loads an extension.
+
+        If ``lazy`` is ``True`` the extension is not imported yet. Instead,
+        placeholders are registered for the command names it provides and
+        the module is imported the first time one of them is invoked or its
+        help is requested.
+
+        The names are taken from ``commands`` and ``cogs`` if given, otherwise
+        from the on-disk :attr:`extension_manifest`. If neither knows about
+        the extension it is loaded eagerly and its names are written to the
+        manifest for the next start.
+        """
+        if name in self._extensions or name in self._lazy_extensions:
             raise errors.ExtensionAlreadyLoaded(name)
 
+        if lazy:
+            if commands is None:
+                entry = self._read_manifest().get(name)
+                if entry is None:
+                    self._load_and_record(name)
+                    return
+
+                commands = entry.get("commands", [])
+                cogs = entry.get("cogs", []) if cogs is None else cogs
+
+            self._add_lazy_extension(name, commands, cogs or [])
+            return
+
         spec = importlib.util.find_spec(name)
         if spec is None:
             raise errors.ExtensionNotFound(name)
 
         self._load_from_module_spec(spec, name)
 
+    def _import_timed(self, name):
+        start = time.perf_counter()
+        try:
+            lib = importlib.import_module(name)
+        except ModuleNotFoundError as e:
+            if e.name == name:
+                raise errors.ExtensionNotFound(name) from e
+            raise errors.ExtensionFailed(name, e) from e
+        except Exception as e:
+            raise errors.ExtensionFailed(name, e) from e
+        return lib, time.perf_counter() - start
+
+    def _resolve_setup_order(self, names, libs):
+        # Kahn's algorithm, ties are broken by the order the
+        # extensions were passed in so the result is deterministic.
+        pending = {}
+        for name in names:
+            requires = getattr(libs[name], "requires", ())
+            if isinstance(requires, str):
+                requires = (requires,)
+
+            deps = set()
+            for dep in requires:
+                if dep in libs:
+                    deps.add(dep)
+                elif dep not in self._extensions and dep not in self._lazy_extensions:
+                    raise errors.ExtensionDependencyError(
+                        name, "requires {!r} which is not loaded".format(dep)
+                    )
+            pending[name] = deps
+
+        order = []
+        while pending:
+            ready = [n for n in names if n in pending and not pending[n]]
+            if not ready:
+                raise errors.ExtensionDependencyError(
+                    sorted(pending)[0],
+                    "has a circular dependency between {}".format(
+                        ", ".join(sorted(pending))
+                    ),
+                )
+
+            for name in ready:
+                del pending[name]
+                for deps in pending.values():
+                    deps.discard(name)
+            order.extend(ready)
+
+        return order
+
+    def load_extensions(self, names, *, max_workers=None):
+        """Loads several extensions at once.
+
+        The modules are imported concurrently in a thread pool and their
+        ``setup`` functions are then called one by one in the main thread.
+        An extension can list the extensions it depends on in a module level
+        ``requires`` sequence, in which case its ``setup`` runs after theirs.
+        Otherwise ``setup`` is called in the order of ``names``.
+
+        Loading is atomic: if any extension fails to import or set up, the
+        ones that were already set up in this call are unloaded again before
+        the error is raised.
+
+        Returns a dict mapping each extension name to a dict with the
+        ``"import"`` and ``"setup"`` time in seconds. The same report is
+        available as the ``timings`` attribute of a raised
+        :exc:`ExtensionError`.
+        """
+        names = list(dict.fromkeys(names))
+        for name in names:
+            if name in self._extensions or name in self._lazy_extensions:
+                raise errors.ExtensionAlreadyLoaded(name)
+
+        timings = {name: {"import": None, "setup": None} for name in names}
+        libs = {}
+        # name: the modules imported for it
+        modules = {}
+        for name in names:
+            modules[name] = {name}
+            _submodules.track(name, modules[name])
+        # imported before this call, import_module returns them as they are
+        preloaded = {name: sys.modules[name] for name in names if name in sys.modules}
+
+        def rollback():
+            for name in names:
+                self._discard_modules(name, modules[name])
+            # only drop what this call imported
+            sys.modules.update(preloaded)
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+            futures = {
+                name: executor.submit(self._import_timed, name) for name in names
+            }
+
+        # report the first failure in the order the caller gave
+        for name in names:
+            try:
+                libs[name], timings[name]["import"] = futures[name].result()
+            except errors.ExtensionError as e:
+                rollback()
+                e.timings = timings
+                raise
+
+        loaded = []
+        with self._edit_registry():
+            try:
+                for name in self._resolve_setup_order(names, libs):
+                    start = time.perf_counter()
+                    self._setup_extension(libs[name], name, modules[name])
+                    timings[name]["setup"] = time.perf_counter() - start
+                    loaded.append(name)
+            except errors.ExtensionError as e:
+                for name in reversed(loaded):
+                    self.unload_extension(name)
+                rollback()
+                e.timings = timings
+                raise
+
+        return timings
+
     def unload_extension(self, name):
-        lib = self._extensions.get(name)
-        if lib is None:
-            raise errors.ExtensionNotLoaded(name)
+        with self._edit_registry():
+            if name in self._lazy_extensions:
+                self._remove_lazy_extension(name)
+                return
+
+            lib = self._extensions.get(name)
+            if lib is None:
+                raise errors.ExtensionNotLoaded(name)
+
+            self._remove_module_references(name)
+            self._call_module_finalizers(lib, name)
+
+    def _reload_drained(self, name, lib, modules, timeout):
+        index = self._extension_index[name]
+
+        with self._edit_registry() as registry:
+            saved = registry.freeze()
+            old_cogs = [registry.cogs[c] for c in index.cogs if c in registry.cogs]
+            old_commands = [
+                registry.commands[c] for c in index.commands if c in registry.commands
+            ]
+
+            # detach the old version without tearing it down yet
+            for command in old_commands:
+                del registry.commands[command.name]
+                for alias in [command.name] + command.aliases:
+                    registry.handlers.pop(alias.lower(), None)
+            for cog in old_cogs:
+                del registry.cogs[cog.__cog_name__]
+
+            del self._extensions[name]
+            del self._extension_index[name]
+            for module in modules:
+                sys.modules.pop(module, None)
+
+            try:
+                self.load_extension(name)
+            except Exception:
+                # the old version was never torn down, so
+                # putting the previous state back is enough
+                registry.commands.clear()
+                registry.commands.update(saved.commands)
+                registry.handlers.clear()
+                registry.handlers.update(saved.handlers)
+                registry.cogs.clear()
+                registry.cogs.update(saved.cogs)
+                sys.modules.update(modules)
+                self._extensions[name] = lib
+                self._extension_index[name] = index
+                _submodules.track(name, index.modules)
+                raise
+
+        # the new version is published, so only invocations
+        # that were already running can still reach the old one
+        drained = self._inflight.wait(old_commands, timeout)
+
+        for cog in old_cogs:
+            try:
+                cog._eject(self)
+            except Exception:
+                pass
+
+        teardown = getattr(lib, "teardown", None)
+        if teardown is not None:
+            try:
+                teardown(self)
+            except Exception:
+                pass
+
+        return drained
+
+    def reload_extension(self, name, *, drain_timeout=None):
+        """Reloads an extension.
 
-        self._remove_module_references(lib.__name__)
-        self._call_module_finalizers(lib, name)
+        By default the old version is torn down before the new one is set up.
+
+        If ``drain_timeout`` is given, the new version is set up first and
+        swapped in atomically. Commands of the old version that are still
+        running get up to ``drain_timeout`` seconds to finish before its
+        cogs are unloaded and its ``teardown`` function is called.
+
+        Returns whether every command of the old version had finished when
+        it was torn down, which is always ``True`` without ``drain_timeout``.
+        """
+        if name in self._lazy_extensions:
+            # nothing has been imported yet, so the next
+            # use will pick up the current source anyway
+            return True
 
-    def reload_extension(self, name):
         lib = self._extensions.get(name)
         if lib is None:
             raise errors.ExtensionNotLoaded(name)
 
         # get the previous module states from sys modules
+        index = self._extension_index[name]
         modules = {
-            name: module
-            for name, module in sys.modules.items()
-            if self._is_submodule(lib.__name__, name)
+            module: sys.modules[module]
+            for module in list(index.modules)
+            if module in sys.modules
         }
 
-        try:
-            # Unload and then load the module...
-            self._remove_module_references(lib.__name__)
-            self._call_module_finalizers(lib, name)
-            self.load_extension(name)
+        if drain_timeout is not None:
+            return self._reload_drained(name, lib, modules, drain_timeout)
 
-        except Exception:
-            # if the load failed, the remnants should have been
-            # cleaned from the load_extension function call
-            # so let's load it from our old compiled library.
-            lib.setup(self)
-            self.__extensions[name] = lib
+        # dispatch keeps seeing the old commands until the
+        # reload is over, whether it succeeds or not
+        failure = None
+        with self._edit_registry():
+            try:
+                # Unload and then load the module...
+                self._remove_module_references(name)
+                self._call_module_finalizers(lib, name)
+                self.load_extension(name)
+
+            except Exception as e:
+                # if the load failed, the remnants should have been
+                # cleaned from the load_extension function call
+                # so let's load it from our old compiled library.
+                # revert sys.modules back to normal first so the
+                # old setup sees the modules it expects
+                sys.modules.update(modules)
+                self._index_extension(name, set(modules))
+                lib.setup(self)
+                self._extensions[name] = lib
+                failure = e
+
+        if failure is not None:
+            # raised after the edit, so the old version is published
+            raise failure
+
+        return True
+
+    def watch_extensions(
+        self, *, interval=1.0, debounce=0.5, drain_timeout=30.0, use_hash=False
+    ):
+        """Starts reloading extensions automatically when their source changes.
+
+        This is meant for development and is off by default. See
+        :class:`ExtensionWatcher` for the meaning of the parameters.
+        """
+        if self.extension_watcher is not None:
+            self.extension_watcher.stop()
+
+        self.extension_watcher = ExtensionWatcher(
+            self,
+            interval=interval,
+            debounce=debounce,
+            drain_timeout=drain_timeout,
+            use_hash=use_hash,
+        )
+        self.extension_watcher.start()
+        return self.extension_watcher
 
-            # revert sys.modules back to normal and raise back to caller
-            sys.modules.update(modules)
-            raise
+    def start_metrics_server(self, port=9090, host="127.0.0.1"):
+        """Serves :attr:`metrics` in the Prometheus text format on ``/metrics``.
+
+        The server runs in a daemon thread and is stopped by :meth:`stop`.
+        """
+        if self.metrics_server is not None:
+            self.metrics_server.stop()
+
+        self.metrics_server = MetricsServer(self.metrics, host, port)
+        self.metrics_server.start()
+        return self.metrics_server
+
+    def record_updates(self, path, *, anonymize=False):
+        """Starts appending every incoming update to a recording.
+
+        The recording is a gzip compressed JSON lines file that
+        ``benchmarks/replay.py`` can feed back through the dispatcher.
+        Recording stops with :meth:`stop_recording` or :meth:`stop`.
+        See :class:`UpdateRecorder` for the meaning of the parameters.
+        """
+        self.stop_recording()
+
+        self.recorder = UpdateRecorder(path, anonymize=anonymize)
+        # recorded as they arrive, the dispatcher gets to them
+        # later under a backlog and in the order of their priority
+        self.dispatcher.update_queue.on_put = self.recorder.record
+        return self.recorder
+
+    def stop_recording(self):
+        if self.recorder is None:
+            return
+
+        self.dispatcher.update_queue.on_put = None
+        self.recorder.close()
+        self.recorder = None
 
     def on_command_error(self, ctx, error):
         """Global error handler that is called when
@@ -343,18 +1039,240 @@ class Bot:
 
         raise error
 
+    def _start_dispatcher(self):
+        # Updater.stop() still stops the dispatcher, it checks
+        # dispatcher.has_running_threads and not only its own flag
+        self.job_queue.start()
+        ready = threading.Event()
+        threading.Thread(
+            target=self.dispatcher.start, kwargs={"ready": ready}, name="Dispatcher"
+        ).start()
+        ready.wait()
+
+    def start_pipelined_polling(
+        self,
+        *,
+        timeout=10,
+        max_backlog=100,
+        allowed_updates=None,
+        drop_pending_updates=False,
+    ):
+        """Starts polling with a :class:`PipelinedPoller`.
+
+        Unlike :meth:`telegram.ext.Updater.start_polling`, updates are only
+        confirmed to Telegram once the dispatcher has processed them. See
+        :class:`PipelinedPoller` for the meaning of the parameters.
+        """
+        self.dispatcher.bot.delete_webhook(drop_pending_updates=drop_pending_updates)
+
+        self.poller = PipelinedPoller(
+            self.dispatcher.bot,
+            metrics=self.metrics,
+            timeout=timeout,
+            max_backlog=max_backlog,
+            allowed_updates=allowed_updates,
+        )
+        self.poller.install(self.updater)
+        self._start_dispatcher()
+        self.poller.start()
+        return self.poller
+
+    def start_webhook(
+        self,
+        *,
+        listen="127.0.0.1",
+        port=8443,
+        url_path="",
+        webhook_url=None,
+        secret_token=None,
+        workers=4,
+        batch_size=100,
+        drop_pending_updates=False,
+    ):
+        """Starts receiving updates through a webhook instead of polling.
+
+        When ``webhook_url`` is given it is registered with Telegram, along
+        with ``secret_token``. Without it the server can be fed locally by
+        POSTing updates to it. See :class:`WebhookServer` for the other
+        parameters.
+
+        Registering a ``secret_token`` needs python-telegram-bot 13.13 or
+        newer, older versions raise :exc:`TypeError`.
+        """
+        options = {}
+        if webhook_url is not None and secret_token is not None:
+            set_webhook = self.dispatcher.bot.set_webhook
+            if "secret_token" not in inspect.signature(set_webhook).parameters:
+                # the server would reject every update Telegram sends
+                raise TypeError(
+                    "secret_token needs python-telegram-bot 13.13 or newer"
+                )
+            options["secret_token"] = secret_token
+
+        self.webhook_server = WebhookServer(
+            self.dispatcher.bot,
+            self.dispatcher.update_queue,
+            listen=listen,
+            port=port,
+            url_path=url_path,
+            secret_token=secret_token,
+            workers=workers,
+            batch_size=batch_size,
+        )
+
+        self._start_dispatcher()
+        self.webhook_server.start()
+
+        if webhook_url is not None:
+            self.dispatcher.bot.set_webhook(
+                webhook_url,
+                max_connections=workers,
+                drop_pending_updates=drop_pending_updates,
+                **options
+            )
+
+        return self.webhook_server
+
     def stop(self):
+        if self.webhook_server is not None:
+            # stop taking updates before the dispatcher goes away
+            self.webhook_server.stop()
+            self.webhook_server = None
+        if self.poller is not None:
+            self.poller.stop()
+        if self.extension_watcher is not None:
+            self.extension_watcher.stop()
+        if self.metrics_server is not None:
+            self.metrics_server.stop()
+            self.metrics_server = None
+        if self.tracer is not None:
+            self.tracer.flush()
         self.updater.stop()
-
-    def run(self, *, idle=True):
-        self.updater.start_polling()
+        if self.executor is not None:
+            # the dispatcher is stopped, let the queued commands finish
+            self.executor.shutdown()
+        self.state.close()
+        if self.poller is not None:
+            poller, self.poller = self.poller, None
+            try:
+                poller.commit()
+            except TelegramError as exc:
+                print(
+                    "Could not confirm the processed updates: {}".format(exc),
+                    file=sys.stderr,
+                )
+        self.stop_recording()
+
+    def run(self, *, mode="polling", idle=True, **kwargs):
+        """Starts receiving updates.
+
+        ``mode`` is one of:
+
+        - ``"polling"``: the keyword arguments are passed to
+          :meth:`telegram.ext.Updater.start_polling`.
+        - ``"pipelined"``: they are passed to :meth:`start_pipelined_polling`.
+        - ``"webhook"``: they are passed to :meth:`start_webhook`.
+        """
+        if mode == "polling":
+            self.updater.start_polling(**kwargs)
+        elif mode == "pipelined":
+            self.start_pipelined_polling(**kwargs)
+        elif mode == "webhook":
+            self.start_webhook(**kwargs)
+        else:
+            raise ValueError("mode must be 'polling', 'pipelined' or 'webhook'")
 
         if idle:
-            self.updater.idle()
+            self.idle()
+
+    def _stop_intake(self):
+        if self.webhook_server is not None:
+            self.webhook_server.stop()
+            self.webhook_server = None
+        if self.poller is not None:
+            self.poller.stop()
+        if self.updater.running:
+            # the polling thread of the updater exits after its current
+            # request, updates it receives after this are not confirmed
+            self.updater.running = False
+
+    def drain(self, timeout=30.0):
+        """Stops receiving updates, finishes the ones received and stops.
+
+        Commands that are queued or running get up to ``timeout`` seconds
+        to finish. The progress is printed every second and recorded in
+        the ``telegram_commands_drain_remaining`` gauge. Updates that were
+        still queued at the deadline are dropped. With
+        :meth:`start_pipelined_polling` they were never confirmed, so
+        Telegram delivers them again after a restart. With
+        :meth:`telegram.ext.Updater.start_polling` and webhooks most of
+        them were already confirmed, and are lost. Commands that are still running
+        are waited for, unless they have a ``timeout`` of their own.
+
+        Returns ``True`` if everything finished in time.
+        """
+        deadline = time.monotonic() + timeout
+        remaining = self.metrics.gauge(
+            "telegram_commands_drain_remaining",
+            "Updates queued and commands running while the bot drains.",
+            ("kind",),
+        )
 
-    def idle(self):
-        self.updater.idle()
+        self._stop_intake()
+        reported = 0.0
+        while True:
+            queued = self.dispatcher.update_queue.qsize()
+            running = self._inflight.count()
+            remaining.set(queued, "queued")
+            remaining.set(running, "running")
+
+            now = time.monotonic()
+            if not queued and not running or now >= deadline:
+                break
+
+            if now - reported >= 1.0:
+                reported = now
+                print(
+                    "Draining: {} queued updates, {} running commands, "
+                    "{:.0f}s left".format(queued, running, deadline - now),
+                    file=sys.stderr,
+                )
+
+            if running:
+                self._inflight.wait(timeout=min(0.1, deadline - now))
+            else:
+                # only queued updates are left, the dispatcher is on them
+                time.sleep(min(0.05, deadline - now))
+
+        drained = not queued and not running
+        if not drained:
+            dropped = self.dispatcher.update_queue.clear()
+            if self.executor is not None:
+                self.executor.shutdown(wait=False, cancel_pending=True)
+            print(
+                "Drain timed out, dropped {} queued updates ({}), {} commands "
+                "still running".format(
+                    dropped,
+                    # only the pipelined poller confirms updates once done
+                    "delivered again" if self.poller is not None else "lost",
+                    self._inflight.count(),
+                ),
+                file=sys.stderr,
+            )
 
-    def close(self):
-        self.updater.stop()
+        self.stop()
+        return drained
+
+    def idle(self, *, drain_timeout=30.0):
+        """Blocks until SIGINT, SIGTERM or SIGABRT, then drains and stops."""
+        stop = threading.Event()
+        for signum in (signal.SIGINT, signal.SIGTERM, signal.SIGABRT):
+            signal.signal(signum, lambda *args: stop.set())
+
+        while not stop.wait(1):
+            pass
+        self.drain(drain_timeout)
+
+    def close(self, *, drain_timeout=30.0):
+        self.drain(drain_timeout)
         sys.exit()
@@ -0,0 +1,81 @@
+import time
+import threading
+import collections
+
+from .cooldowns import BucketType
+
+
+class _Entry:
+    __slots__ = ("expires", "result", "sends", "message_id")
+
+    def __init__(self, expires, result, sends, message_id):
+        self.expires = expires
+        self.result = result
+        # (text, options, message) of every ctx.send of the invocation
+        self.sends = sends
+        self.message_id = message_id
+
+
+class ResultCache:
+    """Remembers what a command sent for its arguments.
+
+    An invocation whose key is cached does not run the callback, it gets
+    the cached sends repeated through :meth:`Context.send` instead, and
+    the cached return value. Entries expire ``ttl`` seconds after they
+    were stored, and the least recently used entry is evicted once there
+    are ``maxsize``. Invocations that fail are not cached.
+
+    Unlike cooldowns and the shared update deduplicator, the entries stay in the
+    process instead of ``bot.state``. They hold the callback's return value
+    and the options of every send, reply markups and files included, which
+    are not JSON serializable, and least recently used eviction needs an
+    order of use the backends do not keep. Uploads are still shared: files
+    are sent again by the file_id remembered in ``bot.state``, so a miss in
+    another process costs a run of the callback but no upload.
+
+    Usually created through :func:`cached`.
+    """
+
+    def __init__(self, ttl=300.0, maxsize=128, key=None, type=BucketType.default):
+        if not isinstance(type, BucketType):
+            raise TypeError("Cache type must be a BucketType")
+
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.key = key
+        self.type = type
+        # key: _Entry, least recently used first
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def key_for(self, ctx, arguments):
+        """Returns the key of ``ctx``, ``arguments`` is the command's default key."""
+        key = self.key(ctx) if self.key is not None else arguments
+        return key, self.type.get_key(ctx)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.expires <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, ctx, result, sends):
+        message_id = ctx.message.message_id if ctx.message else None
+        entry = _Entry(time.monotonic() + self.ttl, result, sends, message_id)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,92 @@
+import threading
+
+from .errors import CommandTimeout
+
+
+class _Flight:
+    __slots__ = ("done", "result", "error", "sends", "message_id")
+
+    def __init__(self, leader):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        # (text, options, message) of every ctx.send of the leader
+        self.sends = []
+        self.message_id = leader.message.message_id if leader.message else None
+
+
+class SingleFlight:
+    """Lets concurrent invocations with the same key share one execution.
+
+    The first invocation of a key, the leader, runs the callback while its
+    sends are recorded. Invocations with the same key that arrive while it
+    runs wait for it, then get its return value and repeat its sends in
+    their own chat instead of running the callback themselves.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # key: _Flight
+        self._flights = {}
+
+    def __len__(self):
+        return len(self._flights)
+
+    def run(self, key, ctx, func, timeout=None):
+        """Runs ``func`` for ``ctx``, or waits for the running flight of ``key``.
+
+        Returns the flight and whether ``ctx`` led it.
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight(ctx)
+
+        if not leader:
+            if not flight.done.wait(timeout):
+                raise CommandTimeout(timeout)
+            return flight, False
+
+        # sends may already be recorded for the result cache
+        recording, ctx._sends = ctx._sends, flight.sends
+        try:
+            flight.result = func()
+        except BaseException as exc:
+            flight.error = exc
+            raise
+        finally:
+            ctx._sends = recording
+            if recording is not None:
+                recording.extend(flight.sends)
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+        return flight, True
+
+
+def replay_sends(ctx, sends, message_id):
+    """Repeats ``sends``, recorded while handling message ``message_id``,
+    in the chat of ``ctx``."""
+    for text, options, message in sends:
+        options = dict(options)
+
+        reply = options["reply"]
+        if reply is not None:
+            # a reply to the command becomes a reply to this command
+            if reply == message_id and ctx.message is not None:
+                options["reply"] = ctx.message.message_id
+            else:
+                options["reply"] = None
+
+        # files are sent again by id, the leader already uploaded them
+        if message is not None and (options["photo"] or options["document"]):
+            if message.photo:
+                options["photo"] = message.photo[-1].file_id
+                options["document"] = None
+            elif message.document:
+                options["photo"] = None
+                options["document"] = message.document.file_id
+
+        ctx.send(text, **options)
@@ -150,7 +150,8 @@ class Cog(metaclass=CogMeta):
                 except Exception as e:
                     # undo our additions
                     for to_undo in self.__cog_commands__[:index]:
-                        bot.remove_command(to_undo)
+                        if to_undo.parent is None:
+                            bot.remove_command(to_undo.name)
                     raise e
 
         return self
@@ -158,7 +159,8 @@ class Cog(metaclass=CogMeta):
     def _eject(self, bot):
         try:
             for command in self.__cog_commands__:
-                if command.parent is None:
+                # after a reload the name may belong to the new version
+                if command.parent is None and bot.commands.get(command.name) is command:
                     bot.remove_command(command.name)
         finally:
             self.cog_unload()
@@ -1,5 +1,38 @@
+import hashlib
+import contextlib
+
 from telegram import error
 
+# how long the file_id of uploaded content is remembered, in seconds
+FILE_ID_TTL = 7 * 24 * 60 * 60
+
+
+def _is_file_id_error(exc):
+    # Telegram no longer knows the file, as opposed to a problem
+    # with the rest of the message that an upload would not fix
+    message = exc.message.lower()
+    return "wrong file identifier" in message or "file_id" in message
+
+
+def _file_key(kind, file):
+    """Returns the state key for the content of ``file``, or ``None``.
+
+    File ids and URLs are sent as they are, only bytes and seekable
+    files are uploaded and worth remembering.
+    """
+    if isinstance(file, bytes):
+        data = file
+    elif hasattr(file, "read") and getattr(file, "seekable", lambda: False)():
+        position = file.tell()
+        data = file.read()
+        file.seek(position)
+    else:
+        return None
+
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return "file_id:{}:{}".format(kind, hashlib.sha256(data).hexdigest())
+
 
 class Context:
     def __init__(self, command, update, context, *, view):
@@ -16,6 +49,10 @@ class Context:
         self.text = self.message.text if self.message else None
         self.me = context.bot
         self.command_failed = False
+        # the innermost running tracing span, if tracing is enabled
+        self._span = None
+        # where sends are recorded while leading a coalesced invocation
+        self._sends = None
 
         self.args = []
         self.kwargs = []
@@ -28,38 +65,121 @@ class Context:
             return None
         return self.command.cog
 
+    @contextlib.contextmanager
+    def trace(self, name, **attributes):
+        """Context manager that times the enclosed block as a tracing span.
+
+        The span is nested under the one that is currently open for this
+        context and is correlated by :attr:`update_id`. This does nothing
+        unless :attr:`Bot.tracer` is set.
+        """
+        tracer = self.bot.tracer
+        if tracer is None:
+            yield None
+            return
+
+        parent = self._span
+        span = self._span = tracer.start_span(
+            name, self.update_id, parent, **attributes
+        )
+        failure = None
+        try:
+            yield span
+        except BaseException as exc:
+            failure = exc
+            raise
+        finally:
+            self._span = parent
+            tracer.end_span(span, failure)
+
     def send(
-        self, text="", *, reply=None, parse_mode=None, photo=None, reply_markup=None
+        self,
+        text="",
+        *,
+        reply=None,
+        parse_mode=None,
+        photo=None,
+        document=None,
+        filename=None,
+        reply_markup=None
     ):
-        if photo:
-            try:
-                return self.me.send_photo(
-                    self.chat.id,
-                    photo=photo,
-                    caption=text,
-                    parse_mode=parse_mode,
-                    reply_to_message_id=reply,
-                    reply_markup=reply_markup,
-                )
-            except error.BadRequest:
-                photo.seek(0)
-                return self.me.send_document(
-                    self.chat.id,
-                    document=photo,
-                    filename="photo.png",
-                    caption=text,
-                    parse_mode=parse_mode,
-                    reply_to_message_id=reply,
-                    reply_markup=reply_markup,
-                )
-
-        return self.me.send_message(
-            self.chat.id,
-            text=text,
+        options = dict(
+            reply=reply,
+            parse_mode=parse_mode,
+            photo=photo,
+            document=document,
+            filename=filename,
+            reply_markup=reply_markup,
+        )
+        message = self._send(text, **options)
+        if self._sends is not None:
+            self._sends.append((text, options, message))
+        return message
+
+    def _send(
+        self, text, *, reply, parse_mode, photo, document, filename, reply_markup
+    ):
+        options = dict(
+            caption=text,
             parse_mode=parse_mode,
             reply_to_message_id=reply,
             reply_markup=reply_markup,
         )
 
+        if document or photo:
+            kind = "document" if document else "photo"
+            key = _file_key(kind, document or photo)
+            state = self.bot.state
+            cached = state.get(key) if key is not None else None
+            if cached is not None:
+                # sent before, reuse Telegram's copy instead of uploading
+                sent_as, file_id = cached
+                try:
+                    return self._send_file(sent_as, file_id, filename, options)
+                except error.BadRequest as exc:
+                    if not _is_file_id_error(exc):
+                        raise
+                    state.delete(key)
+
+            if document:
+                message = self._send_file("document", document, filename, options)
+            else:
+                # bytes, file ids and URLs can be sent again as they are
+                position = photo.tell() if hasattr(photo, "seek") else None
+                try:
+                    message = self._send_file("photo", photo, None, options)
+                except error.BadRequest:
+                    if position is not None:
+                        photo.seek(position)
+                    message = self._send_file("document", photo, "photo.png", options)
+
+            if key is not None:
+                # also remembers photos that had to be sent as documents,
+                # so the failing sendPhoto is skipped next time
+                if message.photo:
+                    state.set(key, ["photo", message.photo[-1].file_id], FILE_ID_TTL)
+                elif message.document:
+                    state.set(key, ["document", message.document.file_id], FILE_ID_TTL)
+            return message
+
+        with self.trace("sendMessage"):
+            return self.me.send_message(
+                self.chat.id,
+                text=text,
+                parse_mode=parse_mode,
+                reply_to_message_id=reply,
+                reply_markup=reply_markup,
+            )
+
+    def _send_file(self, kind, file, filename, options):
+        if kind == "photo":
+            with self.trace("sendPhoto"):
+                return self.me.send_photo(self.chat.id, photo=file, **options)
+
+        with self.trace("sendDocument"):
+            return self.me.send_document(
+                self.chat.id, document=file, filename=filename, **options
+            )
+
     def reply(self, text="", **kwargs):
         self.send(text, reply=self.message.message_id, **kwargs)
@@ -48,7 +48,8 @@ def _id_or_mention(argument):
 class ChatMemberConverter(Converter):
     def convert(self, ctx, argument):
         try:
-            member = ctx.chat.get_member(int(argument))
+            with ctx.trace("getChatMember"):
+                member = ctx.chat.get_member(int(argument))
 
         except ValueError:
             raise BadArgument("Member ID must be an int.")
@@ -65,7 +66,8 @@ class ChatConverter(Converter):
         argument, friendly = _id_or_mention(argument)
 
         try:
-            chat = ctx.me.get_chat(argument)
+            with ctx.trace("getChat"):
+                chat = ctx.me.get_chat(argument)
 
         except telegram.TelegramError:
             raise BadArgument(f"Chat with the {friendly} of '{argument}' not found.")
@@ -77,7 +79,8 @@ class ChatConverter(Converter):
 class StickerSetConverter(Converter):
     def convert(self, ctx, argument):
         try:
-            sticker_set = ctx.me.get_sticker_set(argument)
+            with ctx.trace("getStickerSet"):
+                sticker_set = ctx.me.get_sticker_set(argument)
 
         except telegram.TelegramError:
             raise BadArgument(f"Chat with the name of '{argument}' not found.")
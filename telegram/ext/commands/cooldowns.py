@@ -0,0 +1,55 @@
+import enum
+
+
+class BucketType(enum.Enum):
+    """What a :class:`Cooldown` counts uses by."""
+
+    default = 0
+    user = 1
+    chat = 2
+
+    def get_key(self, ctx):
+        if self is BucketType.user:
+            return ctx.user.id if ctx.user else None
+        if self is BucketType.chat:
+            return ctx.chat.id if ctx.chat else None
+        return None
+
+
+class Cooldown:
+    """Allows a command ``rate`` times every ``per`` seconds per bucket.
+
+    The uses are counted in ``bot.state``, so a backend shared between
+    processes gives every process the same cooldown. Each window starts
+    with the first use in it.
+    """
+
+    __slots__ = ("rate", "per", "type")
+
+    def __init__(self, rate, per, type=BucketType.default):
+        if not isinstance(type, BucketType):
+            raise TypeError("Cooldown type must be a BucketType")
+
+        self.rate = int(rate)
+        self.per = float(per)
+        self.type = type
+
+    def __repr__(self):
+        return "<Cooldown rate: {0.rate} per: {0.per} type: {0.type!r}>".format(self)
+
+    def _key(self, ctx):
+        return "cooldown:{}:{}:{}".format(
+            ctx.command.qualified_name, self.type.name, self.type.get_key(ctx)
+        )
+
+    def update_rate_limit(self, ctx):
+        """Counts a use. Returns the seconds to wait if it is over the rate, else ``None``."""
+        key = self._key(ctx)
+        # one round trip to the backend, however far away it is
+        uses, ttl = ctx.bot.state.pipeline().incr(key, ttl=self.per).ttl(key).execute()
+        if uses > self.rate:
+            return ttl if ttl is not None else self.per
+        return None
+
+    def reset(self, ctx):
+        ctx.bot.state.delete(self._key(ctx))
@@ -1,6 +1,8 @@
+import time
 import inspect
 import typing
 import functools
+import contextlib
 
 from .context import Context
 from .errors import (
@@ -15,9 +17,14 @@ from .errors import (
     NotOwner,
     DisabledCommand,
     CommandInvokeError,
+    CommandOnCooldown,
+    CommandTimeout,
 )
 from . import converter as converters
 from .cog import Cog
+from .cooldowns import BucketType, Cooldown
+from .coalesce import replay_sends
+from .cache import ResultCache
 from ._types import _BaseCommand
 
 
@@ -64,6 +71,17 @@ class Command(_BaseCommand):
         self.parent = kwargs.get("parent")
         self.rest_is_raw = kwargs.get("rest_is_raw", False)
         self.enabled = kwargs.get("enabled", True)
+        self.trace_allocations = kwargs.get("trace_allocations", False)
+        # higher priorities are taken from the update queue first,
+        # and are not shed by an AdmissionController
+        self.priority = kwargs.get("priority", 0)
+        # seconds the callback may run, enforced by bot.watchdog
+        self.timeout = kwargs.get("timeout")
+        # True or a function returning the key from the context,
+        # concurrent invocations with the same key run the callback once.
+        # The default key is the arguments and the chat, since the sends
+        # of the one run are repeated to every invocation
+        self.coalesce = kwargs.get("coalesce", False)
         self._before_invoke = None
         self._after_invoke = None
 
@@ -87,6 +105,20 @@ class Command(_BaseCommand):
         finally:
             self.checks = checks
 
+        try:
+            cooldown = func.__commands_cooldown__
+        except AttributeError:
+            cooldown = kwargs.get("cooldown")
+        finally:
+            self._cooldown = cooldown
+
+        try:
+            cache = func.__commands_cache__
+        except AttributeError:
+            cache = kwargs.get("cache")
+        finally:
+            self.cache = cache
+
     def set_callback(self, function):
         self.callback = function
         self.module = function.__module__
@@ -246,6 +278,8 @@ class Command(_BaseCommand):
         other._after_invoke = self._after_invoke
         if self.checks != other.checks:
             other.checks = self.checks.copy()
+        other._cooldown = self._cooldown
+        other.cache = self.cache
 
         try:
             other.on_error = self.on_error
@@ -537,6 +571,19 @@ class Command(_BaseCommand):
         finally:
             ctx.command = original
 
+    def _prepare_cooldowns(self, ctx):
+        if self._cooldown is None:
+            return
+
+        retry_after = self._cooldown.update_rate_limit(ctx)
+        if retry_after is not None:
+            raise CommandOnCooldown(self._cooldown, retry_after)
+
+    def reset_cooldown(self, ctx):
+        """Resets the cooldown of the bucket ``ctx`` falls in."""
+        if self._cooldown is not None:
+            self._cooldown.reset(ctx)
+
     def call_before_hooks(self, ctx):
         # now that we're done preparing we can call the pre-command hooks
         # first, call the command local hook:
@@ -589,40 +636,168 @@ class Command(_BaseCommand):
         if hook is not None:
             hook(ctx)
 
+    @contextlib.contextmanager
+    def _stage(self, ctx, name):
+        start = time.perf_counter()
+        try:
+            with ctx.trace(name):
+                yield
+        finally:
+            ctx.bot._command_metrics.stage_seconds.observe(
+                time.perf_counter() - start, self.qualified_name, name
+            )
+
     def prepare(self, ctx):
         ctx.command = self
 
-        self._parse_arguments(ctx)
+        with self._stage(ctx, "parse"):
+            self._parse_arguments(ctx)
 
-        if not self.can_run(ctx):
-            raise CheckFailure(
-                "The check functions for command {0.qualified_name} failed.".format(
-                    self
+        with self._stage(ctx, "checks"):
+            if not self.can_run(ctx):
+                raise CheckFailure(
+                    "The check functions for command {0.qualified_name} failed.".format(
+                        self
+                    )
                 )
-            )
 
-        self.call_before_hooks(ctx)
+        if self._cooldown is not None:
+            with self._stage(ctx, "cooldown"):
+                self._prepare_cooldowns(ctx)
 
-    def __call__(self, update, context):
-        ctx = self.bot.get_context(self, update, context)
+        with self._stage(ctx, "before_hooks"):
+            self.call_before_hooks(ctx)
 
-        # In order to still have the context from the error,
-        # I need to except the error here and call the command
-        # error handlers manually
-        try:
-            self.prepare(ctx)
+    def _invoke(self, ctx):
+        wrapped = wrap_callback(self.callback)
+        return wrapped(*ctx.args, **ctx.kwargs)
 
-            wrapped = wrap_callback(self.callback)
-            ret = wrapped(*ctx.args, **ctx.kwargs)
+    def _measure_allocations(self):
+        profiler = self.bot.allocation_profiler
+        if profiler is not None and profiler.should_sample(self):
+            return profiler.measure(self.qualified_name)
+        return contextlib.nullcontext()
 
-            self.call_after_hooks(ctx)
+    def _run_callback(self, ctx):
+        if self.timeout is not None:
+            return self.bot.watchdog.run(self.timeout, self._invoke, ctx)
+        return self._invoke(ctx)
 
-        except CommandError as exc:
-            ctx.command_failed = True
-            self.dispatch_error(ctx, exc)
+    def _arguments_key(self, ctx):
+        # the converted arguments, without the cog and context
+        args = ctx.args[1 if self.cog is None else 2 :]
+        return (self.qualified_name, repr(args), repr(sorted(ctx.kwargs.items())))
 
+    def _invoke_coalesced(self, ctx):
+        if callable(self.coalesce):
+            key = self.coalesce(ctx)
         else:
-            return ret
+            # replies may depend on the chat, they must not leak into another
+            key = (self._arguments_key(ctx), BucketType.chat.get_key(ctx))
+
+        flight, leader = self.bot._single_flight.run(
+            key, ctx, lambda: self._run_callback(ctx), self.timeout
+        )
+        if leader:
+            return flight.result
+
+        self.bot._command_metrics.coalesced.inc(self.qualified_name)
+        error = flight.error
+        if error is not None:
+            # every follower raises its own exception, re-raising the
+            # leader's from several threads would mix their tracebacks
+            if isinstance(error, CommandError):
+                # the same type the leader got, e.g. CommandTimeout
+                raise _copy_error(error)
+            raise CommandInvokeError(error) from error
+        replay_sends(ctx, flight.sends, flight.message_id)
+        return flight.result
+
+    def _invoke_uncached(self, ctx):
+        if self.coalesce:
+            return self._invoke_coalesced(ctx)
+        return self._run_callback(ctx)
+
+    def _invoke_cached(self, ctx):
+        requests = self.bot._command_metrics.cache_requests
+        key = self.cache.key_for(ctx, self._arguments_key(ctx))
+        entry = self.cache.get(key)
+        if entry is not None:
+            requests.inc(self.qualified_name, "hit")
+            replay_sends(ctx, entry.sends, entry.message_id)
+            return entry.result
+
+        requests.inc(self.qualified_name, "miss")
+        sends = ctx._sends = []
+        try:
+            ret = self._invoke_uncached(ctx)
+        finally:
+            ctx._sends = None
+
+        self.cache.put(key, ctx, ret, sends)
+        return ret
+
+    def __call__(self, update, context):
+        ctx = self.bot.get_context(self, update, context)
+        metrics = self.bot._command_metrics
+
+        with ctx.trace("command", command=self.qualified_name) as span:
+            # In order to still have the context from the error,
+            # I need to except the error here and call the command
+            # error handlers manually
+            try:
+                admission = self.bot.admission
+                if admission is not None and not admission.admit(ctx):
+                    # counted in shed, not as an invocation
+                    return
+
+                metrics.invocations.inc(self.qualified_name)
+                self.prepare(ctx)
+
+                # the snapshots are taken outside the stage,
+                # so measuring does not show up in its timing
+                with self._measure_allocations():
+                    with self._stage(ctx, "callback"):
+                        if self.cache is not None:
+                            ret = self._invoke_cached(ctx)
+                        else:
+                            ret = self._invoke_uncached(ctx)
+
+                with self._stage(ctx, "after_hooks"):
+                    self.call_after_hooks(ctx)
+
+            except CommandError as exc:
+                ctx.command_failed = True
+                # the error is handled here, this tells RegistryHandler
+                # that the update did not go through
+                context.command_failed = True
+                # and it does not escape the span either
+                if span is not None:
+                    span.set_error(exc)
+                original = exc.original if isinstance(exc, CommandInvokeError) else exc
+                metrics.errors.inc(self.qualified_name, type(original).__name__)
+                if isinstance(exc, CommandTimeout):
+                    metrics.timeouts.inc(self.qualified_name)
+                with ctx.trace("error_handlers"):
+                    self.dispatch_error(ctx, exc)
+
+            except Exception as exc:
+                # e.g. a BotException from parsing, it goes to the dispatcher
+                ctx.command_failed = True
+                metrics.errors.inc(self.qualified_name, type(exc).__name__)
+                raise
+
+            else:
+                return ret
+
+
+def _copy_error(error):
+    # without calling __init__, its arguments differ between error types
+    copy = error.__class__.__new__(error.__class__)
+    copy.__dict__.update(error.__dict__)
+    copy.args = error.args
+    copy.__cause__ = error.__cause__
+    return copy
 
 
 def command(*args, **kwargs):
@@ -663,3 +838,44 @@ def is_owner():
         return True
 
     return check(predicate)
+
+
+def cooldown(rate, per, type=BucketType.default):
+    """Allows a command to be used ``rate`` times every ``per`` seconds.
+
+    ``type`` is a :class:`BucketType` that decides whether the uses are
+    counted for everyone, per user or per chat. Going over the rate raises
+    :exc:`CommandOnCooldown`.
+    """
+
+    def decorator(func):
+        if isinstance(func, Command):
+            func._cooldown = Cooldown(rate, per, type)
+        else:
+            func.__commands_cooldown__ = Cooldown(rate, per, type)
+        return func
+
+    return decorator
+
+
+def cached(ttl=300.0, maxsize=128, *, key=None, type=BucketType.default):
+    """Caches what a command sends for its arguments.
+
+    Invocations with the same converted arguments get the replies of the
+    first one repeated, for ``ttl`` seconds, without running the callback.
+    At most ``maxsize`` results are kept, the least recently used go first.
+    ``key`` is a function of the context that replaces the arguments as
+    the key, and ``type`` is a :class:`BucketType` to keep separate results
+    per user or per chat. Hits and misses are counted in
+    ``telegram_commands_cache_requests_total``.
+    """
+
+    def decorator(func):
+        cache = ResultCache(ttl, maxsize, key, type)
+        if isinstance(func, Command):
+            func.cache = cache
+        else:
+            func.__commands_cache__ = cache
+        return func
+
+    return decorator
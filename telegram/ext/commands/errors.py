@@ -100,6 +100,12 @@ class ExtensionNotFound(ExtensionError):
         super().__init__(fmt.format(name), name=name)
 
 
+class ExtensionDependencyError(ExtensionError):
+    def __init__(self, name, reason):
+        fmt = "Extension {0!r} {1}."
+        super().__init__(fmt.format(name, reason), name=name)
+
+
 class TooManyArguments(UserInputError):
     pass
 
@@ -153,3 +159,36 @@ class ExpectedClosingQuoteError(ArgumentParsingError):
     def __init__(self, close_quote):
         self.close_quote = close_quote
         super().__init__("Expected closing {}.".format(close_quote))
+
+
+class CommandOnCooldown(CommandError):
+    """Exception raised when the command being invoked is on cooldown.
+
+    Attributes
+    -----------
+    cooldown: :class:`Cooldown`
+        The cooldown that was triggered.
+    retry_after: :class:`float`
+        The seconds to wait before the command can be used again.
+    """
+
+    def __init__(self, cooldown, retry_after):
+        self.cooldown = cooldown
+        self.retry_after = retry_after
+        super().__init__(
+            "You are on cooldown. Try again in {:.2f}s".format(retry_after)
+        )
+
+
+class CommandTimeout(CommandError):
+    """Exception raised when a command ran longer than its ``timeout``.
+
+    Attributes
+    -----------
+    timeout: :class:`float`
+        The timeout of the command, in seconds.
+    """
+
+    def __init__(self, timeout):
+        self.timeout = timeout
+        super().__init__("Command did not finish within {}s".format(timeout))
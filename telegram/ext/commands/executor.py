@@ -0,0 +1,294 @@
+import time
+import heapq
+import logging
+import itertools
+import threading
+import collections
+
+from .metrics import MetricsRegistry
+
+log = logging.getLogger(__name__)
+
+
+def _update_key(update):
+    # the updates of one chat run in order, like ShardSupervisor.shard_for
+    if update.effective_chat is not None:
+        return update.effective_chat.id
+    if update.effective_user is not None:
+        return update.effective_user.id
+    return update.update_id
+
+
+class _Job:
+    __slots__ = ("func", "priority", "on_done", "on_error", "on_cancel", "queued")
+
+    def __init__(self, func, priority, on_done, on_error, on_cancel):
+        self.func = func
+        self.priority = priority
+        self.on_done = on_done
+        self.on_error = on_error
+        self.on_cancel = on_cancel
+        self.queued = time.perf_counter()
+
+
+class AdaptiveExecutor:
+    """Runs commands on a pool of threads whose size follows the load.
+
+    By default a bot runs one command at a time on the dispatcher thread.
+    With an executor set as ``bot.executor``, the dispatcher only queues
+    each command and moves on, and up to ``limit`` commands run at once.
+    The commands of one chat still run one after another, in order. Among
+    the chats with a command waiting, the one whose next command has the
+    highest ``priority`` goes first.
+
+    Every ``interval`` seconds the limit is adjusted from what was measured
+    since the last adjustment:
+
+    - When commands took much longer to run than the fastest they have
+      been recently, more threads only fight over the GIL or a downstream
+      service, so the limit is cut by a quarter.
+    - Otherwise, when commands waited for a thread for longer than
+      ``target_wait`` seconds, the limit grows by one.
+
+    The limit, the adjustments and the wait for a thread are recorded in
+    ``metrics``::
+
+        bot.executor = commands.AdaptiveExecutor(metrics=bot.metrics)
+
+    Parameters
+    -----------
+    min_workers: :class:`int`
+        The lowest limit, and where it starts.
+    max_workers: :class:`int`
+        The highest limit.
+    target_wait: :class:`float`
+        How long commands may wait for a thread before the limit grows.
+    tolerance: :class:`float`
+        How much slower than the fastest recent run time, as a fraction,
+        commands may get before the limit is cut.
+    interval: :class:`float`
+        Seconds between adjustments.
+    metrics: Optional[:class:`MetricsRegistry`]
+        Where to record the metrics, usually ``bot.metrics``.
+    """
+
+    def __init__(
+        self,
+        *,
+        min_workers=1,
+        max_workers=16,
+        target_wait=0.05,
+        tolerance=0.5,
+        interval=1.0,
+        metrics=None,
+    ):
+        self.min_workers = min_workers
+        self.max_workers = max_workers
+        self.target_wait = target_wait
+        self.tolerance = tolerance
+        self.interval = interval
+        self.limit = min_workers
+        # submitted jobs that have not finished
+        self.pending = 0
+        # how long the job started last waited for a thread
+        self.waited = 0.0
+
+        # chat key: deque of jobs, for every key with jobs
+        self._jobs = {}
+        # (-priority, sequence, key) of the keys with jobs that no thread
+        # is working on, by the priority of their first job
+        self._ready = []
+        self._sequence = itertools.count()
+        # keys whose first job is running
+        self._active = set()
+        self._running = 0
+        self._threads = []
+        self._cond = threading.Condition()
+        self._stopping = False
+        self._adjuster = None
+
+        # measured since the last adjustment
+        self._completed = 0
+        self._total_wait = 0.0
+        self._total_run = 0.0
+        # the fastest recent average run time
+        self._baseline = None
+
+        metrics = metrics if metrics is not None else MetricsRegistry()
+        self._limit_gauge = metrics.gauge(
+            "telegram_commands_executor_limit",
+            "How many commands the executor runs at once.",
+        )
+        self._adjustments = metrics.counter(
+            "telegram_commands_executor_adjustments_total",
+            "Changes of the executor limit, by direction.",
+            ("direction",),
+        )
+        self._wait_seconds = metrics.histogram(
+            "telegram_commands_executor_wait_seconds",
+            "Time commands waited for an executor thread.",
+        )
+        self._limit_gauge.set(self.limit)
+
+    def submit(
+        self, key, func, *, priority=0, on_done=None, on_error=None, on_cancel=None
+    ):
+        """Queues ``func`` behind the other jobs with the same ``key``.
+
+        ``on_done`` is called after it ran, ``on_error`` with the exception
+        if it raised and ``on_cancel`` if it was dropped by :meth:`shutdown`.
+        """
+        job = _Job(func, priority, on_done, on_error, on_cancel)
+        with self._cond:
+            if self._stopping:
+                raise RuntimeError("The executor has been shut down")
+
+            if self._adjuster is None:
+                self._adjuster = threading.Thread(
+                    target=self._adjust_loop, name="ExecutorAdjuster", daemon=True
+                )
+                self._adjuster.start()
+
+            self.pending += 1
+            jobs = self._jobs.get(key)
+            if jobs is None:
+                jobs = self._jobs[key] = collections.deque()
+                self._push_ready(key, job)
+            jobs.append(job)
+            self._spawn_workers()
+            self._cond.notify()
+
+    def _spawn_workers(self):
+        while len(self._threads) < self.limit:
+            thread = threading.Thread(
+                target=self._work,
+                name="CommandExecutor-{}".format(len(self._threads)),
+                daemon=True,
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def _push_ready(self, key, job):
+        heapq.heappush(self._ready, (-job.priority, next(self._sequence), key))
+
+    def _runnable(self):
+        # threads over the limit wait for a notification from a finished
+        # job or from _adjust raising the limit
+        if self._ready:
+            return self._running < self.limit
+        return self._stopping
+
+    def _work(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(self._runnable)
+                if not self._ready:
+                    return
+
+                _, _, key = heapq.heappop(self._ready)
+                job = self._jobs[key][0]
+                self._active.add(key)
+                self._running += 1
+
+            started = time.perf_counter()
+            self.waited = started - job.queued
+            self._wait_seconds.observe(self.waited)
+            try:
+                job.func()
+            except Exception as exc:
+                if job.on_error is None:
+                    log.exception("Ignoring exception in an executor job")
+                else:
+                    job.on_error(exc)
+            finally:
+                ran = time.perf_counter() - started
+                with self._cond:
+                    self._running -= 1
+                    self.pending -= 1
+                    self._completed += 1
+                    self._total_wait += self.waited
+                    self._total_run += ran
+
+                    self._active.discard(key)
+                    jobs = self._jobs[key]
+                    jobs.popleft()
+                    if jobs:
+                        self._push_ready(key, jobs[0])
+                    else:
+                        del self._jobs[key]
+                    self._cond.notify_all()
+
+                if job.on_done is not None:
+                    job.on_done()
+
+    def _adjust_loop(self):
+        while True:
+            time.sleep(self.interval)
+            with self._cond:
+                if self._stopping:
+                    return
+                self._adjust()
+
+    def _adjust(self):
+        completed, self._completed = self._completed, 0
+        total_wait, self._total_wait = self._total_wait, 0.0
+        total_run, self._total_run = self._total_run, 0.0
+        backlog = len(self._ready)
+
+        limit = self.limit
+        if not completed:
+            # nothing finished although there is work, everything is stuck
+            if backlog and self._running >= limit:
+                limit += 1
+        else:
+            run_time = total_run / completed
+            if self._baseline is None or run_time < self._baseline:
+                self._baseline = run_time
+            else:
+                # forget it slowly, so it follows changes in the workload
+                self._baseline *= 1.05
+
+            if run_time > self._baseline * (1 + self.tolerance):
+                limit = int(limit * 0.75)
+            elif total_wait / completed > self.target_wait and backlog:
+                limit += 1
+
+        limit = max(self.min_workers, min(self.max_workers, limit))
+        if limit == self.limit:
+            return
+
+        self._adjustments.inc("up" if limit > self.limit else "down")
+        self.limit = limit
+        self._limit_gauge.set(limit)
+        self._spawn_workers()
+        # wakes the threads waiting for the limit to rise
+        self._cond.notify_all()
+
+    def shutdown(self, wait=True, *, cancel_pending=False):
+        """Stops taking jobs.
+
+        With ``wait``, waits for the queued jobs to finish. With
+        ``cancel_pending``, only the running jobs finish and the others are
+        dropped.
+        """
+        cancelled = []
+        with self._cond:
+            self._stopping = True
+            if cancel_pending:
+                for key, jobs in self._jobs.items():
+                    keep = 1 if key in self._active else 0
+                    while len(jobs) > keep:
+                        cancelled.append(jobs.pop())
+                self._ready.clear()
+                for key in [key for key, jobs in self._jobs.items() if not jobs]:
+                    del self._jobs[key]
+                self.pending -= len(cancelled)
+            self._cond.notify_all()
+
+        for job in reversed(cancelled):
+            if job.on_cancel is not None:
+                job.on_cancel()
+        if wait:
+            for thread in self._threads:
+                if thread is not threading.current_thread():
+                    thread.join()
@@ -461,6 +461,12 @@ class HelpCommand:
         self.prepare_help_command(ctx, command)
         bot = ctx.bot
 
+        # make sure lazily loaded extensions show up in the help
+        if command is None:
+            bot.load_lazy_extensions()
+        else:
+            bot.resolve_lazy_name(command.split(" ")[0])
+
         if command is None:
             mapping = self.get_bot_mapping()
             return self.send_bot_help(mapping)
@@ -0,0 +1,337 @@
+import bisect
+import weakref
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+
+def _escape(value):
+    return str(value).replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\"")
+
+
+def _format_labels(names, values, extra=None):
+    pairs = ['{}="{}"'.format(n, _escape(v)) for n, v in zip(names, values)]
+    if extra is not None:
+        pairs.append('{}="{}"'.format(*extra))
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return repr(value)
+    return str(value)
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def _samples(self):
+        raise NotImplementedError
+
+    def render(self):
+        lines = [
+            "# HELP {} {}".format(self.name, self.documentation),
+            "# TYPE {} {}".format(self.name, self.type),
+        ]
+        for suffix, labels, value in self._samples():
+            lines.append(
+                "{}{}{} {}".format(self.name, suffix, labels, _format_value(value))
+            )
+        return "\n".join(lines)
+
+
+class _ShardOwner:
+    # lives in a thread's local storage, so it goes away with the thread
+    __slots__ = ("__weakref__",)
+
+
+class _ShardedMetric(_Metric):
+    # Every thread writes to its own dict, so recording a sample never
+    # takes a lock that other threads contend for. The lock below is
+    # only taken once per thread (to register its shard), when the thread
+    # exits and on scrape.
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._local = threading.local()
+        # id: shard of a live thread
+        self._shards = {}
+        # what the threads that exited recorded
+        self._base = {}
+        self._lock = threading.Lock()
+
+    def _shard(self):
+        try:
+            return self._local.values
+        except AttributeError:
+            values = self._local.values = {}
+            owner = self._local.owner = _ShardOwner()
+            with self._lock:
+                self._shards[id(values)] = values
+            # short lived threads, like those of run_async, would
+            # otherwise leave a shard behind each
+            weakref.finalize(owner, self._retire, values).atexit = False
+            return values
+
+    def _retire(self, values):
+        with self._lock:
+            del self._shards[id(values)]
+            for key, value in values.items():
+                previous = self._base.get(key)
+                self._base[key] = (
+                    value if previous is None else self._combine(previous, value)
+                )
+
+    def _combine(self, a, b):
+        raise NotImplementedError
+
+    def _collect(self):
+        with self._lock:
+            # retired values are replaced, never changed, so a copy of the
+            # base is stable
+            shards = [list(self._base.items())]
+            shards.extend(list(shard.items()) for shard in self._shards.values())
+        return shards
+
+
+class Counter(_ShardedMetric):
+    """A monotonically increasing value."""
+
+    type = "counter"
+
+    def inc(self, *labelvalues, amount=1):
+        shard = self._shard()
+        shard[labelvalues] = shard.get(labelvalues, 0) + amount
+
+    def value(self, *labelvalues):
+        return sum(dict(items).get(labelvalues, 0) for items in self._collect())
+
+    def _combine(self, a, b):
+        return a + b
+
+    def _samples(self):
+        totals = {}
+        for items in self._collect():
+            for key, value in items:
+                totals[key] = totals.get(key, 0) + value
+
+        for key in sorted(totals):
+            yield "", _format_labels(self.labelnames, key), totals[key]
+
+
+class Histogram(_ShardedMetric):
+    """Counts observations in cumulative buckets."""
+
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, *labelvalues):
+        shard = self._shard()
+        state = shard.get(labelvalues)
+        if state is None:
+            # [bucket counts..., +Inf count], sum
+            state = shard[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0]
+        state[0][bisect.bisect_left(self.buckets, value)] += 1
+        state[1] += value
+
+    def _combine(self, a, b):
+        return [[x + y for x, y in zip(a[0], b[0])], a[1] + b[1]]
+
+    def _merged(self):
+        merged = {}
+        for items in self._collect():
+            for key, (counts, total) in items:
+                into = merged.setdefault(key, [[0] * len(counts), 0.0])
+                for i, count in enumerate(counts):
+                    into[0][i] += count
+                into[1] += total
+        return merged
+
+    def count(self, *labelvalues):
+        state = self._merged().get(labelvalues)
+        return sum(state[0]) if state else 0
+
+    def _samples(self):
+        merged = self._merged()
+        for key in sorted(merged):
+            counts, total = merged[key]
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = ("le", _format_value(bound))
+                yield "_bucket", _format_labels(self.labelnames, key, le), cumulative
+            yield "_sum", _format_labels(self.labelnames, key), total
+            yield "_count", _format_labels(self.labelnames, key), cumulative
+
+
+class Gauge(_Metric):
+    """A value that can go up and down. Setting it is a single dict store."""
+
+    type = "gauge"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+
+    def set(self, value, *labelvalues):
+        self._values[labelvalues] = value
+
+    def value(self, *labelvalues):
+        return self._values.get(labelvalues, 0)
+
+    def _samples(self):
+        values = dict(self._values)
+        for key in sorted(values):
+            yield "", _format_labels(self.labelnames, key), values[key]
+
+
+class MetricsRegistry:
+    """A collection of metrics that can be rendered in the Prometheus text format."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            elif type(metric) is not cls:
+                raise ValueError(
+                    "Metric {!r} already exists as a {}".format(name, metric.type)
+                )
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._get_or_create(Counter, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._get_or_create(Histogram, name, documentation, labelnames, buckets)
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._get_or_create(Gauge, name, documentation, labelnames)
+
+    def get(self, name):
+        return self._metrics.get(name)
+
+    def render(self):
+        """Returns every metric in the Prometheus text exposition format."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+class CommandMetrics:
+    """The metrics recorded around every command invocation."""
+
+    STAGES = ("parse", "checks", "cooldown", "before_hooks", "callback", "after_hooks")
+
+    def __init__(self, registry):
+        self.invocations = registry.counter(
+            "telegram_commands_invocations_total",
+            "Number of command invocations, without the ones shed under overload.",
+            ("command",),
+        )
+        self.errors = registry.counter(
+            "telegram_commands_errors_total",
+            "Number of command invocations that raised, by exception type.",
+            ("command", "error"),
+        )
+        self.stage_seconds = registry.histogram(
+            "telegram_commands_stage_seconds",
+            "Time spent in each stage of a command invocation.",
+            ("command", "stage"),
+        )
+        self.duplicates = registry.counter(
+            "telegram_commands_duplicates_total",
+            "Redelivered updates that were dropped instead of invoking the "
+            "command again. The drop rate is this over this plus invocations.",
+            ("command",),
+        )
+        self.shed = registry.counter(
+            "telegram_commands_shed_total",
+            "Invocations rejected by the admission controller under overload.",
+            ("command",),
+        )
+        self.timeouts = registry.counter(
+            "telegram_commands_timeouts_total",
+            "Invocations that ran longer than the command's timeout.",
+            ("command",),
+        )
+        self.coalesced = registry.counter(
+            "telegram_commands_coalesced_total",
+            "Invocations that shared the callback of an identical one.",
+            ("command",),
+        )
+        self.cache_requests = registry.counter(
+            "telegram_commands_cache_requests_total",
+            "Lookups in the result cache of commands, by result.",
+            ("command", "result"),
+        )
+
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+
+        body = self.server.registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MetricsServer:
+    """A small HTTP server exposing a :class:`MetricsRegistry` on ``/metrics``."""
+
+    def __init__(self, registry, host="127.0.0.1", port=9090):
+        self._server = ThreadingHTTPServer((host, port), _MetricsRequestHandler)
+        self._server.daemon_threads = True
+        self._server.registry = registry
+        self._thread = None
+
+    @property
+    def address(self):
+        return self._server.server_address
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name="MetricsServer", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
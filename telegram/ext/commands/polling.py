@@ -0,0 +1,287 @@
+import time
+import logging
+import threading
+import functools
+
+from telegram import Update
+from telegram.error import InvalidToken, RetryAfter, TelegramError, TimedOut
+
+from .metrics import MetricsRegistry
+from .admission import PriorityUpdateQueue
+
+log = logging.getLogger(__name__)
+
+BATCH_SIZE_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+
+class _AckQueue(PriorityUpdateQueue):
+    # The dispatcher is the only consumer: it get()s an update, processes
+    # it and then calls task_done(), so the item passed to task_done() is
+    # always the last one taken.
+
+    def __init__(self, on_done, priority_of=None):
+        super().__init__(priority_of)
+        self._on_done = on_done
+        self._current = None
+        self._deferred = False
+
+    def get(self, block=True, timeout=None):
+        item = super().get(block, timeout)
+        self._current = item
+        return item
+
+    def task_done(self):
+        item, self._current = self._current, None
+        deferred, self._deferred = self._deferred, False
+        super().task_done()
+        if isinstance(item, Update) and not deferred:
+            self._on_done(item)
+
+    def defer(self, update):
+        """Holds back the report for the update being processed.
+
+        For updates handed on to an :class:`AdaptiveExecutor`. Returns the
+        function that reports it, or ``None`` if ``update`` did not come
+        from this queue.
+        """
+        if update is not self._current:
+            return None
+        self._deferred = True
+        return functools.partial(self._on_done, update)
+
+
+class PipelinedPoller:
+    """Long polls ``getUpdates`` while the dispatcher works on earlier updates.
+
+    :meth:`telegram.ext.Updater.start_polling` confirms a batch as soon as it
+    is queued, so whatever is still queued when the process dies is lost.
+    This poller only advances the offset past updates the dispatcher has
+    finished with. Until then Telegram keeps returning them, and they are
+    skipped by id.
+
+    The requests adapt to the load. The next request is sent once the
+    backlog of unprocessed updates is down to what the dispatcher gets
+    through in about two round trips, so new updates arrive before it runs
+    dry without the backlog being fetched again and again. While updates
+    are still being processed or the last batch was full, ``timeout`` drops
+    to 0 since more work is known to be waiting. The backlog that comes back
+    again counts against ``limit``, so a request never takes more than
+    ``max_backlog`` minus the backlog in new updates.
+
+    Round trip times, batch sizes and the backlog are recorded in
+    ``metrics``. Usually created through :meth:`Bot.run` with
+    ``mode="pipelined"``.
+
+    Parameters
+    -----------
+    api: :class:`telegram.Bot`
+        The bot to call ``getUpdates`` with.
+    deliver: Optional[Callable[[:class:`telegram.Update`], None]]
+        Hands a new update off for processing. Whoever processes it reports
+        back with :meth:`done`. Set by :meth:`install`.
+    metrics: Optional[:class:`MetricsRegistry`]
+        Where to record the polling metrics.
+    timeout: :class:`int`
+        The long polling timeout used when there is nothing to do, in seconds.
+    max_backlog: :class:`int`
+        How many updates may wait for the dispatcher. At most 100, the
+        largest ``limit`` Telegram accepts.
+    allowed_updates: Optional[List[:class:`str`]]
+        Passed to ``getUpdates``.
+    """
+
+    def __init__(
+        self,
+        api,
+        *,
+        deliver=None,
+        metrics=None,
+        timeout=10,
+        max_backlog=100,
+        allowed_updates=None,
+    ):
+        self.api = api
+        self.deliver = deliver
+        self.timeout = timeout
+        self.max_backlog = min(max_backlog, 100)
+        self.allowed_updates = allowed_updates
+        # highest update_id delivered, and the ids that are not done yet.
+        # Updates may finish out of order, the offset stops at the oldest.
+        self._received = 0
+        self._pending = set()
+        self._done_count = 0
+        # moving averages of the dispatch rate and the round trip time
+        self._rate = 0.0
+        self._round_trip = 0.0
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = None
+
+        metrics = metrics if metrics is not None else MetricsRegistry()
+        self._rtt = metrics.histogram(
+            "telegram_commands_poll_seconds", "Round trip time of getUpdates."
+        )
+        self._batch_sizes = metrics.histogram(
+            "telegram_commands_poll_batch_size",
+            "New updates returned by each getUpdates.",
+            buckets=BATCH_SIZE_BUCKETS,
+        )
+        self._backlog_gauge = metrics.gauge(
+            "telegram_commands_poll_backlog",
+            "Polled updates the dispatcher has not finished yet.",
+        )
+        self._errors = metrics.counter(
+            "telegram_commands_poll_errors_total",
+            "getUpdates requests that failed, by exception type.",
+            ("error",),
+        )
+
+    def install(self, updater):
+        """Swaps the updater's update queue for one that reports finished updates.
+
+        Must be called before the dispatcher is started.
+        """
+        update_queue = _AckQueue(
+            lambda update: self.done(update.update_id),
+            getattr(updater.update_queue, "priority_of", None),
+        )
+        update_queue.on_put = getattr(updater.update_queue, "on_put", None)
+        updater.update_queue = updater.dispatcher.update_queue = update_queue
+        self.deliver = update_queue.put
+
+    def done(self, update_id):
+        """Marks a delivered update as processed."""
+        with self._cond:
+            if update_id not in self._pending:
+                return
+            self._pending.remove(update_id)
+            self._done_count += 1
+            self._backlog_gauge.set(len(self._pending))
+            self._cond.notify_all()
+
+    @property
+    def offset(self):
+        """:class:`int`: The offset confirming every processed update."""
+        with self._cond:
+            if self._pending:
+                return min(self._pending)
+        return self._received + 1 if self._received else None
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="PipelinedPoller", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        with self._cond:
+            self._cond.notify_all()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        self._thread = None
+
+    def commit(self):
+        """Confirms the processed updates to Telegram without fetching new ones.
+
+        :meth:`Bot.stop` calls this once the dispatcher has stopped, so
+        nothing processed is delivered again on the next start.
+        """
+        if self._received:
+            self.api.get_updates(self.offset, limit=1, timeout=0)
+
+    def _low_watermark(self):
+        # enough work to keep the dispatcher busy for two round trips,
+        # at low load this is 0 and the backlog is drained before polling
+        watermark = int(self._rate * self._round_trip * 2)
+        return min(watermark, self.max_backlog // 2)
+
+    def _measure_rate(self, last):
+        now = time.perf_counter()
+        with self._cond:
+            done = self._done_count
+        if last is not None and now > last[0]:
+            rate = (done - last[1]) / (now - last[0])
+            self._rate = rate if not self._rate else 0.8 * self._rate + 0.2 * rate
+        return now, done
+
+    def _run(self):
+        interval = 0
+        busy = False
+        last = None
+        while not self._stop.is_set():
+            if interval:
+                self._stop.wait(interval)
+
+            last = self._measure_rate(last)
+            watermark = self._low_watermark()
+            with self._cond:
+                # the dispatcher has enough to do, poll when it is about to run out
+                self._cond.wait_for(
+                    lambda: len(self._pending) <= watermark or self._stop.is_set(),
+                    1.0,
+                )
+                backlog = len(self._pending)
+                if backlog > watermark:
+                    continue
+                done = self._done_count
+
+            try:
+                new = self._poll(0 if backlog or busy else self.timeout)
+            except RetryAfter as exc:
+                self._errors.inc(type(exc).__name__)
+                interval = exc.retry_after + 0.5
+                continue
+            except TimedOut:
+                interval = 0
+                continue
+            except InvalidToken:
+                log.error("Invalid token, stopping the poller")
+                return
+            except TelegramError as exc:
+                self._errors.inc(type(exc).__name__)
+                log.error("Error while getting updates: %s", exc)
+                interval = min(30.0, interval * 1.5 or 1.0)
+                continue
+
+            interval = 0
+            busy = new >= self.max_backlog - backlog
+            if not new and backlog:
+                # only the backlog came back, wait for the dispatcher
+                with self._cond:
+                    self._cond.wait_for(
+                        lambda: self._done_count != done or self._stop.is_set(), 1.0
+                    )
+
+    def _poll(self, timeout):
+        started = time.perf_counter()
+        updates = self.api.get_updates(
+            self.offset,
+            limit=self.max_backlog,
+            timeout=timeout,
+            allowed_updates=self.allowed_updates,
+        )
+        round_trip = time.perf_counter() - started
+        self._rtt.observe(round_trip)
+        if not timeout:
+            # long polls wait for updates, only short ones measure the network
+            self._round_trip = (
+                round_trip
+                if not self._round_trip
+                else 0.8 * self._round_trip + 0.2 * round_trip
+            )
+
+        new = 0
+        for update in updates:
+            if update.update_id <= self._received or self._stop.is_set():
+                continue
+            self._received = update.update_id
+            new += 1
+            with self._cond:
+                self._pending.add(update.update_id)
+                self._backlog_gauge.set(len(self._pending))
+            self.deliver(update)
+
+        self._batch_sizes.observe(new)
+        return new
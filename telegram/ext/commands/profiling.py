@@ -0,0 +1,392 @@
+import io
+import sys
+import json
+import time
+import random
+import threading
+import contextlib
+import collections
+import tracemalloc
+
+from .cog import Cog
+from .core import command, is_owner
+
+
+def _runs_commands(thread):
+    # the dispatcher, named by the Updater or Bot, and the
+    # threads of the executor and the watchdog
+    name = thread.name
+    return (
+        name == "Dispatcher"
+        or name.endswith(":dispatcher")
+        or name.startswith(("CommandExecutor-", "CommandWorker-"))
+    )
+
+
+def _frame_label(frame):
+    # no line number, so the samples of a function collapse into one frame
+    code = frame.f_code
+    return "{} ({})".format(code.co_name, code.co_filename)
+
+
+class SamplingProfiler:
+    """A low overhead statistical profiler.
+
+    A background thread wakes up every ``interval`` seconds, grabs the
+    current stack of every profiled thread with :func:`sys._current_frames`
+    and counts identical stacks. Nothing is installed in the profiled
+    threads themselves, so the overhead is bounded by the sampling rate.
+
+    Parameters
+    -----------
+    interval: :class:`float`
+        Seconds between two samples.
+    thread_filter: Optional[Callable[[:class:`threading.Thread`], :class:`bool`]]
+        Decides which threads are sampled. Defaults to every thread but
+        the profiler's own.
+    """
+
+    def __init__(self, interval=0.005, *, thread_filter=None):
+        self.interval = interval
+        self.thread_filter = thread_filter
+        self.samples = collections.Counter()
+        self.started_at = None
+        self.stopped_at = None
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        with self._lock:
+            if self.running:
+                raise RuntimeError("The profiler is already running")
+
+            self.samples.clear()
+            self.started_at = time.time()
+            self.stopped_at = None
+            self._stop.clear()
+            self._thread = threading.Thread(
+                target=self._run, name="SamplingProfiler", daemon=True
+            )
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        self.stopped_at = time.time()
+
+    def _profiled_threads(self):
+        own = threading.get_ident()
+        threads = {}
+        for thread in threading.enumerate():
+            if thread.ident == own:
+                continue
+            if self.thread_filter is None or self.thread_filter(thread):
+                threads[thread.ident] = thread.name
+        return threads
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            threads = self._profiled_threads()
+            for ident, frame in sys._current_frames().items():
+                name = threads.get(ident)
+                if name is None:
+                    continue
+
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                stack.append(name)
+                stack.reverse()
+                self.samples[";".join(stack)] += 1
+
+    def collapsed(self):
+        """Returns the samples in the collapsed stack format.
+
+        Every line is a ``;`` separated stack, root first, followed by
+        a space and the number of samples. This is what ``flamegraph.pl``
+        and speedscope expect.
+        """
+        samples = self.samples.copy()
+        return "".join(
+            "{} {}\n".format(stack, count) for stack, count in sorted(samples.items())
+        )
+
+
+class AllocationProfiler:
+    """Measures what command callbacks allocate, using :mod:`tracemalloc`.
+
+    A command is measured when it was created with ``trace_allocations=True``,
+    when its name is in :attr:`commands`, or otherwise with probability
+    ``sample_rate``. Only one invocation is measured at a time and the others
+    run untouched, so the overhead is bounded no matter the traffic. The
+    invocations that were due but skipped for that are counted, see
+    :meth:`skipped`.
+
+    Unless :mod:`tracemalloc` is already tracing, it is only started for the
+    duration of a measured callback. What is still allocated when the callback
+    returns is its net allocation. Allocations made by other threads during
+    that window are counted as well, so numbers are most precise at low load.
+
+    Set an instance as :attr:`Bot.allocation_profiler` to enable it.
+
+    Parameters
+    -----------
+    sample_rate: :class:`float`
+        The fraction of all invocations to measure, between 0 and 1.
+    commands: Iterable[:class:`str`]
+        Names of the commands that are measured on every invocation.
+    frames: :class:`int`
+        How many frames of traceback to store per allocation.
+    """
+
+    def __init__(self, sample_rate=0.0, *, commands=(), frames=1):
+        self.sample_rate = sample_rate
+        self.commands = set(commands)
+        self.frames = frames
+        # command_name: [samples, net bytes]
+        self._totals = {}
+        # command_name: {(filename, lineno): net bytes}
+        self._lines = {}
+        # command_name: invocations not measured while another one was
+        self._skipped = collections.Counter()
+        self._busy = threading.Lock()
+        self._lock = threading.Lock()
+
+    def should_sample(self, command):
+        if command.trace_allocations or command.qualified_name in self.commands:
+            return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    @contextlib.contextmanager
+    def measure(self, command_name):
+        """Context manager that measures the allocations of the enclosed block."""
+        if not self._busy.acquire(blocking=False):
+            # someone else is being measured, skip this one
+            with self._lock:
+                self._skipped[command_name] += 1
+            yield
+            return
+
+        try:
+            owned = not tracemalloc.is_tracing()
+            if owned:
+                tracemalloc.start(self.frames)
+                before = None
+            else:
+                before = tracemalloc.take_snapshot()
+
+            try:
+                yield
+            finally:
+                after = tracemalloc.take_snapshot()
+                if owned:
+                    tracemalloc.stop()
+                self._record(command_name, before, after)
+        finally:
+            self._busy.release()
+
+    def _record(self, command_name, before, after):
+        ignore = [
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+        ]
+        after = after.filter_traces(ignore)
+
+        if before is None:
+            stats = [(s.traceback[0], s.size) for s in after.statistics("lineno")]
+        else:
+            before = before.filter_traces(ignore)
+            stats = [
+                (s.traceback[0], s.size_diff)
+                for s in after.compare_to(before, "lineno")
+            ]
+
+        with self._lock:
+            totals = self._totals.setdefault(command_name, [0, 0])
+            lines = self._lines.setdefault(command_name, collections.Counter())
+            totals[0] += 1
+            for frame, size in stats:
+                totals[1] += size
+                lines[(frame.filename, frame.lineno)] += size
+
+    def reset(self):
+        with self._lock:
+            self._totals.clear()
+            self._lines.clear()
+            self._skipped.clear()
+
+    def totals(self):
+        """Returns a dict mapping command names to ``(samples, net_bytes)``."""
+        with self._lock:
+            return {name: tuple(value) for name, value in self._totals.items()}
+
+    def skipped(self):
+        """Returns a dict mapping command names to the number of invocations
+        that were due to be measured but ran while another one was."""
+        with self._lock:
+            return dict(self._skipped)
+
+    def top_lines(self, command_name=None, limit=10):
+        """Returns the source lines with the largest net allocations.
+
+        Each entry is a ``(command_name, filename, lineno, net_bytes)`` tuple.
+        """
+        with self._lock:
+            entries = [
+                (name, filename, lineno, size)
+                for name, lines in self._lines.items()
+                if command_name is None or name == command_name
+                for (filename, lineno), size in lines.items()
+            ]
+        entries.sort(key=lambda e: e[3], reverse=True)
+        return entries[:limit]
+
+    def dump(self):
+        """Returns everything collected so far as a JSON string."""
+        with self._lock:
+            data = {
+                name: {
+                    "samples": self._totals[name][0],
+                    "net_bytes": self._totals[name][1],
+                    "lines": [
+                        {"filename": f, "lineno": l, "net_bytes": size}
+                        for (f, l), size in lines.most_common()
+                    ],
+                }
+                for name, lines in self._lines.items()
+            }
+            for name, skipped in self._skipped.items():
+                data.setdefault(name, {"samples": 0, "net_bytes": 0, "lines": []})
+                data[name]["skipped"] = skipped
+        return json.dumps(data, indent=2)
+
+
+class Profiling(Cog, command_attrs=dict(hidden=True)):
+    """Owner only commands to profile the bot while it is running.
+
+    Add it with ``bot.add_cog(commands.Profiling())``. Only the threads
+    that run commands are sampled, the idle stacks of the updater, job
+    queue and servers would swamp the result. Pass ``thread_filter=None``
+    to sample every thread. A profile runs for at most ``max_seconds``.
+    """
+
+    def __init__(
+        self, *, interval=0.005, thread_filter=_runs_commands, max_seconds=600.0
+    ):
+        self.profiler = SamplingProfiler(interval, thread_filter=thread_filter)
+        self.max_seconds = max_seconds
+        self._timer = None
+        self._ctx = None
+        self._lock = threading.Lock()
+
+    def cog_unload(self):
+        if self._timer is not None:
+            self._timer.cancel()
+        if self.profiler.running:
+            self.profiler.stop()
+
+    def _finish(self):
+        # the timer and profile_stop may race to get here
+        with self._lock:
+            ctx, self._ctx = self._ctx, None
+            self._timer = None
+            if ctx is None:
+                return
+            self.profiler.stop()
+
+        data = self.profiler.collapsed()
+        duration = self.profiler.stopped_at - self.profiler.started_at
+        total = sum(self.profiler.samples.values())
+        ctx.send(
+            "Profiled for {:.1f}s, {} samples.".format(duration, total),
+            document=io.BytesIO(data.encode("utf-8")),
+            filename="profile.collapsed.txt",
+        )
+
+    @command(name="profile", usage="[seconds=30]")
+    @is_owner()
+    def profile(self, ctx, seconds: float = 30.0):
+        """Samples the command threads for a number of seconds and sends the result.
+
+        The result is a collapsed stack file that can be turned into a flame graph.
+        """
+        # also rejects nan
+        if not 0 < seconds <= self.max_seconds:
+            return ctx.send(
+                "Seconds must be more than 0 and at most {:g}.".format(self.max_seconds)
+            )
+
+        # checked and started under the lock, so two
+        # invocations at once can not both start it
+        with self._lock:
+            if self.profiler.running:
+                return ctx.send("The profiler is already running.")
+
+            self._ctx = ctx
+            self.profiler.start()
+            self._timer = threading.Timer(seconds, self._finish)
+            self._timer.daemon = True
+            self._timer.start()
+        ctx.send("Profiling for {:g} seconds.".format(seconds))
+
+    @command(name="profile_stop")
+    @is_owner()
+    def profile_stop(self, ctx):
+        """Stops the running profiler early and sends the result."""
+        if not self.profiler.running:
+            return ctx.send("The profiler is not running.")
+
+        timer = self._timer
+        if timer is not None:
+            timer.cancel()
+        self._finish()
+
+    @command(name="allocs", usage="[command]")
+    @is_owner()
+    def allocs(self, ctx, command_name=None):
+        """Shows the source lines that allocated the most memory, per command."""
+        profiler = ctx.bot.allocation_profiler
+        if profiler is None:
+            return ctx.send("Allocation profiling is not enabled.")
+
+        totals = profiler.totals()
+        skipped = profiler.skipped()
+        if command_name is not None:
+            totals = {k: v for k, v in totals.items() if k == command_name}
+        if not totals:
+            return ctx.send("No allocations have been recorded yet.")
+
+        lines = []
+        for name, (samples, size) in sorted(
+            totals.items(), key=lambda item: item[1][1], reverse=True
+        ):
+            line = "/{}: {} bytes net over {} samples".format(name, size, samples)
+            if skipped.get(name):
+                line += ", {} skipped while busy".format(skipped[name])
+            lines.append(line)
+
+        lines.append("")
+        for name, filename, lineno, size in profiler.top_lines(command_name):
+            lines.append("{} bytes - /{} {}:{}".format(size, name, filename, lineno))
+
+        ctx.send("\n".join(lines))
+
+    @command(name="allocs_dump")
+    @is_owner()
+    def allocs_dump(self, ctx):
+        """Sends everything the allocation profiler has collected as JSON."""
+        profiler = ctx.bot.allocation_profiler
+        if profiler is None:
+            return ctx.send("Allocation profiling is not enabled.")
+
+        ctx.send(
+            document=io.BytesIO(profiler.dump().encode("utf-8")),
+            filename="allocations.json",
+        )
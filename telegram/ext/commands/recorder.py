@@ -0,0 +1,138 @@
+import gzip
+import json
+import time
+import queue
+import threading
+
+from telegram import Update
+
+# keys of objects that can identify a person, replaced when anonymizing
+_PERSONAL_KEYS = ("first_name", "last_name", "username", "title", "phone_number")
+
+
+class _Anonymizer:
+    # Users and chats keep distinct, stable pseudonymous ids for the whole
+    # recording, so per chat behaviour (cooldowns, dedup, sharding) replays
+    # the same. Message text is kept, it is what the recording is for.
+
+    def __init__(self):
+        self._ids = {}
+        self._lock = threading.Lock()
+
+    def _pseudonym(self, value):
+        if not isinstance(value, int):
+            return value
+        with self._lock:
+            try:
+                return self._ids[value]
+            except KeyError:
+                pseudonym = len(self._ids) + 1
+                # negative ids are groups and channels
+                pseudonym = self._ids[value] = -pseudonym if value < 0 else pseudonym
+                return pseudonym
+
+    def __call__(self, data):
+        if isinstance(data, list):
+            return [self(item) for item in data]
+        if not isinstance(data, dict):
+            return data
+
+        result = {}
+        # users have is_bot, chats have type
+        identity = "is_bot" in data or "type" in data and "id" in data
+        for key, value in data.items():
+            if identity and key == "id" or key == "user_id":
+                result[key] = self._pseudonym(value)
+            elif key in _PERSONAL_KEYS and isinstance(value, str):
+                result[key] = "{}{}".format(key, self._pseudonym(data.get("id")))
+            else:
+                result[key] = self(value)
+        return result
+
+
+class UpdateRecorder:
+    """Appends incoming updates to a gzip compressed JSON lines file.
+
+    Every line is ``{"time": <unix time>, "update": <update JSON>}`` so that
+    a recording can be replayed with its original timing, see
+    :func:`read_recording`. Updates should be recorded as they arrive, not
+    when they are processed, which compresses the gaps under a backlog and
+    may reorder them. :meth:`record` only timestamps and queues the update,
+    a writer thread serializes, anonymizes and compresses it, so recording
+    does not slow down the threads that receive updates.
+
+    Usually created through :meth:`Bot.record_updates`.
+
+    Parameters
+    -----------
+    path: :class:`str`
+        The file to append to. Appending to an existing recording adds
+        another gzip member, which readers handle transparently.
+    anonymize: :class:`bool`
+        Whether to replace user and chat ids with stable pseudonyms and
+        drop names, usernames and phone numbers. Message text is kept.
+    """
+
+    def __init__(self, path, *, anonymize=False):
+        self.path = path
+        self.anonymize = anonymize
+        self.count = 0
+        self._anonymizer = _Anonymizer() if anonymize else None
+        self._file = gzip.open(path, "at", encoding="utf-8")
+        # (time, update), an Event to flush, or None to stop
+        self._queue = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._writer = threading.Thread(
+            target=self._write, name="UpdateRecorder", daemon=True
+        )
+        self._writer.start()
+
+    def record(self, update):
+        if isinstance(update, Update) and self._file is not None:
+            self._queue.put((time.time(), update))
+
+    def _write(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            if isinstance(item, threading.Event):
+                self._file.flush()
+                item.set()
+                continue
+
+            recorded, update = item
+            data = update.to_dict()
+            if self._anonymizer is not None:
+                data = self._anonymizer(data)
+
+            line = json.dumps({"time": recorded, "update": data}, ensure_ascii=False)
+            self._file.write(line + "\n")
+            self.count += 1
+
+    def flush(self):
+        """Waits until the updates recorded so far are written."""
+        with self._lock:
+            if self._file is None:
+                return
+            flushed = threading.Event()
+            self._queue.put(flushed)
+        flushed.wait()
+
+    def close(self):
+        with self._lock:
+            if self._file is None:
+                return
+            self._queue.put(None)
+            self._writer.join()
+            self._file.close()
+            self._file = None
+
+
+def read_recording(path):
+    """Yields ``(time, update_json)`` for every update in a recording."""
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                entry = json.loads(line)
+                yield entry["time"], entry["update"]
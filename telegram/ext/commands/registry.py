@@ -0,0 +1,293 @@
+import threading
+import functools
+import contextlib
+import collections
+from types import MappingProxyType
+
+from telegram import MessageEntity, Update
+from telegram.ext import Handler
+
+from .executor import _update_key
+
+
+def _parse_command_name(update):
+    """Returns the lowercased command name of an update or ``None``.
+
+    This mirrors the parsing done by :meth:`telegram.ext.CommandHandler.check_update`.
+    """
+    if not isinstance(update, Update):
+        return None
+
+    message = update.effective_message
+    if message is None or not message.text or not message.entities:
+        return None
+
+    entity = message.entities[0]
+    if entity.type != MessageEntity.BOT_COMMAND or entity.offset != 0:
+        return None
+
+    return message.text[1 : entity.length].split("@")[0].lower()
+
+
+class RegistrySnapshot:
+    """An immutable view of the commands, handlers and cogs of a bot.
+
+    A snapshot is never modified after it has been published. Writers copy
+    it into a :class:`RegistryDraft`, change the draft and publish a new
+    snapshot by replacing the reference on the bot, so readers always see
+    a consistent state with a single attribute read and no locking.
+    """
+
+    __slots__ = ("commands", "handlers", "cogs")
+
+    def __init__(self, commands=None, handlers=None, cogs=None):
+        # name: command
+        self.commands = MappingProxyType(dict(commands or {}))
+        # command_name: handler
+        self.handlers = MappingProxyType(dict(handlers or {}))
+        # cog_name: cog
+        self.cogs = MappingProxyType(dict(cogs or {}))
+
+    def draft(self):
+        return RegistryDraft(self.commands, self.handlers, self.cogs)
+
+
+class RegistryDraft:
+    """A private, mutable copy of a :class:`RegistrySnapshot`."""
+
+    __slots__ = ("commands", "handlers", "cogs")
+
+    def __init__(self, commands, handlers, cogs):
+        self.commands = dict(commands)
+        self.handlers = dict(handlers)
+        self.cogs = dict(cogs)
+
+    def freeze(self):
+        return RegistrySnapshot(self.commands, self.handlers, self.cogs)
+
+
+class InflightTracker:
+    """Counts the invocations that are currently running, per callback."""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._counts = collections.Counter()
+        self.total = 0
+
+    def begin(self, key):
+        with self._cond:
+            self._counts[key] += 1
+            self.total += 1
+
+    def end(self, key):
+        with self._cond:
+            self.total -= 1
+            self._counts[key] -= 1
+            if not self._counts[key]:
+                del self._counts[key]
+            self._cond.notify_all()
+
+    @contextlib.contextmanager
+    def track(self, key):
+        self.begin(key)
+        try:
+            yield
+        finally:
+            self.end(key)
+
+    def count(self, keys=None):
+        """Returns how many invocations of ``keys`` (or of anything) are running."""
+        with self._cond:
+            if keys is None:
+                return self.total
+            return sum(self._counts.get(key, 0) for key in keys)
+
+    def wait(self, keys=None, timeout=None):
+        """Waits until no invocation of ``keys`` (or of anything) is running.
+
+        Returns ``False`` if ``timeout`` expired first.
+        """
+        with self._cond:
+            if keys is None:
+                return self._cond.wait_for(lambda: not self.total, timeout)
+
+            keys = list(keys)
+            return self._cond.wait_for(
+                lambda: not any(key in self._counts for key in keys), timeout
+            )
+
+
+class UpdateDeduplicator:
+    """Remembers the ids of the last ``window`` updates to spot redeliveries.
+
+    Telegram delivers an update again when a webhook request fails or the
+    offset was not confirmed before a restart. The ids are kept in a ring
+    buffer, for a fixed amount of memory, and a set, so a lookup does not
+    depend on the window size.
+
+    With a shared ``state`` backend, an id that is not in the ring is also
+    looked up in the backend, where :meth:`complete` marks it for ``ttl``
+    seconds once its command ran. That catches redeliveries after a
+    restart, or when another process handled the first delivery. Ids are
+    only marked once the command ran, so an update that was cancelled or
+    lost with a crashed process still runs when it is delivered again.
+
+    An update whose command was cancelled or failed is :meth:`forget`-ten
+    again, so its redelivery runs the command.
+    """
+
+    __slots__ = ("window", "state", "ttl", "_ring", "_seen", "_next", "_lock")
+
+    def __init__(self, window=1024, *, state=None, ttl=600.0):
+        if window < 1:
+            raise ValueError("window must be at least 1")
+
+        self.window = window
+        self.state = state
+        self.ttl = ttl
+        self._ring = [None] * window
+        self._seen = set()
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._seen)
+
+    def _remember(self, update_id):
+        evicted = self._ring[self._next]
+        if evicted is not None:
+            self._seen.discard(evicted)
+        self._ring[self._next] = update_id
+        self._seen.add(update_id)
+        self._next = (self._next + 1) % self.window
+
+    def check(self, update_id):
+        """Records ``update_id``. Returns ``False`` if it was already seen."""
+        with self._lock:
+            if update_id in self._seen:
+                return False
+
+        completed = (
+            self.state is not None
+            and self.state.get("update:{}".format(update_id)) is not None
+        )
+
+        with self._lock:
+            # a concurrent delivery may have been recorded meanwhile
+            if update_id in self._seen:
+                return False
+            self._remember(update_id)
+        return not completed
+
+    def complete(self, update_id):
+        """Marks ``update_id`` as handled in the ``state`` backend, if any."""
+        if self.state is not None:
+            self.state.set("update:{}".format(update_id), 1, self.ttl)
+
+    def forget(self, update_id):
+        """Drops ``update_id``, so its next delivery is not a duplicate."""
+        with self._lock:
+            if update_id in self._seen:
+                self._seen.discard(update_id)
+                # its slot would otherwise evict a later delivery of it
+                self._ring[self._ring.index(update_id)] = None
+
+
+class RegistryHandler(Handler):
+    """The single handler a bot adds to its dispatcher.
+
+    It looks the command up in the bot's current registry snapshot and
+    delegates to the :class:`telegram.ext.CommandHandler` registered for
+    it, so adding and removing commands never touches the dispatcher's
+    own handler lists.
+    """
+
+    __slots__ = ("bot",)
+
+    def __init__(self, bot):
+        super().__init__(self._unused_callback)
+        self.bot = bot
+
+    @staticmethod
+    def _unused_callback(update, context):
+        raise RuntimeError("RegistryHandler delegates to the command's handler")
+
+    def check_update(self, update):
+        name = _parse_command_name(update)
+        if name is None:
+            return None
+
+        handler = self.bot._registry.handlers.get(name)
+        if handler is None:
+            return None
+
+        check = handler.check_update(update)
+        if check is None or check is False:
+            return check
+
+        deduplicator = self.bot.deduplicator
+        if deduplicator is not None and not deduplicator.check(update.update_id):
+            self.bot._command_metrics.duplicates.inc(name)
+            return None
+
+        return handler, check
+
+    def _settle(self, update, ran):
+        # a failed or cancelled update runs again when it is redelivered
+        deduplicator = self.bot.deduplicator
+        if deduplicator is None:
+            return
+        if ran:
+            deduplicator.complete(update.update_id)
+        else:
+            deduplicator.forget(update.update_id)
+
+    def handle_update(self, update, dispatcher, check_result, context):
+        handler, check = check_result
+        executor = self.bot.executor
+        if executor is None:
+            with self.bot._inflight.track(handler.callback):
+                try:
+                    result = handler.handle_update(update, dispatcher, check, context)
+                except Exception:
+                    self._settle(update, False)
+                    raise
+                self._settle(update, not getattr(context, "command_failed", False))
+                return result
+
+        # queued invocations count as in flight, so unloading an
+        # extension waits for them too
+        self.bot._inflight.begin(handler.callback)
+        # the update is only done once the command ran, see _AckQueue.defer
+        defer = getattr(dispatcher.update_queue, "defer", None)
+        acknowledge = defer(update) if defer is not None else None
+
+        errors = []
+
+        def done():
+            ran = not errors and not getattr(context, "command_failed", False)
+            self._settle(update, ran)
+            self.bot._inflight.end(handler.callback)
+            if acknowledge is not None:
+                acknowledge()
+
+        def failed(exc):
+            errors.append(exc)
+            dispatcher.dispatch_error(update, exc)
+
+        def cancelled():
+            self._settle(update, False)
+            self.bot._inflight.end(handler.callback)
+
+        executor.submit(
+            _update_key(update),
+            functools.partial(
+                handler.handle_update, update, dispatcher, check, context
+            ),
+            # the placeholders of lazy extensions have no priority yet
+            priority=getattr(handler.callback, "priority", 0),
+            on_done=done,
+            on_error=failed,
+            # not acknowledged, so the update is delivered again
+            on_cancel=cancelled,
+        )
@@ -0,0 +1,352 @@
+import time
+import queue
+import signal
+import logging
+import importlib
+import threading
+import collections
+import multiprocessing
+
+import telegram
+from telegram import Update
+
+from .metrics import MetricsRegistry, MetricsServer
+from .polling import PipelinedPoller, _AckQueue
+from .webhook import WebhookServer
+
+log = logging.getLogger(__name__)
+
+
+class SharedRateLimiter:
+    """A token bucket shared by several processes.
+
+    Every Bot API request takes a token. Tokens come back at ``rate`` per
+    second, up to ``burst``. The state lives in shared memory, so all the
+    workers of a :class:`ShardSupervisor` draw from one budget. Pass the
+    ``context`` the workers are started with, see
+    :func:`multiprocessing.get_context`.
+    """
+
+    def __init__(self, rate, burst=None, *, context=multiprocessing):
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1.0, rate)
+        self._lock = context.Lock()
+        self._tokens = context.Value("d", self.burst, lock=False)
+        # time.monotonic is system wide, so it is comparable across processes
+        self._updated = context.Value("d", time.monotonic(), lock=False)
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                tokens = min(
+                    self.burst,
+                    self._tokens.value + (now - self._updated.value) * self.rate,
+                )
+                self._updated.value = now
+                if tokens >= 1:
+                    self._tokens.value = tokens - 1
+                    return
+                self._tokens.value = tokens
+                wait = (1 - tokens) / self.rate
+            time.sleep(wait)
+
+
+class _RateLimitedRequest:
+    # wraps a telegram.utils.request.Request, everything but post() is
+    # passed through as is
+
+    def __init__(self, request, limiter):
+        self._request = request
+        self._limiter = limiter
+
+    def post(self, *args, **kwargs):
+        self._limiter.acquire()
+        return self._request.post(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._request, name)
+
+
+def _resolve_factory(factory):
+    if not isinstance(factory, str):
+        return factory
+    module, _, name = factory.partition(":")
+    return getattr(importlib.import_module(module), name)
+
+
+def _worker_main(shard, factory, inbound, acks, limiter):
+    # Ctrl+C goes to the whole process group, the supervisor decides
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # a spawned process inherits signals the supervisor ignores, and
+    # terminate() must be able to end a worker that is stuck
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGABRT, signal.SIG_DFL)
+
+    bot = _resolve_factory(factory)()
+    api = bot.dispatcher.bot
+    if limiter is not None:
+        # there is no public way to swap the Request of a telegram.Bot
+        api._request = _RateLimitedRequest(api._request, limiter)
+
+    update_queue = _AckQueue(
+        lambda update: acks.put((shard, update.update_id)),
+        getattr(bot.updater.update_queue, "priority_of", None),
+    )
+    update_queue.on_put = getattr(bot.updater.update_queue, "on_put", None)
+    bot.updater.update_queue = bot.dispatcher.update_queue = update_queue
+    bot._start_dispatcher()
+
+    while True:
+        data = inbound.get()
+        if data is None:
+            break
+        update_queue.put(Update.de_json(data, api))
+
+    # the dispatcher finishes what is queued before it stops
+    bot.stop()
+
+
+class _Shard:
+    __slots__ = ("index", "process", "inbound", "pending", "restarts")
+
+    def __init__(self, index):
+        self.index = index
+        self.process = None
+        self.inbound = None
+        # update_id: update JSON, in delivery order
+        self.pending = collections.OrderedDict()
+        self.restarts = 0
+
+
+class ShardSupervisor:
+    """Runs a bot as several worker processes to get around the GIL.
+
+    Every worker calls ``factory`` to build its own :class:`Bot`, so
+    ``factory`` should add the same commands and load the same extensions
+    each time. The supervisor receives the updates, by polling or through a
+    webhook, and routes each one to a worker by its chat id, so the updates
+    of one chat are always handled in order by the same worker.
+
+    The workers share one outbound budget of ``rate_limit`` Bot API requests
+    per second. The supervisor keeps every update until its worker reports
+    it as processed. When a worker dies, it is restarted and receives its
+    unprocessed updates again, so an update that was being handled during a
+    crash may be handled twice. When polling, Telegram is only told about
+    updates that were processed.
+
+    Workers are started with the ``"spawn"`` method, forking the threads of
+    the supervisor is not safe. So ``factory`` must be importable by the new
+    process, and the script that runs the supervisor needs an
+    ``if __name__ == "__main__":`` guard.
+
+    Parameters
+    -----------
+    token: :class:`str`
+        The bot's token, used to receive updates.
+    factory: Union[Callable[[], :class:`Bot`], :class:`str`]
+        Builds the bot of a worker. Use a module level function, or a
+        ``"module:function"`` string, so it can be used from a new process.
+    shards: :class:`int`
+        How many worker processes to run.
+    rate_limit: Optional[:class:`float`]
+        Bot API requests per second for all workers together.
+        ``None`` disables the limit.
+    base_url: Optional[:class:`str`]
+        Passed to :class:`telegram.Bot` for receiving updates.
+    """
+
+    def __init__(self, token, factory, *, shards=2, rate_limit=30.0, base_url=None):
+        self.factory = factory
+        self.api = telegram.Bot(token, base_url=base_url)
+        self._context = multiprocessing.get_context("spawn")
+        self.limiter = (
+            SharedRateLimiter(rate_limit, context=self._context) if rate_limit else None
+        )
+        self.metrics = MetricsRegistry()
+        self.metrics_server = None
+        self.poller = None
+        self.webhook_server = None
+        self._shards = [_Shard(i) for i in range(shards)]
+        self._acks = self._context.Queue()
+        self._intake = queue.Queue()
+        self._intake_thread = None
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._threads = []
+
+        self._pending_gauge = self.metrics.gauge(
+            "telegram_commands_shard_pending",
+            "Routed updates the worker has not processed yet.",
+            ("shard",),
+        )
+        self._routed = self.metrics.counter(
+            "telegram_commands_shard_updates_total",
+            "Updates routed to each worker.",
+            ("shard",),
+        )
+        self._restarts = self.metrics.counter(
+            "telegram_commands_shard_restarts_total",
+            "Workers restarted after they died.",
+            ("shard",),
+        )
+
+    def shard_for(self, update):
+        """Returns the index of the worker that handles ``update``."""
+        chat = update.effective_chat
+        if chat is not None:
+            key = chat.id
+        elif update.effective_user is not None:
+            key = update.effective_user.id
+        else:
+            key = update.update_id
+        return key % len(self._shards)
+
+    def _spawn(self, shard):
+        inbound = self._context.Queue()
+        process = self._context.Process(
+            target=_worker_main,
+            args=(shard.index, self.factory, inbound, self._acks, self.limiter),
+            name="BotShard-{}".format(shard.index),
+            daemon=True,
+        )
+        process.start()
+
+        # hand over what the previous process did not get to. The queue
+        # is swapped in under the same lock, so an update routed meanwhile
+        # either went to the old queue and is replayed here, or is routed
+        # to the new one after the replay, never both
+        with self._lock:
+            shard.process = process
+            shard.inbound = inbound
+            for data in shard.pending.values():
+                inbound.put(data)
+
+    def _route(self, update):
+        shard = self._shards[self.shard_for(update)]
+        data = update.to_dict()
+        with self._lock:
+            shard.pending[update.update_id] = data
+            self._pending_gauge.set(len(shard.pending), str(shard.index))
+            shard.inbound.put(data)
+        self._routed.inc(str(shard.index))
+
+    def _route_intake(self):
+        while True:
+            update = self._intake.get()
+            if update is None:
+                return
+            self._route(update)
+
+    def _receive_acks(self):
+        while True:
+            ack = self._acks.get()
+            if ack is None:
+                return
+
+            index, update_id = ack
+            shard = self._shards[index]
+            with self._lock:
+                shard.pending.pop(update_id, None)
+                self._pending_gauge.set(len(shard.pending), str(index))
+            if self.poller is not None:
+                self.poller.done(update_id)
+
+    def _monitor(self):
+        while not self._stopping.wait(0.5):
+            for shard in self._shards:
+                if shard.process.is_alive() or self._stopping.is_set():
+                    continue
+
+                log.error(
+                    "Shard %d exited with code %s, restarting it with %d pending updates",
+                    shard.index,
+                    shard.process.exitcode,
+                    len(shard.pending),
+                )
+                shard.restarts += 1
+                self._restarts.inc(str(shard.index))
+                self._spawn(shard)
+
+    def _start_thread(self, target, name):
+        thread = threading.Thread(target=target, name=name, daemon=True)
+        thread.start()
+        self._threads.append(thread)
+        return thread
+
+    def start(self, *, mode="pipelined", **kwargs):
+        """Starts the workers and begins receiving updates.
+
+        ``mode`` is ``"pipelined"``, where the keyword arguments are passed
+        to :class:`PipelinedPoller`, or ``"webhook"``, where they are passed
+        to :class:`WebhookServer`.
+        """
+        if mode not in ("pipelined", "webhook"):
+            raise ValueError("mode must be 'pipelined' or 'webhook'")
+
+        for shard in self._shards:
+            self._spawn(shard)
+
+        self._start_thread(self._receive_acks, "ShardAcks")
+        self._start_thread(self._monitor, "ShardMonitor")
+
+        if mode == "pipelined":
+            self.api.delete_webhook()
+            self.poller = PipelinedPoller(
+                self.api, deliver=self._route, metrics=self.metrics, **kwargs
+            )
+            self.poller.start()
+        else:
+            self._intake_thread = self._start_thread(self._route_intake, "ShardIntake")
+            self.webhook_server = WebhookServer(self.api, self._intake, **kwargs)
+            self.webhook_server.start()
+
+    def start_metrics_server(self, port=9090, host="127.0.0.1"):
+        self.metrics_server = MetricsServer(self.metrics, host, port)
+        self.metrics_server.start()
+        return self.metrics_server
+
+    def stop(self, timeout=30.0):
+        """Stops receiving updates and lets the workers finish what they have."""
+        if self.poller is not None:
+            self.poller.stop()
+        if self.webhook_server is not None:
+            self.webhook_server.stop()
+            self._intake.put(None)
+            # updates were already answered with 200, every one of them
+            # must be routed before the workers get their sentinel
+            self._intake_thread.join()
+
+        self._stopping.set()
+        for shard in self._shards:
+            shard.inbound.put(None)
+
+        deadline = time.monotonic() + timeout
+        for shard in self._shards:
+            shard.process.join(max(0.0, deadline - time.monotonic()))
+            if shard.process.is_alive():
+                log.warning("Shard %d did not stop in time", shard.index)
+                shard.process.terminate()
+
+        self._acks.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+        if self.poller is not None:
+            self.poller.commit()
+            self.poller = None
+        if self.metrics_server is not None:
+            self.metrics_server.stop()
+            self.metrics_server = None
+
+    def run(self, *, mode="pipelined", **kwargs):
+        """Starts and blocks until SIGINT, SIGTERM or SIGABRT, then stops."""
+        stop = threading.Event()
+        for signum in (signal.SIGINT, signal.SIGTERM, signal.SIGABRT):
+            signal.signal(signum, lambda *args: stop.set())
+
+        self.start(mode=mode, **kwargs)
+        while not stop.wait(1):
+            pass
+        self.stop()
@@ -0,0 +1,312 @@
+import json
+import time
+import sqlite3
+import threading
+
+# how many executed batches between two sweeps of expired keys
+_SWEEP_EVERY = 1000
+
+
+class Pipeline:
+    """Queues operations and sends them to a backend as one batch.
+
+    Every method returns the pipeline so calls can be chained, and
+    :meth:`execute` returns the results in the order the operations were
+    queued::
+
+        count, ttl = bot.state.pipeline().incr(key, ttl=60).ttl(key).execute()
+
+    Used as a context manager, the batch is executed on exit.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self._ops = []
+
+    def __len__(self):
+        return len(self._ops)
+
+    def _queue(self, op, *args):
+        self._ops.append((op, args))
+        return self
+
+    def get(self, key):
+        return self._queue("get", key)
+
+    def set(self, key, value, ttl=None):
+        return self._queue("set", key, value, ttl)
+
+    def add(self, key, value, ttl=None):
+        return self._queue("add", key, value, ttl)
+
+    def delete(self, key):
+        return self._queue("delete", key)
+
+    def incr(self, key, amount=1, ttl=None):
+        return self._queue("incr", key, amount, ttl)
+
+    def ttl(self, key):
+        return self._queue("ttl", key)
+
+    def execute(self):
+        ops, self._ops = self._ops, []
+        if not ops:
+            return []
+        return self.backend.execute(ops)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.execute()
+
+
+class StateBackend:
+    """The base class of state backends.
+
+    A backend is a key value store with expiring keys, shared by everything
+    that keeps state for a bot: cooldowns, caches, dedup windows. Keys are
+    strings and values anything JSON serializable. Use a backend that is
+    shared between processes when running several of them, like
+    :class:`SQLiteBackend` or one for a networked store.
+
+    Subclasses only implement :meth:`execute`, which receives a whole batch
+    of operations. Each operation is an ``(name, args)`` tuple:
+
+    - ``("get", (key,))``: the value, or ``None``.
+    - ``("set", (key, value, ttl))``: sets the value, returns ``True``.
+    - ``("add", (key, value, ttl))``: sets the value only if the key does
+      not exist, returns whether it did.
+    - ``("delete", (key,))``: returns whether the key existed.
+    - ``("incr", (key, amount, ttl))``: adds to an integer value, starting
+      from 0, and returns the new value. ``ttl`` only applies when the key
+      is created.
+    - ``("ttl", (key,))``: seconds until the key expires, ``None`` if it
+      never does or does not exist.
+
+    ``ttl`` is in seconds, ``None`` means forever. A batch should be applied
+    atomically and in one round trip. For a Redis like store that maps to
+    one ``MULTI``/``EXEC`` transaction of ``GET``, ``SET`` (``PX``/``NX``),
+    ``DEL``, ``INCRBY`` with ``PEXPIRE ... NX`` and ``PTTL``.
+
+    The single operation methods are shortcuts for a batch of one, prefer
+    :meth:`pipeline` when there is more than one thing to do.
+
+    Set :attr:`shared` to ``True`` on backends whose keys other processes
+    see too.
+    """
+
+    shared = False
+
+    def execute(self, ops):
+        raise NotImplementedError("Derived classes need to implement this.")
+
+    def pipeline(self):
+        return Pipeline(self)
+
+    def get(self, key):
+        return self.execute([("get", (key,))])[0]
+
+    def set(self, key, value, ttl=None):
+        return self.execute([("set", (key, value, ttl))])[0]
+
+    def add(self, key, value, ttl=None):
+        return self.execute([("add", (key, value, ttl))])[0]
+
+    def delete(self, key):
+        return self.execute([("delete", (key,))])[0]
+
+    def incr(self, key, amount=1, ttl=None):
+        return self.execute([("incr", (key, amount, ttl))])[0]
+
+    def ttl(self, key):
+        return self.execute([("ttl", (key,))])[0]
+
+    def close(self):
+        pass
+
+
+class MemoryBackend(StateBackend):
+    """Keeps the state in a dict. Fast, but only shared within one process."""
+
+    def __init__(self):
+        # key: (value, expires_at or None)
+        self._data = {}
+        self._lock = threading.Lock()
+        self._batches = 0
+
+    def _alive(self, key, now):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        if entry[1] is not None and entry[1] <= now:
+            del self._data[key]
+            return None
+        return entry
+
+    def _sweep(self, now):
+        expired = [
+            key
+            for key, (_, expires) in self._data.items()
+            if expires is not None and expires <= now
+        ]
+        for key in expired:
+            del self._data[key]
+
+    def execute(self, ops):
+        now = time.monotonic()
+        results = []
+        with self._lock:
+            self._batches += 1
+            if self._batches % _SWEEP_EVERY == 0:
+                self._sweep(now)
+
+            for op, args in ops:
+                key = args[0]
+                entry = self._alive(key, now)
+
+                if op == "get":
+                    results.append(entry[0] if entry else None)
+                elif op == "set" or op == "add":
+                    if op == "add" and entry is not None:
+                        results.append(False)
+                        continue
+                    ttl = args[2]
+                    self._data[key] = (args[1], now + ttl if ttl is not None else None)
+                    results.append(True)
+                elif op == "delete":
+                    results.append(self._data.pop(key, None) is not None)
+                elif op == "incr":
+                    if entry is None:
+                        ttl = args[2]
+                        entry = (0, now + ttl if ttl is not None else None)
+                    value = entry[0] + args[1]
+                    self._data[key] = (value, entry[1])
+                    results.append(value)
+                elif op == "ttl":
+                    if entry is None or entry[1] is None:
+                        results.append(None)
+                    else:
+                        results.append(entry[1] - now)
+                else:
+                    raise ValueError("Unknown state operation {!r}".format(op))
+
+        return results
+
+
+class SQLiteBackend(StateBackend):
+    """Keeps the state in an SQLite database, shared by every process on the host.
+
+    Each batch is one transaction. The database uses write ahead logging,
+    so readers in other processes are not blocked while a batch is written.
+
+    Parameters
+    -----------
+    path: :class:`str`
+        The database file. Every process that should share state opens
+        the same file.
+    timeout: :class:`float`
+        How long to wait for another process's transaction, in seconds.
+    """
+
+    shared = True
+
+    def __init__(self, path, *, timeout=5.0):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        self._batches = 0
+
+        connection = self._connection()
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS state ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL)"
+        )
+
+    def _connection(self):
+        # sqlite3 connections can not be shared between threads
+        try:
+            return self._local.connection
+        except AttributeError:
+            connection = sqlite3.connect(
+                self.path, timeout=self.timeout, isolation_level=None
+            )
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+            return connection
+
+    @staticmethod
+    def _alive(cursor, key, now):
+        row = cursor.execute(
+            "SELECT value, expires FROM state WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None or row[1] is not None and row[1] <= now:
+            return None
+        return json.loads(row[0]), row[1]
+
+    def execute(self, ops):
+        # time.time, since the expiry times are shared between processes
+        now = time.time()
+        results = []
+        cursor = self._connection().cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            self._batches += 1
+            if self._batches % _SWEEP_EVERY == 0:
+                cursor.execute("DELETE FROM state WHERE expires <= ?", (now,))
+
+            for op, args in ops:
+                key = args[0]
+                entry = self._alive(cursor, key, now)
+
+                if op == "get":
+                    results.append(entry[0] if entry else None)
+                elif op == "set" or op == "add":
+                    if op == "add" and entry is not None:
+                        results.append(False)
+                        continue
+                    ttl = args[2]
+                    cursor.execute(
+                        "INSERT OR REPLACE INTO state VALUES (?, ?, ?)",
+                        (
+                            key,
+                            json.dumps(args[1]),
+                            now + ttl if ttl is not None else None,
+                        ),
+                    )
+                    results.append(True)
+                elif op == "delete":
+                    cursor.execute("DELETE FROM state WHERE key = ?", (key,))
+                    results.append(entry is not None)
+                elif op == "incr":
+                    if entry is None:
+                        ttl = args[2]
+                        entry = (0, now + ttl if ttl is not None else None)
+                    value = entry[0] + args[1]
+                    cursor.execute(
+                        "INSERT OR REPLACE INTO state VALUES (?, ?, ?)",
+                        (key, json.dumps(value), entry[1]),
+                    )
+                    results.append(value)
+                elif op == "ttl":
+                    if entry is None or entry[1] is None:
+                        results.append(None)
+                    else:
+                        results.append(entry[1] - now)
+                else:
+                    raise ValueError("Unknown state operation {!r}".format(op))
+        except BaseException:
+            cursor.execute("ROLLBACK")
+            raise
+        else:
+            cursor.execute("COMMIT")
+
+        return results
+
+    def close(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            connection.close()
+            del self._local.connection
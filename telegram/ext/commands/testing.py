@@ -0,0 +1,462 @@
+"""Network free stand-ins for the Bot API.
+
+These are used by the benchmarks and load tools, and are handy in tests:
+:func:`use_stub_api` makes a :class:`Bot` answer every Bot API request
+locally, :class:`FakeBotAPI` serves the Bot API over HTTP for end to end
+runs, and :func:`make_update` builds updates as Telegram would send them.
+"""
+
+import json
+import time
+import random
+import itertools
+import threading
+import collections
+import email.parser
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import telegram
+from telegram.error import BadRequest, RetryAfter, TelegramError, Unauthorized
+from telegram.ext import CallbackContext
+
+
+class StubResponder:
+    """Builds plausible Bot API results from the parameters of a request.
+
+    Sent messages are echoed back with increasing message ids, lookups
+    return objects built from the request and everything else returns
+    ``True``. Used by :class:`StubBot` and :class:`FakeBotAPI`.
+    """
+
+    def __init__(self, username="stub_bot"):
+        self.username = username
+        self._message_ids = itertools.count(1)
+
+    def respond(self, endpoint, data):
+        respond = getattr(self, "_respond_" + endpoint, None)
+        if respond is not None:
+            return respond(data)
+        if endpoint.startswith(("send", "forward", "edit")):
+            return self._message_result(data)
+        return True
+
+    def _message_result(self, data):
+        chat_id = data.get("chat_id")
+        return {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {
+                "id": chat_id if isinstance(chat_id, int) else 0,
+                "type": "private",
+            },
+            "from": self._respond_getMe(data),
+            "text": data.get("text"),
+            "caption": data.get("caption"),
+        }
+
+    def _respond_getMe(self, data):
+        return {
+            "id": 1,
+            "is_bot": True,
+            "first_name": "Stub",
+            "username": self.username,
+        }
+
+    def _respond_sendPhoto(self, data):
+        result = self._message_result(data)
+        file_id = "photo-{}".format(result["message_id"])
+        result["photo"] = [
+            {"file_id": file_id, "file_unique_id": file_id, "width": 1, "height": 1}
+        ]
+        return result
+
+    def _respond_sendDocument(self, data):
+        result = self._message_result(data)
+        file_id = "document-{}".format(result["message_id"])
+        result["document"] = {"file_id": file_id, "file_unique_id": file_id}
+        return result
+
+    def _respond_getChat(self, data):
+        chat_id = data.get("chat_id")
+        if isinstance(chat_id, int):
+            return {"id": chat_id, "type": "private" if chat_id > 0 else "supergroup"}
+        return {"id": -1, "type": "supergroup", "username": str(chat_id).lstrip("@")}
+
+    def _respond_getChatMember(self, data):
+        return {
+            "status": "member",
+            "user": {"id": data.get("user_id"), "is_bot": False, "first_name": "User"},
+        }
+
+    def _respond_getStickerSet(self, data):
+        return {
+            "name": data.get("name"),
+            "title": data.get("name"),
+            "is_animated": False,
+            "is_video": False,
+            "contains_masks": False,
+            "stickers": [],
+        }
+
+    def _respond_getUpdates(self, data):
+        return []
+
+
+class StubBot(telegram.Bot):
+    """A :class:`telegram.Bot` that answers every request locally.
+
+    Requests never leave the process; results come from a
+    :class:`StubResponder`. The most recent requests are kept in
+    :attr:`calls` and :attr:`call_counts` counts requests per endpoint.
+
+    Parameters
+    -----------
+    token: :class:`str`
+        The token to pretend to use.
+    latency: :class:`float`
+        Seconds to sleep in every request, to simulate the network.
+    username: :class:`str`
+        The username returned by ``getMe``.
+    max_calls: :class:`int`
+        How many requests to keep in :attr:`calls`.
+    """
+
+    def __init__(
+        self, token="123456:STUB", *, latency=0.0, username="stub_bot", max_calls=1000
+    ):
+        super().__init__(token)
+        self.latency = latency
+        self.responder = StubResponder(username)
+        self.calls = collections.deque(maxlen=max_calls)
+        self.call_counts = collections.Counter()
+        self._lock = threading.Lock()
+
+    def _post(self, endpoint, data=None, timeout=None, api_kwargs=None):
+        data = dict(data or {})
+        if api_kwargs:
+            data.update(api_kwargs)
+
+        with self._lock:
+            self.calls.append((endpoint, data))
+            self.call_counts[endpoint] += 1
+
+        if self.latency:
+            time.sleep(self.latency)
+
+        return self.responder.respond(endpoint, data)
+
+
+def use_stub_api(bot, **kwargs):
+    """Makes ``bot`` send its Bot API requests to a new :class:`StubBot`.
+
+    The keyword arguments are passed to :class:`StubBot`. Returns the stub.
+    """
+    stub = StubBot(**kwargs)
+    bot.updater.bot = stub
+    bot.dispatcher.bot = stub
+    return stub
+
+
+_update_ids = itertools.count(1)
+
+
+def update_data(
+    text,
+    *,
+    update_id=None,
+    message_id=None,
+    chat_id=1,
+    user_id=1,
+    chat_type="private",
+    date=None
+):
+    """Returns the JSON dict Telegram would send for a text message."""
+    update_id = next(_update_ids) if update_id is None else update_id
+    message = {
+        "message_id": update_id if message_id is None else message_id,
+        "date": int(time.time()) if date is None else date,
+        "chat": {"id": chat_id, "type": chat_type},
+        "from": {"id": user_id, "is_bot": False, "first_name": "User"},
+        "text": text,
+    }
+
+    if text.startswith("/"):
+        command = text.split(None, 1)[0]
+        message["entities"] = [
+            {"type": "bot_command", "offset": 0, "length": len(command)}
+        ]
+
+    return {"update_id": update_id, "message": message}
+
+
+def make_update(text, bot, **kwargs):
+    """Builds a :class:`telegram.Update` for a text message, bound to ``bot``.
+
+    ``bot`` is the :class:`telegram.Bot` to bind, usually a :class:`StubBot`.
+    The keyword arguments are passed to :func:`update_data`.
+    """
+    return telegram.Update.de_json(update_data(text, **kwargs), bot)
+
+
+def make_context(bot, update):
+    """Builds the :class:`telegram.ext.CallbackContext` a command would receive."""
+    context = CallbackContext.from_update(update, bot.dispatcher)
+    context.args = update.effective_message.text.split()[1:]
+    return context
+
+
+def _error_response(error):
+    if isinstance(error, RetryAfter):
+        return 429, {
+            "ok": False,
+            "error_code": 429,
+            "description": "Too Many Requests: retry after {}".format(
+                error.retry_after
+            ),
+            "parameters": {"retry_after": error.retry_after},
+        }
+
+    status = 500
+    description = error.message
+    if isinstance(error, BadRequest):
+        status, description = 400, "Bad Request: " + error.message
+    elif isinstance(error, Unauthorized):
+        status, description = 401, "Unauthorized"
+    return status, {"ok": False, "error_code": status, "description": description}
+
+
+# parameters that are strings even when they look like numbers
+_TEXT_PARAMETERS = {"text", "caption", "query", "name", "title", "description"}
+
+
+def _coerce(key, value):
+    if isinstance(value, str) and key not in _TEXT_PARAMETERS:
+        if value.lstrip("-").isdigit():
+            return int(value)
+        if value.lstrip("-").replace(".", "", 1).isdigit():
+            return float(value)
+        if value[:1] in ("{", "["):
+            try:
+                return json.loads(value)
+            except ValueError:
+                pass
+    return value
+
+
+def _parse_body(content_type, body):
+    if content_type.startswith("application/json"):
+        data = json.loads(body or b"{}")
+    elif content_type.startswith("multipart/form-data"):
+        message = email.parser.BytesParser().parsebytes(
+            b"Content-Type: " + content_type.encode("latin-1") + b"\r\n\r\n" + body
+        )
+        data = {}
+        for part in message.get_payload():
+            name = part.get_param("name", header="content-disposition")
+            payload = part.get_payload(decode=True)
+            if part.get_filename() is None:
+                payload = payload.decode("utf-8")
+            data[name] = payload
+    else:
+        data = {
+            key: values[-1]
+            for key, values in urllib.parse.parse_qs(body.decode("utf-8")).items()
+        }
+
+    return {key: _coerce(key, value) for key, value in data.items()}
+
+
+class _FakeBotAPIRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # headers and body are written separately, without this every
+    # response on a kept alive connection waits for a delayed ACK
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length)
+        # /bot<token>/<method>
+        endpoint = self.path.split("?")[0].rstrip("/").rsplit("/", 1)[-1]
+
+        try:
+            data = _parse_body(self.headers.get("Content-Type", ""), body)
+            status, response = 200, {
+                "ok": True,
+                "result": self.server.api.handle(endpoint, data),
+            }
+        except TelegramError as exc:
+            status, response = _error_response(exc)
+
+        payload = json.dumps(response).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    do_GET = do_POST
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeBotAPI:
+    """A local HTTP server that speaks the subset of the Bot API this extension uses.
+
+    Point a bot at it with ``Bot(token, base_url=api.base_url)``. Results
+    come from a :class:`StubResponder`, and ``getUpdates`` long polls the
+    updates added with :meth:`push_update`, so the whole polling, dispatch
+    and reply loop runs without Telegram::
+
+        with FakeBotAPI(latency=0.02) as api:
+            bot = Bot("123456:TEST", base_url=api.base_url)
+            bot.run(idle=False)
+            api.push_update("/ping")
+
+    Errors can be injected with :meth:`inject_error`. Every request is
+    recorded in :attr:`calls` and counted per endpoint in :attr:`call_counts`.
+
+    Parameters
+    -----------
+    host: :class:`str`
+        The address to listen on.
+    port: :class:`int`
+        The port to listen on. ``0`` picks a free one, see :attr:`base_url`.
+    latency: :class:`float`
+        Seconds to wait before answering every request.
+    username: :class:`str`
+        The username returned by ``getMe``.
+    max_calls: :class:`int`
+        How many requests to keep in :attr:`calls`.
+    """
+
+    def __init__(
+        self,
+        host="127.0.0.1",
+        port=0,
+        *,
+        latency=0.0,
+        username="stub_bot",
+        max_calls=1000
+    ):
+        self.latency = latency
+        self.responder = StubResponder(username)
+        self.calls = collections.deque(maxlen=max_calls)
+        self.call_counts = collections.Counter()
+        # [endpoint, error, remaining, probability]
+        self._errors = []
+        self._updates = []
+        self._closed = False
+        self._cond = threading.Condition()
+        self._server = ThreadingHTTPServer((host, port), _FakeBotAPIRequestHandler)
+        self._server.daemon_threads = True
+        self._server.api = self
+        self._thread = None
+
+    @property
+    def base_url(self):
+        """:class:`str`: The value to pass as ``base_url`` to :class:`Bot`."""
+        host, port = self._server.server_address[:2]
+        return "http://{}:{}/bot".format(host, port)
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name="FakeBotAPI", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def inject_error(self, error, *, endpoint=None, times=1, probability=1.0):
+        """Makes requests fail with ``error`` instead of being answered.
+
+        Parameters
+        -----------
+        error: :exc:`telegram.error.TelegramError`
+            What the bot should see, e.g. ``RetryAfter(3)`` or
+            ``BadRequest("Message to edit not found")``.
+        endpoint: Optional[:class:`str`]
+            Only fail requests to this method. Defaults to every method.
+        times: Optional[:class:`int`]
+            How many requests to fail, ``None`` for no limit.
+        probability: :class:`float`
+            The chance that a matching request fails.
+        """
+        with self._cond:
+            self._errors.append([endpoint, error, times, probability])
+
+    def clear_errors(self):
+        with self._cond:
+            self._errors.clear()
+
+    def push_update(self, text, **kwargs):
+        """Queues a text message for ``getUpdates``.
+
+        The keyword arguments are passed to :func:`update_data`.
+        Returns the update's JSON dict.
+        """
+        data = update_data(text, **kwargs)
+        with self._cond:
+            self._updates.append(data)
+            self._cond.notify_all()
+        return data
+
+    def _take_error(self, endpoint):
+        with self._cond:
+            for rule in self._errors:
+                if rule[0] is not None and rule[0] != endpoint:
+                    continue
+                if rule[3] < 1.0 and random.random() >= rule[3]:
+                    continue
+
+                if rule[2] is not None:
+                    rule[2] -= 1
+                    if rule[2] <= 0:
+                        self._errors.remove(rule)
+                return rule[1]
+        return None
+
+    def handle(self, endpoint, data):
+        """Answers one request. Called from the server's threads.
+
+        Returns the ``result`` to send or raises
+        :exc:`telegram.error.TelegramError` to send an error.
+        """
+        with self._cond:
+            self.calls.append((endpoint, data))
+            self.call_counts[endpoint] += 1
+
+        if self.latency:
+            time.sleep(self.latency)
+
+        error = self._take_error(endpoint)
+        if error is not None:
+            raise error
+
+        if endpoint == "getUpdates":
+            return self._get_updates(data)
+        return self.responder.respond(endpoint, data)
+
+    def _get_updates(self, data):
+        offset = data.get("offset") or 0
+        limit = data.get("limit") or 100
+        timeout = data.get("timeout") or 0
+
+        with self._cond:
+            # requesting an offset confirms every update before it
+            self._updates = [u for u in self._updates if u["update_id"] >= offset]
+            self._cond.wait_for(lambda: self._updates or self._closed, timeout)
+            return self._updates[:limit]
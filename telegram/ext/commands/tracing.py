@@ -0,0 +1,157 @@
+import json
+import time
+import itertools
+import threading
+import collections
+
+
+class Span:
+    """A timed stage of a command invocation.
+
+    Attributes
+    -----------
+    name: :class:`str`
+        What was timed, e.g. ``"parse"`` or ``"sendMessage"``.
+    trace_id: :class:`int`
+        The ``update_id`` of the update being handled. Every span
+        created while handling the same update shares it.
+    span_id: :class:`int`
+        Unique id of this span.
+    parent_id: Optional[:class:`int`]
+        The ``span_id`` of the enclosing span, if any.
+    start: :class:`float`
+        Wall clock start time, in seconds since the epoch.
+    duration: Optional[:class:`float`]
+        How long the span took in seconds, ``None`` while it is running.
+    attributes: :class:`dict`
+        Extra information attached to the span.
+    error: Optional[:class:`str`]
+        The exception that escaped the span, if any. The ``command`` span
+        also gets the command error its error handlers dealt with.
+    """
+
+    __slots__ = (
+        "name",
+        "trace_id",
+        "span_id",
+        "parent_id",
+        "start",
+        "duration",
+        "attributes",
+        "error",
+        "_started",
+    )
+
+    def __init__(self, name, trace_id, span_id, parent_id, attributes):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = span_id
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.error = None
+        self.duration = None
+        self.start = time.time()
+        self._started = time.perf_counter()
+
+    def set_error(self, error):
+        """Records ``error`` as the exception the span failed with."""
+        self.error = "{0.__class__.__name__}: {0}".format(error)
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start": self.start,
+            "duration": self.duration,
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+    def __repr__(self):
+        return (
+            "<Span name={0.name!r} trace_id={0.trace_id} duration={0.duration}>".format(
+                self
+            )
+        )
+
+
+class Tracer:
+    """Creates spans and hands the finished ones to an exporter.
+
+    Set an instance as :attr:`Bot.tracer` to enable tracing. When
+    :attr:`Bot.tracer` is ``None`` (the default) no spans are created.
+    """
+
+    def __init__(self, exporter):
+        self.exporter = exporter
+        self._ids = itertools.count(1)
+
+    def start_span(self, name, trace_id, parent=None, **attributes):
+        parent_id = parent.span_id if parent is not None else None
+        return Span(name, trace_id, next(self._ids), parent_id, attributes)
+
+    def end_span(self, span, error=None):
+        span.duration = time.perf_counter() - span._started
+        if error is not None:
+            span.set_error(error)
+        self.exporter.export(span)
+
+    def flush(self):
+        self.exporter.flush()
+
+    def close(self):
+        self.exporter.close()
+
+
+class SpanExporter:
+    """The base class of span exporters."""
+
+    def export(self, span):
+        raise NotImplementedError("Derived classes need to implement this.")
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.flush()
+
+
+class RingBufferExporter(SpanExporter):
+    """Keeps the last ``maxlen`` finished spans in memory."""
+
+    def __init__(self, maxlen=10000):
+        self._spans = collections.deque(maxlen=maxlen)
+
+    def export(self, span):
+        self._spans.append(span)
+
+    def spans(self, trace_id=None):
+        """Returns the buffered spans, optionally only those of one update."""
+        spans = list(self._spans)
+        if trace_id is None:
+            return spans
+        return [s for s in spans if s.trace_id == trace_id]
+
+
+class JSONLinesExporter(SpanExporter):
+    """Appends finished spans to a file, one JSON object per line."""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def export(self, span):
+        line = json.dumps(span.to_dict(), default=str)
+        with self._lock:
+            self._file.write(line + "\n")
+
+    def flush(self):
+        with self._lock:
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
@@ -0,0 +1,116 @@
+import queue
+import threading
+
+from .errors import CommandTimeout
+
+try:
+    import ctypes
+
+    _set_async_exc = ctypes.pythonapi.PyThreadState_SetAsyncExc
+except (ImportError, AttributeError):
+    _set_async_exc = None
+
+
+class _Interrupted(BaseException):
+    # raised inside a timed out callback, a BaseException so that
+    # ``except Exception`` in the command does not swallow it
+    pass
+
+
+class _Task:
+    __slots__ = ("func", "args", "done", "result", "error", "thread", "cancelled")
+
+    def __init__(self, func, args):
+        self.func = func
+        self.args = args
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        # the ident of the worker running it, while it runs
+        self.thread = None
+        self.cancelled = False
+
+    def run(self, lock):
+        try:
+            try:
+                self.result = self.func(*self.args)
+            except BaseException as exc:
+                self.error = exc
+            finally:
+                with lock:
+                    self.thread = None
+        except _Interrupted:
+            # the interrupt arrived after the callback was done
+            pass
+        self.done.set()
+
+
+class CommandWatchdog:
+    """Runs the callbacks of commands that have a ``timeout``.
+
+    Callbacks run on a pool of at most ``workers`` daemon threads while the
+    thread that invoked the command waits. When the timeout expires the
+    waiting thread gives up and raises :exc:`CommandTimeout`, so the
+    dispatcher moves on to the next update. The callback is interrupted
+    with an exception as soon as it runs Python code again. A callback
+    blocked in a system call keeps its worker until the call returns, so
+    pass timeouts to network calls made inside commands as well.
+    """
+
+    def __init__(self, workers=32):
+        self.workers = workers
+        self._tasks = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._threads = 0
+        # threads waiting for a task, including ones that are starting
+        self._idle = 0
+        # tasks that no thread has taken yet
+        self._queued = 0
+
+    def run(self, timeout, func, *args):
+        """Calls ``func(*args)`` and returns its result, or raises
+        :exc:`CommandTimeout` after ``timeout`` seconds."""
+        task = _Task(func, args)
+        with self._lock:
+            # every queued task needs an idle thread of its own, otherwise
+            # it waits for a busy one and may time out without running
+            self._queued += 1
+            if self._queued > self._idle and self._threads < self.workers:
+                self._threads += 1
+                self._idle += 1
+                threading.Thread(
+                    target=self._work,
+                    name="CommandWorker-{}".format(self._threads),
+                    daemon=True,
+                ).start()
+        self._tasks.put(task)
+
+        if not task.done.wait(timeout):
+            with self._lock:
+                running = task.thread is not None
+                if not running:
+                    # not started yet, or finished just now
+                    task.cancelled = True
+                elif _set_async_exc is not None:
+                    _set_async_exc(
+                        ctypes.c_ulong(task.thread), ctypes.py_object(_Interrupted)
+                    )
+            if running or not task.done.is_set():
+                raise CommandTimeout(timeout)
+
+        if task.error is not None:
+            raise task.error
+        return task.result
+
+    def _work(self):
+        while True:
+            task = self._tasks.get()
+            with self._lock:
+                self._queued -= 1
+                if task.cancelled:
+                    continue
+                self._idle -= 1
+                task.thread = threading.get_ident()
+            task.run(self._lock)
+            with self._lock:
+                self._idle += 1
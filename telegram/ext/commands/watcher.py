@@ -0,0 +1,141 @@
+import os
+import sys
+import time
+import hashlib
+import logging
+import threading
+
+log = logging.getLogger(__name__)
+
+
+class ExtensionWatcher:
+    """Reloads loaded extensions whose source files have changed.
+
+    Every ``interval`` seconds the files of the modules owned by each loaded
+    extension are fingerprinted. Once an extension's files have stopped
+    changing for ``debounce`` seconds it is reloaded through
+    :meth:`Bot.reload_extension` with ``drain_timeout``, so commands of the
+    old version that are still running can finish before it is torn down.
+    Only the extensions whose files changed are reloaded.
+
+    Usually created through :meth:`Bot.watch_extensions`.
+
+    Parameters
+    -----------
+    bot: :class:`Bot`
+        The bot whose extensions to watch.
+    interval: :class:`float`
+        How often to check the files, in seconds.
+    debounce: :class:`float`
+        How long the files must stay unchanged before reloading, in seconds.
+    drain_timeout: :class:`float`
+        How long to wait for in-flight commands of the old version.
+    use_hash: :class:`bool`
+        Whether to compare file contents instead of modification times.
+        Slower, but ignores touches and catches edits that keep the mtime.
+    """
+
+    def __init__(
+        self, bot, *, interval=1.0, debounce=0.5, drain_timeout=30.0, use_hash=False
+    ):
+        self.bot = bot
+        self.interval = interval
+        self.debounce = debounce
+        self.drain_timeout = drain_timeout
+        self.use_hash = use_hash
+        # extension_name: {path: fingerprint}
+        self._fingerprints = {}
+        # extension_name: time of the last change seen
+        self._pending = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _fingerprint(self, path):
+        try:
+            if self.use_hash:
+                with open(path, "rb") as f:
+                    return hashlib.sha1(f.read()).hexdigest()
+            return os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _files(self, name):
+        index = self.bot._extension_index.get(name)
+        if index is None:
+            return []
+
+        files = []
+        for module in list(index.modules):
+            path = getattr(sys.modules.get(module), "__file__", None)
+            if path is not None:
+                files.append(path)
+        return files
+
+    def _snapshot(self, name):
+        return {path: self._fingerprint(path) for path in self._files(name)}
+
+    def start(self):
+        for name in list(self.bot._extensions):
+            self._fingerprints[name] = self._snapshot(name)
+
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="ExtensionWatcher", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.poll()
+            except Exception:
+                log.exception("Extension watcher failed")
+
+    def poll(self):
+        """Checks the files once and reloads what is due."""
+        now = time.monotonic()
+
+        for name in list(self.bot._extensions):
+            current = self._snapshot(name)
+            previous = self._fingerprints.get(name)
+            self._fingerprints[name] = current
+
+            if previous is None:
+                # loaded after the watcher started
+                continue
+            # a submodule imported since the last poll is not a change
+            if any(
+                path not in current or current[path] != fingerprint
+                for path, fingerprint in previous.items()
+            ):
+                self._pending[name] = now
+
+        for name, changed_at in list(self._pending.items()):
+            if now - changed_at < self.debounce:
+                continue
+
+            del self._pending[name]
+            if name not in self.bot._extensions:
+                continue
+
+            self._reload(name)
+
+    def _reload(self, name):
+        log.info("Reloading extension %r", name)
+        try:
+            drained = self.bot.reload_extension(name, drain_timeout=self.drain_timeout)
+        except Exception:
+            log.exception("Failed to reload extension %r", name)
+        else:
+            if not drained:
+                log.warning(
+                    "Extension %r was torn down with commands still running", name
+                )
+        finally:
+            self._fingerprints[name] = self._snapshot(name)
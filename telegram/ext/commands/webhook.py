@@ -0,0 +1,231 @@
+import hmac
+import json
+import queue
+import socket
+import logging
+import threading
+import concurrent.futures
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from telegram import Update
+
+log = logging.getLogger(__name__)
+
+SECRET_TOKEN_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class _WebhookRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    # Telegram keeps connections open, close the ones that go quiet
+    timeout = 60
+
+    def _reply(self, status, *, close=False):
+        self.send_response(status)
+        self.send_header("Content-Length", "0")
+        if close:
+            # the body was not read, so the connection can not be reused
+            self.send_header("Connection", "close")
+        self.end_headers()
+
+    def do_POST(self):
+        webhook = self.server.webhook
+
+        if self.path.split("?")[0].strip("/") != webhook.url_path:
+            self._reply(404, close=True)
+            return
+
+        if webhook.secret_token is not None:
+            token = self.headers.get(SECRET_TOKEN_HEADER, "")
+            if not hmac.compare_digest(
+                token.encode("utf-8"), webhook.secret_token.encode("utf-8")
+            ):
+                self._reply(403, close=True)
+                return
+
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > webhook.max_body_size:
+            self._reply(413, close=True)
+            return
+
+        body = self.rfile.read(length)
+        if len(body) < length:
+            # cut off by stop(), Telegram sends it again
+            self.close_connection = True
+            return
+
+        webhook.receive(body)
+        self._reply(200)
+
+    def log_message(self, format, *args):
+        log.debug(format, *args)
+
+
+class _PooledHTTPServer(HTTPServer):
+    # Like ThreadingHTTPServer, but connections are served by a fixed
+    # number of threads instead of one new thread each.
+
+    def __init__(self, address, handler, workers):
+        super().__init__(address, handler)
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            workers, thread_name_prefix="WebhookWorker"
+        )
+        # the accepted connections that are not closed yet
+        self._connections = set()
+        self._connections_lock = threading.Lock()
+
+    def process_request(self, request, client_address):
+        with self._connections_lock:
+            self._connections.add(request)
+        self.executor.submit(self._serve, request, client_address)
+
+    def _serve(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            with self._connections_lock:
+                self._connections.discard(request)
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        # workers wait for the next request on kept alive connections,
+        # shutting those down wakes them up
+        with self._connections_lock:
+            connections = list(self._connections)
+        for connection in connections:
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        self.executor.shutdown(wait=True)
+
+
+class WebhookServer:
+    """Receives updates over HTTP and hands them to a dispatcher.
+
+    Requests are served by a fixed pool of ``workers`` threads that only
+    check the path and secret token, queue the raw body and answer. A single
+    parser thread takes the queued bodies in batches of up to ``batch_size``,
+    turns them into :class:`telegram.Update` objects and puts them on the
+    dispatcher's update queue. This keeps the time Telegram waits for an
+    answer short.
+
+    Usually created through :meth:`Bot.run` with ``mode="webhook"`` or
+    :meth:`Bot.start_webhook`.
+
+    Parameters
+    -----------
+    bot: :class:`telegram.Bot`
+        The bot the updates are bound to.
+    update_queue: :class:`queue.Queue`
+        Where parsed updates are put, usually ``dispatcher.update_queue``.
+    listen: :class:`str`
+        The address to listen on.
+    port: :class:`int`
+        The port to listen on.
+    url_path: :class:`str`
+        The path Telegram posts to. Other paths are answered with 404.
+    secret_token: Optional[:class:`str`]
+        When set, requests without a matching
+        ``X-Telegram-Bot-Api-Secret-Token`` header are answered with 403.
+    workers: :class:`int`
+        How many threads serve requests.
+    batch_size: :class:`int`
+        The most bodies parsed in one batch.
+    max_body_size: :class:`int`
+        Larger requests are answered with 413.
+    """
+
+    def __init__(
+        self,
+        bot,
+        update_queue,
+        *,
+        listen="127.0.0.1",
+        port=8443,
+        url_path="",
+        secret_token=None,
+        workers=4,
+        batch_size=100,
+        max_body_size=1 << 20,
+    ):
+        self.bot = bot
+        self.update_queue = update_queue
+        self.url_path = url_path.strip("/")
+        self.secret_token = secret_token
+        self.batch_size = batch_size
+        self.max_body_size = max_body_size
+        self.received = 0
+        self.rejected = 0
+        self._bodies = queue.SimpleQueue()
+        self._server = _PooledHTTPServer(
+            (listen, port), _WebhookRequestHandler, workers
+        )
+        self._server.webhook = self
+        self._threads = []
+        self.running = False
+
+    @property
+    def address(self):
+        return self._server.server_address
+
+    def receive(self, body):
+        self._bodies.put(body)
+
+    def start(self):
+        if self.running:
+            raise RuntimeError("The webhook server is already running")
+
+        self.running = True
+        self._threads = [
+            threading.Thread(
+                target=self._server.serve_forever, name="WebhookServer", daemon=True
+            ),
+            threading.Thread(target=self._parse, name="WebhookParser", daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self):
+        if not self.running:
+            return
+
+        self.running = False
+        self._server.shutdown()
+        self._server.server_close()
+        # the workers are done, so everything received is queued by now
+        self._bodies.put(None)
+        for thread in self._threads:
+            if thread is not threading.current_thread():
+                thread.join()
+        self._threads = []
+
+    def _next_batch(self):
+        batch = [self._bodies.get()]
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._bodies.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _parse(self):
+        while True:
+            batch = self._next_batch()
+
+            for body in batch:
+                if body is None:
+                    return
+
+                try:
+                    update = Update.de_json(json.loads(body), self.bot)
+                except Exception:
+                    self.rejected += 1
+                    log.exception("Ignoring a malformed update")
+                    continue
+
+                self.received += 1
+                self.update_queue.put(update)
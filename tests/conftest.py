@@ -0,0 +1,29 @@
+import pytest
+
+from telegram.ext import commands
+from telegram.ext.commands import testing
+
+
+@pytest.fixture
+def bot():
+    bot = commands.Bot("123456:TEST", owner_ids=[1], help_command=None)
+    testing.use_stub_api(bot)
+    yield bot
+    bot.state.close()
+
+
+@pytest.fixture
+def stub(bot):
+    return bot.dispatcher.bot
+
+
+@pytest.fixture
+def dispatch(bot, stub):
+    """Runs the handlers for a text message on the calling thread."""
+
+    def dispatch(text, **kwargs):
+        update = testing.make_update(text, stub, **kwargs)
+        bot.dispatcher.process_update(update)
+        return update
+
+    return dispatch
@@ -0,0 +1,86 @@
+import types
+
+from telegram.ext.commands import AdmissionController, PriorityUpdateQueue
+
+
+def test_queue_hands_out_highest_priority_first():
+    update_queue = PriorityUpdateQueue(lambda item: item[1])
+    for item in [("a", 0), ("b", 5), ("c", 0), ("d", 5), ("e", 1)]:
+        update_queue.put(item)
+
+    order = [update_queue.get()[0] for _ in range(5)]
+    assert order == ["b", "d", "e", "a", "c"]
+
+
+def test_queue_without_priorities_is_fifo():
+    update_queue = PriorityUpdateQueue()
+    for item in range(5):
+        update_queue.put(item)
+    assert [update_queue.get() for _ in range(5)] == list(range(5))
+
+
+def test_queue_calls_on_put():
+    update_queue = PriorityUpdateQueue()
+    seen = []
+    update_queue.on_put = seen.append
+    update_queue.put("item")
+    assert seen == ["item"]
+
+
+def test_queue_clear():
+    update_queue = PriorityUpdateQueue()
+    for item in range(3):
+        update_queue.put(item)
+
+    assert update_queue.clear() == 3
+    assert update_queue.qsize() == 0
+    # join does not wait for the dropped items
+    update_queue.join()
+
+
+def make_bot(depth, waited=0.0):
+    update_queue = types.SimpleNamespace(qsize=lambda: depth, waited=waited)
+    return types.SimpleNamespace(
+        dispatcher=types.SimpleNamespace(update_queue=update_queue), executor=None
+    )
+
+
+def test_overloaded_by_depth_and_latency():
+    controller = AdmissionController(max_queue_depth=10, max_queue_latency=1.0)
+    assert not controller.overloaded(make_bot(10))
+    assert controller.overloaded(make_bot(11))
+    assert controller.overloaded(make_bot(0, waited=1.5))
+
+
+def test_executor_backlog_counts():
+    controller = AdmissionController(max_queue_depth=10)
+    bot = make_bot(5)
+    bot.executor = types.SimpleNamespace(pending=6, waited=0.0)
+    assert controller.overloaded(bot)
+
+
+def test_sheds_low_priority_commands(bot, stub, dispatch, monkeypatch):
+    calls = []
+
+    @bot.command()
+    def low(ctx):
+        calls.append("low")
+
+    @bot.command(priority=1)
+    def high(ctx):
+        calls.append("high")
+
+    bot.admission = AdmissionController(max_queue_depth=0)
+    monkeypatch.setattr(bot.dispatcher.update_queue, "qsize", lambda: 1)
+
+    dispatch("/low")
+    dispatch("/high")
+
+    assert calls == ["high"]
+    metrics = bot._command_metrics
+    assert metrics.shed.value("low") == 1
+    # shed invocations are not invocations
+    assert metrics.invocations.value("low") == 0
+    assert metrics.invocations.value("high") == 1
+    sent = [data["text"] for endpoint, data in stub.calls if endpoint == "sendMessage"]
+    assert sent == [bot.admission.rejection_message]
@@ -0,0 +1,83 @@
+import types
+
+import pytest
+
+from telegram.ext import commands
+from telegram.ext.commands import ResultCache, BucketType
+
+
+def make_ctx(chat_id=1, user_id=1, message_id=1):
+    return types.SimpleNamespace(
+        chat=types.SimpleNamespace(id=chat_id),
+        user=types.SimpleNamespace(id=user_id),
+        message=types.SimpleNamespace(message_id=message_id),
+    )
+
+
+def test_put_and_get():
+    cache = ResultCache()
+    cache.put("key", make_ctx(message_id=5), "result", [("text", {}, None)])
+
+    entry = cache.get("key")
+    assert entry.result == "result"
+    assert entry.sends == [("text", {}, None)]
+    assert entry.message_id == 5
+    assert cache.get("other") is None
+
+
+def test_entries_expire():
+    cache = ResultCache(ttl=0)
+    cache.put("key", make_ctx(), "result", [])
+    assert cache.get("key") is None
+    assert len(cache) == 0
+
+
+def test_least_recently_used_is_evicted():
+    cache = ResultCache(maxsize=2)
+    for key in ("a", "b"):
+        cache.put(key, make_ctx(), key, [])
+    cache.get("a")
+    cache.put("c", make_ctx(), "c", [])
+
+    assert cache.get("b") is None
+    assert cache.get("a").result == "a"
+    assert cache.get("c").result == "c"
+
+
+def test_key_includes_bucket():
+    cache = ResultCache(type=BucketType.chat)
+    assert cache.key_for(make_ctx(chat_id=1), "args") == ("args", 1)
+    assert cache.key_for(make_ctx(chat_id=2), "args") == ("args", 2)
+
+    custom = ResultCache(key=lambda ctx: ctx.user.id)
+    assert custom.key_for(make_ctx(user_id=7), "args") == (7, None)
+
+
+def test_rejects_other_types():
+    with pytest.raises(TypeError):
+        ResultCache(type="chat")
+
+
+def test_cached_command_replays_sends(bot, stub, dispatch):
+    calls = []
+
+    @bot.command()
+    @commands.cached(ttl=60)
+    def square(ctx, number: int):
+        calls.append(number)
+        ctx.send(str(number * number))
+
+    dispatch("/square 3")
+    dispatch("/square 3", chat_id=2)
+    dispatch("/square 4")
+
+    assert calls == [3, 4]
+    texts = [
+        (data["chat_id"], data["text"])
+        for endpoint, data in stub.calls
+        if endpoint == "sendMessage"
+    ]
+    assert texts == [(1, "9"), (2, "9"), (1, "16")]
+    requests = bot._command_metrics.cache_requests
+    assert requests.value("square", "hit") == 1
+    assert requests.value("square", "miss") == 2
@@ -0,0 +1,181 @@
+import time
+import types
+import threading
+
+import pytest
+
+from telegram.ext import commands
+from telegram.ext.commands.coalesce import SingleFlight, replay_sends
+
+
+def make_ctx(message_id=1):
+    return types.SimpleNamespace(
+        message=types.SimpleNamespace(message_id=message_id), _sends=None
+    )
+
+
+def test_followers_share_one_run():
+    flights = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def leader_func():
+        calls.append(1)
+        started.set()
+        release.wait(1.0)
+        return "result"
+
+    results = []
+
+    def lead():
+        results.append(flights.run("key", make_ctx(), leader_func))
+
+    leader = threading.Thread(target=lead)
+    leader.start()
+    started.wait(1.0)
+
+    followers = [
+        threading.Thread(
+            target=lambda: results.append(flights.run("key", make_ctx(), leader_func))
+        )
+        for _ in range(3)
+    ]
+    for thread in followers:
+        thread.start()
+    release.set()
+    for thread in [leader, *followers]:
+        thread.join()
+
+    assert calls == [1]
+    assert sorted(led for _, led in results) == [False, False, False, True]
+    assert all(flight.result == "result" for flight, _ in results)
+    assert len(flights) == 0
+
+
+def test_leader_error_is_recorded():
+    flights = SingleFlight()
+
+    def fail():
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError):
+        flights.run("key", make_ctx(), fail)
+    assert len(flights) == 0
+
+
+def test_replay_sends_moves_replies_to_the_new_message():
+    sent = []
+    ctx = types.SimpleNamespace(
+        message=types.SimpleNamespace(message_id=20),
+        send=lambda text, **options: sent.append((text, options)),
+    )
+    options = dict(reply=None, photo=None, document=None)
+    sends = [
+        ("plain", dict(options), None),
+        ("reply", dict(options, reply=10), None),
+        ("other", dict(options, reply=5), None),
+    ]
+
+    replay_sends(ctx, sends, 10)
+
+    assert [(text, options["reply"]) for text, options in sent] == [
+        ("plain", None),
+        ("reply", 20),
+        ("other", None),
+    ]
+
+
+def _blocking_command(bot, release, calls):
+    @bot.command(coalesce=True)
+    def stats(ctx):
+        calls.append(ctx.chat.id)
+        release.wait(1.0)
+        ctx.send("stats for {}".format(ctx.chat.id))
+
+
+def test_default_key_is_per_chat(bot, stub, dispatch):
+    release = threading.Event()
+    calls = []
+    _blocking_command(bot, release, calls)
+
+    threads = [
+        threading.Thread(target=dispatch, args=("/stats",), kwargs={"chat_id": chat})
+        for chat in (1, 1, 2)
+    ]
+    for thread in threads:
+        thread.start()
+    # let all three reach the command before the leaders finish
+    time.sleep(0.2)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(calls) == [1, 2]
+    texts = sorted(
+        (data["chat_id"], data["text"])
+        for endpoint, data in stub.calls
+        if endpoint == "sendMessage"
+    )
+    assert texts == [(1, "stats for 1"), (1, "stats for 1"), (2, "stats for 2")]
+
+
+def test_followers_raise_their_own_error(bot, dispatch):
+    release = threading.Event()
+    started = threading.Event()
+    errors = []
+
+    @bot.command(coalesce=True)
+    def fail(ctx):
+        started.set()
+        release.wait(1.0)
+        raise ValueError("boom")
+
+    @fail.error
+    def on_error(ctx, error):
+        errors.append(error)
+
+    leader = threading.Thread(target=dispatch, args=("/fail",))
+    leader.start()
+    started.wait(1.0)
+    follower = threading.Thread(target=dispatch, args=("/fail",))
+    follower.start()
+    time.sleep(0.1)
+    release.set()
+    leader.join()
+    follower.join()
+
+    assert len(errors) == 2
+    assert errors[0] is not errors[1]
+    assert all(isinstance(error, commands.CommandInvokeError) for error in errors)
+    assert all(isinstance(error.original, ValueError) for error in errors)
+
+
+def test_followers_get_the_leaders_error_type(bot, dispatch):
+    release = threading.Event()
+    started = threading.Event()
+    errors = []
+
+    @bot.command(coalesce=True, timeout=0.3)
+    def slow(ctx):
+        started.set()
+        release.wait(2.0)
+
+    @slow.error
+    def on_error(ctx, error):
+        errors.append(error)
+
+    leader = threading.Thread(target=dispatch, args=("/slow",))
+    leader.start()
+    started.wait(1.0)
+    follower = threading.Thread(target=dispatch, args=("/slow",))
+    follower.start()
+    leader.join()
+    follower.join()
+    release.set()
+
+    assert len(errors) == 2
+    assert errors[0] is not errors[1]
+    assert all(isinstance(error, commands.CommandTimeout) for error in errors)
+    assert all(error.timeout == 0.3 for error in errors)
+    assert bot._command_metrics.timeouts.value("slow") == 2
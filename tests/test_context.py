@@ -0,0 +1,63 @@
+import pytest
+from telegram.error import BadRequest
+
+from telegram.ext.commands.context import _file_key
+
+PHOTO = b"not really a png"
+KEY = _file_key("photo", PHOTO)
+
+
+@pytest.fixture
+def send_photo(bot, stub, dispatch):
+    @bot.command()
+    def photo(ctx):
+        ctx.send("caption", photo=PHOTO)
+
+    def send_photo():
+        dispatch("/photo")
+        return stub.calls[-1]
+
+    return send_photo
+
+
+def fail_file_id_sends(stub, monkeypatch, message):
+    post = stub._post
+
+    def _post(endpoint, data=None, *args, **kwargs):
+        if endpoint == "sendPhoto" and isinstance(data.get("photo"), str):
+            raise BadRequest(message)
+        return post(endpoint, data, *args, **kwargs)
+
+    monkeypatch.setattr(stub, "_post", _post)
+
+
+def test_photo_is_sent_again_by_file_id(send_photo):
+    endpoint, first = send_photo()
+    assert endpoint == "sendPhoto"
+    assert not isinstance(first["photo"], str)
+
+    endpoint, second = send_photo()
+    assert second["photo"] == "photo-1"
+
+
+def test_unknown_file_id_is_uploaded_again(bot, stub, send_photo, monkeypatch):
+    send_photo()
+    fail_file_id_sends(stub, monkeypatch, "Wrong file identifier/http url specified")
+
+    endpoint, data = send_photo()
+    assert endpoint == "sendPhoto"
+    assert not isinstance(data["photo"], str)
+    # the new upload is remembered instead
+    assert bot.state.get(KEY) == ["photo", "photo-2"]
+
+
+def test_other_errors_keep_the_file_id(bot, stub, send_photo, monkeypatch):
+    send_photo()
+    fail_file_id_sends(stub, monkeypatch, "Message caption is too long")
+    uploads = stub.call_counts["sendPhoto"]
+
+    send_photo()
+    # nothing was uploaded again and the file_id is kept
+    assert stub.call_counts["sendPhoto"] == uploads
+    assert bot.state.get(KEY) == ["photo", "photo-1"]
+
@@ -0,0 +1,100 @@
+import time
+import threading
+
+import pytest
+
+from telegram.ext import commands
+from telegram.ext.commands import AdaptiveExecutor, testing
+
+
+@pytest.fixture
+def api():
+    with testing.FakeBotAPI() as api:
+        yield api
+
+
+class Commands:
+    def __init__(self, bot):
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.calls = []
+
+        @bot.command()
+        def block(ctx):
+            self.started.set()
+            self.release.wait(5.0)
+            self.calls.append("block")
+
+        @bot.command()
+        def hello(ctx):
+            self.calls.append("hello")
+
+
+def start(api, *, executor=None):
+    bot = commands.Bot(
+        "123456:TEST", owner_ids=[1], help_command=None, base_url=api.base_url
+    )
+    bot.executor = executor
+    recorded = Commands(bot)
+    bot.start_pipelined_polling(timeout=1)
+    return bot, recorded
+
+
+def wait_for(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def committed(api):
+    offsets = [
+        data.get("offset") for endpoint, data in api.calls if endpoint == "getUpdates"
+    ]
+    return offsets[-1]
+
+
+def test_running_commands_finish(api):
+    executor = AdaptiveExecutor(min_workers=2, max_workers=2)
+    bot, recorded = start(api, executor=executor)
+    api.push_update("/block", update_id=1)
+    assert recorded.started.wait(5.0)
+    threading.Timer(0.2, recorded.release.set).start()
+
+    assert bot.drain(timeout=5.0)
+    assert recorded.calls == ["block"]
+    assert committed(api) == 2
+
+
+def test_pending_jobs_are_cancelled_and_not_confirmed(api):
+    api.push_update("/block", update_id=1)
+    # the same chat, so it waits for /block in the executor
+    api.push_update("/hello", update_id=2)
+    executor = AdaptiveExecutor(min_workers=1, max_workers=1)
+    bot, recorded = start(api, executor=executor)
+    assert recorded.started.wait(5.0)
+    assert wait_for(lambda: executor.pending == 2)
+    threading.Timer(0.5, recorded.release.set).start()
+
+    assert not bot.drain(timeout=0.2)
+    assert recorded.calls == ["block"]
+    # /block finished and is confirmed, /hello is delivered again
+    assert committed(api) == 2
+
+
+def test_timeout_drops_queued_updates(api):
+    # fetched in one batch, /hello waits in the dispatcher's queue
+    api.push_update("/block", update_id=1)
+    api.push_update("/hello", update_id=2)
+    bot, recorded = start(api)
+    assert recorded.started.wait(5.0)
+    assert wait_for(lambda: bot.dispatcher.update_queue.qsize() == 1)
+    threading.Timer(0.5, recorded.release.set).start()
+
+    started = time.monotonic()
+    assert not bot.drain(timeout=0.2)
+    assert time.monotonic() - started < 3.0
+    assert recorded.calls == ["block"]
+    assert committed(api) == 2
@@ -0,0 +1,94 @@
+import threading
+
+from telegram.ext.commands import AdaptiveExecutor
+
+
+def wait_all(events, timeout=2.0):
+    return all(event.wait(timeout) for event in events)
+
+
+def test_runs_jobs_of_one_key_in_order():
+    executor = AdaptiveExecutor(min_workers=4, max_workers=4)
+    order = []
+    done = [threading.Event() for _ in range(5)]
+    for i in range(5):
+        executor.submit("chat", lambda i=i: order.append(i), on_done=done[i].set)
+
+    assert wait_all(done)
+    assert order == [0, 1, 2, 3, 4]
+    executor.shutdown()
+
+
+def test_higher_priority_runs_first():
+    executor = AdaptiveExecutor(min_workers=1, max_workers=1)
+    release = threading.Event()
+    order = []
+    done = [threading.Event() for _ in range(4)]
+
+    executor.submit("busy", release.wait, on_done=done[0].set)
+    # queued behind the busy one while the only thread is taken
+    executor.submit("low", lambda: order.append("low"), on_done=done[1].set)
+    executor.submit(
+        "high", lambda: order.append("high"), priority=10, on_done=done[2].set
+    )
+    executor.submit("mid", lambda: order.append("mid"), priority=5, on_done=done[3].set)
+    release.set()
+
+    assert wait_all(done)
+    assert order == ["high", "mid", "low"]
+    executor.shutdown()
+
+
+def test_errors_go_to_on_error():
+    executor = AdaptiveExecutor()
+    errors = []
+    done = threading.Event()
+
+    def fail():
+        raise ValueError("boom")
+
+    executor.submit("chat", fail, on_error=errors.append, on_done=done.set)
+    assert done.wait(2.0)
+    assert isinstance(errors[0], ValueError)
+    executor.shutdown()
+
+
+def test_raising_the_limit_starts_waiting_jobs():
+    executor = AdaptiveExecutor(min_workers=1, max_workers=2, interval=3600)
+    release = threading.Event()
+    started = threading.Event()
+    done = threading.Event()
+
+    executor.submit("a", release.wait)
+    executor.submit("b", started.set, on_done=done.set)
+    assert not started.wait(0.1)
+
+    with executor._cond:
+        # nothing finished while a job is stuck
+        executor._adjust()
+    assert executor.limit == 2
+    assert started.wait(1.0)
+
+    release.set()
+    assert done.wait(1.0)
+    executor.shutdown()
+
+
+def test_shutdown_cancels_pending():
+    executor = AdaptiveExecutor(min_workers=1, max_workers=1)
+    release = threading.Event()
+    running = threading.Event()
+    cancelled = []
+
+    executor.submit("a", lambda: (running.set(), release.wait()))
+    executor.submit("a", lambda: None, on_cancel=lambda: cancelled.append("a"))
+    executor.submit("b", lambda: None, on_cancel=lambda: cancelled.append("b"))
+    assert running.wait(1.0)
+
+    executor.shutdown(wait=False, cancel_pending=True)
+    assert sorted(cancelled) == ["a", "b"]
+    assert executor.pending == 1
+
+    release.set()
+    executor.shutdown()
+    assert executor.pending == 0
@@ -0,0 +1,193 @@
+import importlib
+import sys
+import textwrap
+
+import pytest
+
+from telegram.ext import commands
+
+
+@pytest.fixture
+def make_extension(tmp_path, monkeypatch):
+    monkeypatch.syspath_prepend(str(tmp_path))
+
+    def make_extension(name, source, files=None):
+        package = tmp_path / name
+        package.mkdir(exist_ok=True)
+        (package / "__init__.py").write_text(textwrap.dedent(source))
+        for filename, content in (files or {}).items():
+            (package / filename).write_text(textwrap.dedent(content))
+        sys.modules.pop(name, None)
+        return package
+
+    yield make_extension
+
+
+EXTENSION = """
+from telegram.ext import commands
+from . import helper
+
+@commands.command()
+def {name}(ctx):
+    from . import late
+    return late.VALUE
+
+def setup(bot):
+    bot.add_command({name})
+"""
+
+
+def test_unload_drops_submodules_imported_later(bot, make_extension):
+    make_extension(
+        "ext_late",
+        EXTENSION.format(name="late_cmd"),
+        {"helper.py": "", "late.py": "VALUE = 1\n"},
+    )
+    bot.load_extension("ext_late")
+    assert bot._extension_index["ext_late"].modules == {"ext_late", "ext_late.helper"}
+
+    late = importlib.import_module("ext_late.late")
+
+    assert late.VALUE == 1
+    assert "ext_late.late" in bot._extension_index["ext_late"].modules
+    bot.unload_extension("ext_late")
+    assert not [m for m in sys.modules if m.startswith("ext_late")]
+    assert "late_cmd" not in bot.commands
+
+
+def test_failed_reload_keeps_the_old_version(bot, make_extension):
+    package = make_extension(
+        "ext_reload", EXTENSION.format(name="reloaded"), {"helper.py": "", "late.py": ""}
+    )
+    bot.load_extension("ext_reload")
+    old = bot.commands["reloaded"]
+
+    (package / "__init__.py").write_text("raise RuntimeError('broken')\n")
+    with pytest.raises(commands.ExtensionFailed):
+        bot.reload_extension("ext_reload")
+
+    assert bot.commands["reloaded"] is old
+    assert "reloaded" in bot._handlers
+    assert "ext_reload" in bot._extensions
+    bot.unload_extension("ext_reload")
+
+
+def test_failed_lazy_load_is_tried_again(bot, make_extension, dispatch):
+    package = make_extension("ext_lazy", "raise RuntimeError('broken')\n")
+    bot.load_extension("ext_lazy", lazy=True, commands=["lazy_cmd"])
+
+    with pytest.raises(commands.ExtensionFailed):
+        bot.resolve_lazy_name("lazy_cmd")
+    assert "lazy_cmd" in bot._handlers
+
+    (package / "__init__.py").write_text(
+        textwrap.dedent(
+            """
+            from telegram.ext import commands
+
+            @commands.command()
+            def lazy_cmd(ctx):
+                ctx.send("loaded")
+
+            def setup(bot):
+                bot.add_command(lazy_cmd)
+            """
+        )
+    )
+    bot.resolve_lazy_name("lazy_cmd")
+    assert "lazy_cmd" in bot.commands
+    bot.unload_extension("ext_lazy")
+
+
+ORDERED = """
+from telegram.ext import commands
+
+requires = {requires!r}
+
+def setup(bot):
+    bot.setup_order.append(__name__)
+    if {fail!r}:
+        raise RuntimeError("broken")
+
+    @commands.command(name=__name__ + "_cmd")
+    def cmd(ctx):
+        pass
+
+    bot.add_command(cmd)
+"""
+
+
+def ordered(make_extension, name, requires=(), fail=False):
+    make_extension(name, ORDERED.format(requires=tuple(requires), fail=fail))
+
+
+def test_load_extensions_follows_requires(bot, make_extension):
+    bot.setup_order = []
+    ordered(make_extension, "ext_app", ["ext_db", "ext_cache"])
+    ordered(make_extension, "ext_cache", ["ext_db"])
+    ordered(make_extension, "ext_db")
+
+    timings = bot.load_extensions(["ext_app", "ext_cache", "ext_db"])
+
+    assert bot.setup_order == ["ext_db", "ext_cache", "ext_app"]
+    assert set(timings) == {"ext_app", "ext_cache", "ext_db"}
+    for timing in timings.values():
+        assert timing["import"] >= 0
+        assert timing["setup"] >= 0
+    for name in timings:
+        bot.unload_extension(name)
+
+
+def test_load_extensions_rejects_cycles(bot, make_extension):
+    bot.setup_order = []
+    ordered(make_extension, "ext_a", ["ext_b"])
+    ordered(make_extension, "ext_b", ["ext_a"])
+
+    with pytest.raises(commands.ExtensionDependencyError) as info:
+        bot.load_extensions(["ext_a", "ext_b"])
+
+    assert "circular" in str(info.value)
+    assert bot.setup_order == []
+    assert "ext_a" not in sys.modules and "ext_b" not in sys.modules
+
+
+def test_load_extensions_rejects_missing_requires(bot, make_extension):
+    bot.setup_order = []
+    ordered(make_extension, "ext_needy", ["ext_absent"])
+
+    with pytest.raises(commands.ExtensionDependencyError) as info:
+        bot.load_extensions(["ext_needy"])
+
+    assert "ext_absent" in str(info.value)
+    assert info.value.timings["ext_needy"]["setup"] is None
+    assert "ext_needy" not in sys.modules
+
+
+def test_load_extensions_is_all_or_nothing(bot, make_extension):
+    bot.setup_order = []
+    ordered(make_extension, "ext_good")
+    ordered(make_extension, "ext_bad", ["ext_good"], fail=True)
+
+    with pytest.raises(commands.ExtensionFailed) as info:
+        bot.load_extensions(["ext_bad", "ext_good"])
+
+    assert bot.setup_order == ["ext_good", "ext_bad"]
+    assert info.value.timings["ext_good"]["setup"] >= 0
+    assert info.value.timings["ext_bad"]["setup"] is None
+    assert not bot._extensions
+    assert "ext_good_cmd" not in bot.commands
+    assert "ext_good" not in sys.modules and "ext_bad" not in sys.modules
+
+
+def test_load_extensions_rollback_keeps_preloaded_modules(bot, make_extension):
+    bot.setup_order = []
+    ordered(make_extension, "ext_preloaded")
+    ordered(make_extension, "ext_failing", fail=True)
+    preloaded = importlib.import_module("ext_preloaded")
+
+    with pytest.raises(commands.ExtensionFailed):
+        bot.load_extensions(["ext_preloaded", "ext_failing"])
+
+    assert sys.modules["ext_preloaded"] is preloaded
+    assert "ext_failing" not in sys.modules
+    sys.modules.pop("ext_preloaded")
@@ -0,0 +1,82 @@
+import threading
+
+import pytest
+
+from telegram.ext.commands import MetricsRegistry
+
+
+def run_in_threads(func, count=4):
+    threads = [threading.Thread(target=func) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def test_counter_sums_threads():
+    counter = MetricsRegistry().counter("calls_total", "Calls.", ("name",))
+    counter.inc("a")
+    run_in_threads(lambda: counter.inc("a", amount=2))
+
+    assert counter.value("a") == 9
+    assert counter.value("b") == 0
+
+
+def test_exited_threads_are_folded():
+    counter = MetricsRegistry().counter("calls_total", "Calls.")
+    histogram = MetricsRegistry().histogram("seconds", "Time.", buckets=(1.0,))
+
+    def record():
+        counter.inc()
+        histogram.observe(0.5)
+        histogram.observe(2.0)
+
+    for _ in range(20):
+        run_in_threads(record)
+
+    assert len(counter._shards) == 0
+    assert len(histogram._shards) == 0
+    assert counter.value() == 80
+    assert histogram.count() == 160
+    assert histogram._merged()[()] == [[80, 80], 200.0]
+
+
+def test_render_prometheus_text():
+    registry = MetricsRegistry()
+    registry.counter("calls_total", "Calls.", ("name",)).inc('say "hi"')
+    registry.histogram("seconds", "Time.", buckets=(1.0,)).observe(0.5)
+    registry.gauge("depth", "Depth.").set(3)
+
+    assert registry.render().splitlines() == [
+        "# HELP calls_total Calls.",
+        "# TYPE calls_total counter",
+        'calls_total{name="say \\"hi\\""} 1',
+        "# HELP seconds Time.",
+        "# TYPE seconds histogram",
+        'seconds_bucket{le="1.0"} 1',
+        'seconds_bucket{le="+Inf"} 1',
+        "seconds_sum 0.5",
+        "seconds_count 1",
+        "# HELP depth Depth.",
+        "# TYPE depth gauge",
+        "depth 3",
+    ]
+
+
+def test_type_conflict():
+    registry = MetricsRegistry()
+    registry.counter("name", "A counter.")
+    with pytest.raises(ValueError):
+        registry.gauge("name", "A gauge.")
+
+
+def test_errors_outside_command_errors_are_counted(bot, dispatch):
+    # a callback without a ctx parameter fails while parsing, with an
+    # error that goes to the dispatcher instead of on_command_error
+    @bot.command()
+    def broken():
+        pass
+
+    dispatch("/broken")
+
+    assert bot._command_metrics.errors.value("broken", "BotException") == 1
@@ -0,0 +1,109 @@
+import time
+
+import pytest
+import telegram
+
+from telegram.ext.commands import PipelinedPoller, testing
+
+
+def wait_for(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+@pytest.fixture
+def api():
+    with testing.FakeBotAPI() as api:
+        yield api
+
+
+def make_poller(api, deliver, **kwargs):
+    kwargs.setdefault("timeout", 1)
+    bot = telegram.Bot("123456:TEST", base_url=api.base_url)
+    return PipelinedPoller(bot, deliver=deliver, **kwargs)
+
+
+def offsets(api):
+    return [
+        data.get("offset") for endpoint, data in api.calls if endpoint == "getUpdates"
+    ]
+
+
+def test_offset_waits_for_dispatch(api):
+    for update_id in (1, 2, 3):
+        api.push_update("/hello", update_id=update_id)
+    delivered = []
+    poller = make_poller(api, lambda update: delivered.append(update.update_id))
+    poller.start()
+    try:
+        assert wait_for(lambda: delivered == [1, 2, 3])
+        # the later ones finished first, 1 is still being dispatched
+        poller.done(2)
+        poller.done(3)
+        assert poller.offset == 1
+        time.sleep(0.2)
+        assert all(offset in (None, 1) for offset in offsets(api))
+
+        poller.done(1)
+        assert poller.offset == 4
+        assert wait_for(lambda: 4 in offsets(api))
+    finally:
+        poller.stop()
+    assert delivered == [1, 2, 3]
+
+
+def test_unacked_updates_are_delivered_after_a_crash(api):
+    for update_id in (1, 2):
+        api.push_update("/hello", update_id=update_id)
+    delivered = []
+    poller = make_poller(api, lambda update: delivered.append(update.update_id))
+    poller.start()
+    assert wait_for(lambda: delivered == [1, 2])
+    poller.done(2)
+    # the process dies while 1 is dispatched, nothing is committed
+    poller.stop()
+
+    redelivered = []
+    restarted = make_poller(api, lambda update: redelivered.append(update.update_id))
+    restarted.start()
+    try:
+        assert wait_for(lambda: redelivered == [1, 2])
+        restarted.done(1)
+        restarted.done(2)
+    finally:
+        restarted.stop()
+    restarted.commit()
+
+    # committed this time, so a third start gets nothing
+    assert offsets(api)[-1] == 3
+    assert not api._updates
+
+
+def test_batches_are_delivered_in_order(api):
+    for update_id in range(1, 8):
+        api.push_update("/hello", update_id=update_id)
+    delivered = []
+    poller = None
+
+    def deliver(update):
+        delivered.append(update.update_id)
+        poller.done(update.update_id)
+
+    poller = make_poller(api, deliver, max_backlog=2)
+    poller.start()
+    try:
+        assert wait_for(lambda: len(delivered) == 7)
+    finally:
+        poller.stop()
+
+    assert delivered == [1, 2, 3, 4, 5, 6, 7]
+    limits = [
+        data["limit"] for endpoint, data in api.calls if endpoint == "getUpdates"
+    ]
+    assert max(limits) <= 2
+    seen = [offset or 0 for offset in offsets(api)]
+    assert seen == sorted(seen)
@@ -0,0 +1,123 @@
+import json
+import sys
+import threading
+
+from telegram.ext import commands
+from telegram.ext.commands import AllocationProfiler
+
+
+def test_measures_net_allocations():
+    profiler = AllocationProfiler()
+    kept = []
+
+    with profiler.measure("cmd"):
+        kept.append(bytearray(100000))
+
+    samples, size = profiler.totals()["cmd"]
+    assert samples == 1
+    assert size >= 100000
+    assert profiler.top_lines("cmd", limit=1)[0][3] >= 100000
+
+
+def test_counts_skipped_invocations():
+    profiler = AllocationProfiler()
+    inside = threading.Event()
+    release = threading.Event()
+
+    def measured():
+        with profiler.measure("slow"):
+            inside.set()
+            release.wait(1.0)
+
+    thread = threading.Thread(target=measured)
+    thread.start()
+    inside.wait(1.0)
+    with profiler.measure("fast"):
+        pass
+    release.set()
+    thread.join()
+
+    assert profiler.skipped() == {"fast": 1}
+    assert "fast" not in profiler.totals()
+    assert json.loads(profiler.dump())["fast"]["skipped"] == 1
+
+    profiler.reset()
+    assert profiler.skipped() == {}
+
+
+def test_should_sample():
+    profiler = AllocationProfiler(commands=["named"])
+    traced = commands.command(trace_allocations=True)(lambda ctx: None)
+    named = commands.command(name="named")(lambda ctx: None)
+    other = commands.command(name="other")(lambda ctx: None)
+
+    assert profiler.should_sample(traced)
+    assert profiler.should_sample(named)
+    assert not profiler.should_sample(other)
+
+
+def test_snapshots_are_not_timed_as_the_callback(bot, dispatch, monkeypatch):
+    @bot.command(trace_allocations=True)
+    def alloc(ctx):
+        pass
+
+    bot.allocation_profiler = profiler = AllocationProfiler()
+    measured = []
+    record = profiler._record
+
+    def slow_record(*args):
+        measured.append(bot._command_metrics.stage_seconds.count("alloc", "callback"))
+        record(*args)
+
+    monkeypatch.setattr(profiler, "_record", slow_record)
+    dispatch("/alloc")
+
+    # the stage was already observed when the snapshots were compared
+    assert measured == [1]
+    assert profiler.totals()["alloc"][0] == 1
+
+
+def _sent(stub):
+    return [data["text"] for endpoint, data in stub.calls if endpoint == "sendMessage"]
+
+
+def test_profile_rejects_out_of_range_seconds(bot, stub, dispatch):
+    cog = commands.Profiling(max_seconds=60)
+    bot.add_cog(cog)
+
+    dispatch("/profile 0")
+    dispatch("/profile 61")
+    dispatch("/profile nan")
+
+    assert not cog.profiler.running
+    assert _sent(stub) == ["Seconds must be more than 0 and at most 60."] * 3
+
+
+def test_profile_starts_once(bot, stub, dispatch):
+    cog = commands.Profiling()
+    bot.add_cog(cog)
+    barrier = threading.Barrier(4)
+    threads = [
+        threading.Thread(target=lambda: (barrier.wait(1.0), dispatch("/profile 5")))
+        for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5.0)
+
+    try:
+        assert sorted(_sent(stub)) == (
+            ["Profiling for 5 seconds."] + ["The profiler is already running."] * 3
+        )
+    finally:
+        cog.cog_unload()
+
+
+def test_frame_labels_have_no_line_numbers():
+    from telegram.ext.commands.profiling import _frame_label
+
+    frame = sys._getframe()
+    assert _frame_label(frame) == "{} ({})".format(
+        "test_frame_labels_have_no_line_numbers", __file__
+    )
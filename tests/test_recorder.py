@@ -0,0 +1,40 @@
+import threading
+
+from telegram.ext.commands import UpdateRecorder, testing
+from telegram.ext.commands.recorder import read_recording
+
+
+def test_records_updates_from_many_threads(tmp_path, stub):
+    path = str(tmp_path / "updates.jsonl.gz")
+    recorder = UpdateRecorder(path, anonymize=True)
+
+    def record(chat_id):
+        for _ in range(20):
+            recorder.record(testing.make_update("/hi", stub, chat_id=chat_id))
+
+    threads = [threading.Thread(target=record, args=(1000 + i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    recorder.flush()
+    assert recorder.count == 160
+    recorder.close()
+
+    entries = list(read_recording(path))
+    assert len(entries) == 160
+    chats = {update["message"]["chat"]["id"] for _, update in entries}
+    # every real chat kept a pseudonym of its own
+    assert len(chats) == 8
+    assert not chats & {1000 + i for i in range(8)}
+
+
+def test_ignores_updates_after_close(tmp_path, stub):
+    path = str(tmp_path / "updates.jsonl.gz")
+    recorder = UpdateRecorder(path)
+    recorder.record(testing.make_update("/hi", stub))
+    recorder.close()
+    recorder.record(testing.make_update("/hi", stub))
+    recorder.close()
+
+    assert len(list(read_recording(path))) == 1
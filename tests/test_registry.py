@@ -0,0 +1,260 @@
+import threading
+
+import pytest
+
+from telegram.ext import commands
+from telegram.ext.commands import (
+    AdaptiveExecutor,
+    MemoryBackend,
+    SQLiteBackend,
+    testing,
+)
+from telegram.ext.commands.registry import (
+    RegistrySnapshot,
+    InflightTracker,
+    UpdateDeduplicator,
+)
+
+
+def test_snapshot_is_read_only():
+    snapshot = RegistrySnapshot({"a": 1})
+    with pytest.raises(TypeError):
+        snapshot.commands["b"] = 2
+
+
+def test_draft_does_not_change_the_snapshot():
+    snapshot = RegistrySnapshot({"a": 1}, {"a": "handler"})
+    draft = snapshot.draft()
+    draft.commands["b"] = 2
+    del draft.handlers["a"]
+
+    assert dict(snapshot.commands) == {"a": 1}
+    assert dict(snapshot.handlers) == {"a": "handler"}
+
+    published = draft.freeze()
+    assert dict(published.commands) == {"a": 1, "b": 2}
+    assert dict(published.handlers) == {}
+
+
+def _command(name):
+    return commands.command(name=name)(lambda ctx: None)
+
+
+def test_edit_is_published_on_exit(bot):
+    with bot._edit_registry():
+        bot.add_command(_command("first"))
+        bot.add_command(_command("second"))
+        # only this thread sees the draft
+        assert "first" in bot.commands
+        assert "first" not in bot._registry.commands
+
+    assert {"first", "second"} <= set(bot._registry.commands)
+
+
+def test_failed_edit_is_discarded(bot):
+    bot.add_command(_command("kept"))
+
+    with pytest.raises(ValueError):
+        with bot._edit_registry():
+            bot.add_command(_command("half"))
+            bot.add_command(_command("kept"))
+
+    assert "half" not in bot.commands
+    assert "half" not in bot._handlers
+    assert "kept" in bot.commands
+
+
+def test_inflight_tracker_waits_for_keys():
+    tracker = InflightTracker()
+    tracker.begin("a")
+    tracker.begin("b")
+
+    assert tracker.count() == 2
+    assert tracker.count(["a"]) == 1
+    assert not tracker.wait(["a"], timeout=0)
+
+    tracker.end("a")
+    assert tracker.wait(["a"], timeout=0)
+    assert not tracker.wait(timeout=0)
+    tracker.end("b")
+    assert tracker.wait(timeout=0)
+
+
+def test_deduplicator_drops_repeats():
+    deduplicator = UpdateDeduplicator(4)
+    assert deduplicator.check(1)
+    assert deduplicator.check(2)
+    assert not deduplicator.check(1)
+    assert len(deduplicator) == 2
+
+
+def test_deduplicator_forgets_outside_window():
+    deduplicator = UpdateDeduplicator(2)
+    for update_id in (1, 2, 3):
+        assert deduplicator.check(update_id)
+
+    assert len(deduplicator) == 2
+    # 1 was evicted by 3
+    assert deduplicator.check(1)
+    assert not deduplicator.check(3)
+
+
+def test_deduplicator_rejects_empty_window():
+    with pytest.raises(ValueError):
+        UpdateDeduplicator(0)
+
+
+def test_deduplicator_shares_state():
+    state = MemoryBackend()
+    first = UpdateDeduplicator(4, state=state)
+    # a restarted process, or another shard, with an empty ring
+    second = UpdateDeduplicator(4, state=state)
+
+    assert first.check(1)
+    # not handled yet, it may still be cancelled or lost
+    assert second.check(1)
+    first.complete(1)
+    assert not UpdateDeduplicator(4, state=state).check(1)
+
+
+def test_deduplicator_state_expires():
+    state = MemoryBackend()
+    deduplicator = UpdateDeduplicator(4, state=state, ttl=0)
+    deduplicator.check(1)
+    deduplicator.complete(1)
+    assert UpdateDeduplicator(4, state=state, ttl=0).check(1)
+
+
+def test_deduplicator_forget():
+    deduplicator = UpdateDeduplicator(3)
+    assert deduplicator.check(1)
+    deduplicator.forget(1)
+    assert deduplicator.check(1)
+    assert deduplicator.check(2)
+    # the slot 1 had before it was forgotten does not evict it
+    assert deduplicator.check(3)
+    assert not deduplicator.check(1)
+
+
+def test_bot_drops_redelivered_commands(bot, stub, dispatch):
+    calls = []
+
+    @bot.command()
+    def hello(ctx):
+        calls.append(ctx.update_id)
+
+    dispatch("/hello", update_id=10)
+    dispatch("/hello", update_id=10)
+    dispatch("/hello", update_id=11)
+
+    assert calls == [10, 11]
+    assert bot._command_metrics.duplicates.value("hello") == 1
+
+
+def test_bot_keeps_update_ids_out_of_state_by_default(bot, dispatch):
+    @bot.command()
+    def hello(ctx):
+        pass
+
+    dispatch("/hello", update_id=20)
+    assert bot.deduplicator.state is None
+    assert bot.state.get("update:20") is None
+
+
+def test_shared_dedup_needs_a_shared_backend():
+    with pytest.raises(ValueError):
+        commands.Bot("123456:TEST", dedup_shared=True)
+
+
+def _shared_bot(path):
+    bot = commands.Bot(
+        "123456:TEST", help_command=None, state=SQLiteBackend(path), dedup_shared=True
+    )
+    stub = testing.use_stub_api(bot)
+    calls = []
+    started = threading.Event()
+    release = threading.Event()
+
+    @bot.command()
+    def block(ctx):
+        started.set()
+        release.wait(2.0)
+        calls.append(ctx.update_id)
+
+    @bot.command()
+    def hello(ctx):
+        calls.append(ctx.update_id)
+
+    def dispatch(text, update_id):
+        update = testing.make_update(text, stub, update_id=update_id)
+        bot.dispatcher.process_update(update)
+
+    return bot, dispatch, calls, started, release
+
+
+def test_cancelled_update_runs_when_redelivered(tmp_path):
+    path = str(tmp_path / "state.db")
+    bot, dispatch, calls, started, release = _shared_bot(path)
+    bot.executor = AdaptiveExecutor(min_workers=1, max_workers=1)
+    dispatch("/block", 1000)
+    assert started.wait(2.0)
+    # queued behind /block in the same chat, then cancelled
+    dispatch("/hello", 1001)
+    bot.executor.shutdown(wait=False, cancel_pending=True)
+    release.set()
+    bot.executor.shutdown()
+    bot.state.close()
+    assert calls == [1000]
+
+    # restarted, and Telegram delivers both again
+    bot, dispatch, calls, started, release = _shared_bot(path)
+    release.set()
+    dispatch("/block", 1000)
+    dispatch("/hello", 1001)
+    bot.state.close()
+    assert calls == [1001]
+
+
+def test_failed_update_runs_when_redelivered(bot, dispatch):
+    calls = []
+
+    @bot.command()
+    def flaky(ctx):
+        calls.append(ctx.update_id)
+        if len(calls) == 1:
+            raise RuntimeError("flaky")
+
+    dispatch("/flaky", update_id=30)
+    dispatch("/flaky", update_id=30)
+    dispatch("/flaky", update_id=30)
+    assert calls == [30, 30]
+
+
+def test_alias_collision_is_rejected(bot, dispatch, stub):
+    calls = []
+    stats = commands.command(name="stats")(lambda ctx: calls.append("stats"))
+    info = commands.command(name="info", aliases=["Stats"])(
+        lambda ctx: calls.append("info")
+    )
+    bot.add_command(stats)
+
+    with pytest.raises(ValueError):
+        bot.add_command(info)
+    assert "info" not in bot.commands
+    assert set(bot._handlers) == {"stats"}
+
+    dispatch("/stats")
+    assert calls == ["stats"]
+
+
+def test_remove_command_keeps_other_handlers(bot):
+    stats = _command("stats")
+    bot.add_command(stats)
+    # a handler under a name the removed command claims, but does not own
+    other = _command("other")
+    other.aliases = ["stats"]
+    with bot._edit_registry() as registry:
+        registry.commands["other"] = other
+
+    bot.remove_command("other")
+    assert bot._handlers["stats"].callback is stats
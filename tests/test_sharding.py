@@ -0,0 +1,56 @@
+import json
+import time
+import urllib.request
+
+from telegram.ext import commands
+from telegram.ext.commands import ShardSupervisor, testing
+
+
+def make_bot():
+    # runs in the spawned worker processes
+    bot = commands.Bot("123456:TEST", help_command=None)
+    testing.use_stub_api(bot)
+
+    @bot.command()
+    def hello(ctx):
+        ctx.send("hello")
+
+    return bot
+
+
+def post(address, data):
+    request = urllib.request.Request(
+        "http://{}:{}/".format(*address),
+        data=json.dumps(data).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+    )
+    with urllib.request.urlopen(request, timeout=5) as response:
+        return response.status
+
+
+def test_stop_routes_every_acknowledged_update():
+    supervisor = ShardSupervisor(
+        "123456:TEST", "test_sharding:make_bot", shards=2, rate_limit=None
+    )
+    route = supervisor._route
+
+    def slow_route(update):
+        # leaves updates in the intake when stop() is called
+        time.sleep(0.1)
+        route(update)
+
+    supervisor._route = slow_route
+    supervisor.start(mode="webhook", port=0)
+    try:
+        address = supervisor.webhook_server.address
+        for update_id in range(1, 11):
+            data = testing.update_data(
+                "/hello", update_id=update_id, chat_id=update_id
+            )
+            assert post(address, data) == 200
+    finally:
+        supervisor.stop()
+
+    assert sum(supervisor._routed.value(str(i)) for i in range(2)) == 10
+    assert all(not shard.pending for shard in supervisor._shards)
+    assert all(shard.restarts == 0 for shard in supervisor._shards)
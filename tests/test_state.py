@@ -0,0 +1,73 @@
+import pytest
+
+from telegram.ext.commands import MemoryBackend, SQLiteBackend
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def backend(request, tmp_path):
+    if request.param == "memory":
+        backend = MemoryBackend()
+    else:
+        backend = SQLiteBackend(str(tmp_path / "state.db"))
+    yield backend
+    backend.close()
+
+
+def test_get_set_delete(backend):
+    assert backend.get("key") is None
+    assert backend.set("key", {"a": [1, 2]})
+    assert backend.get("key") == {"a": [1, 2]}
+    assert backend.delete("key")
+    assert not backend.delete("key")
+    assert backend.get("key") is None
+
+
+def test_add_only_sets_missing_keys(backend):
+    assert backend.add("key", 1)
+    assert not backend.add("key", 2)
+    assert backend.get("key") == 1
+
+
+def test_incr_keeps_the_first_ttl(backend):
+    assert backend.incr("key", ttl=60) == 1
+    assert backend.incr("key", 2, ttl=1) == 3
+    assert 59 < backend.ttl("key") <= 60
+
+
+def test_expired_keys_are_gone(backend):
+    backend.set("key", 1, ttl=0)
+    assert backend.get("key") is None
+    assert backend.ttl("key") is None
+    assert backend.add("key", 2, ttl=0)
+
+
+def test_pipeline_returns_results_in_order(backend):
+    pipeline = backend.pipeline()
+    results = pipeline.set("a", 1).incr("b", ttl=10).get("a").ttl("missing").execute()
+    assert results == [True, 1, 1, None]
+    assert len(pipeline) == 0
+    assert pipeline.execute() == []
+
+
+def test_pipeline_context_manager_executes(backend):
+    with backend.pipeline() as pipeline:
+        pipeline.set("key", "value")
+    assert backend.get("key") == "value"
+
+
+def test_unknown_operation(backend):
+    with pytest.raises(ValueError):
+        backend.execute([("nope", ("key",))])
+
+
+def test_sqlite_is_shared_between_backends(tmp_path):
+    path = str(tmp_path / "state.db")
+    first, second = SQLiteBackend(path), SQLiteBackend(path)
+    try:
+        assert first.add("key", 1, ttl=60)
+        assert not second.add("key", 1, ttl=60)
+        assert second.incr("count") == 1
+        assert first.incr("count") == 2
+    finally:
+        first.close()
+        second.close()
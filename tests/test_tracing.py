@@ -0,0 +1,84 @@
+import json
+
+from telegram.ext.commands import JSONLinesExporter, RingBufferExporter, Tracer
+
+
+def traced(bot):
+    exporter = RingBufferExporter()
+    bot.tracer = Tracer(exporter)
+    return exporter
+
+
+def tree(spans):
+    by_id = {span.span_id: span for span in spans}
+    return {
+        span.name: by_id[span.parent_id].name if span.parent_id else None
+        for span in spans
+    }
+
+
+def test_spans_of_a_command(bot, dispatch):
+    exporter = traced(bot)
+
+    @bot.command()
+    def hello(ctx, name):
+        ctx.send("hello " + name)
+
+    update = dispatch("/hello world", update_id=500)
+    spans = exporter.spans(500)
+
+    assert tree(spans) == {
+        "command": None,
+        "parse": "command",
+        "checks": "command",
+        "before_hooks": "command",
+        "callback": "command",
+        "sendMessage": "callback",
+        "after_hooks": "command",
+    }
+    assert all(span.trace_id == update.update_id for span in spans)
+    assert all(span.error is None for span in spans)
+    assert all(span.duration >= 0 for span in spans)
+    root = next(span for span in spans if span.name == "command")
+    assert root.attributes == {"command": "hello"}
+
+
+def test_failed_command_marks_the_root_span(bot, dispatch):
+    exporter = traced(bot)
+
+    @bot.command()
+    def fail(ctx):
+        raise ValueError("boom")
+
+    @bot.command()
+    def needs(ctx, name):
+        pass
+
+    dispatch("/fail", update_id=501)
+    spans = {span.name: span for span in exporter.spans(501)}
+    assert spans["callback"].error.startswith("CommandInvokeError")
+    assert spans["command"].error == spans["callback"].error
+    assert spans["error_handlers"].error is None
+
+    dispatch("/needs", update_id=502)
+    spans = {span.name: span for span in exporter.spans(502)}
+    assert spans["parse"].error.startswith("MissingRequiredArgument")
+    assert spans["command"].error == spans["parse"].error
+    assert "callback" not in spans
+
+
+def test_json_lines_exporter(tmp_path):
+    path = tmp_path / "spans.jsonl"
+    tracer = Tracer(JSONLinesExporter(str(path)))
+    root = tracer.start_span("command", 7, command="hello")
+    child = tracer.start_span("parse", 7, root)
+    tracer.end_span(child, ValueError("bad"))
+    tracer.end_span(root)
+    tracer.close()
+
+    lines = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [line["name"] for line in lines] == ["parse", "command"]
+    assert lines[0]["parent_id"] == lines[1]["span_id"]
+    assert lines[0]["error"] == "ValueError: bad"
+    assert lines[1]["error"] is None
+    assert lines[1]["attributes"] == {"command": "hello"}
@@ -0,0 +1,60 @@
+import time
+import threading
+
+import pytest
+
+from telegram.ext.commands import CommandWatchdog, CommandTimeout
+
+
+def test_returns_result():
+    watchdog = CommandWatchdog()
+    assert watchdog.run(1.0, lambda a, b: a + b, 1, 2) == 3
+
+
+def test_reraises_error():
+    watchdog = CommandWatchdog()
+
+    def fail():
+        raise KeyError("boom")
+
+    with pytest.raises(KeyError):
+        watchdog.run(1.0, fail)
+
+
+def test_interrupts_slow_callback():
+    watchdog = CommandWatchdog()
+    finished = threading.Event()
+
+    def slow():
+        for _ in range(200):
+            time.sleep(0.01)
+        finished.set()
+
+    with pytest.raises(CommandTimeout):
+        watchdog.run(0.05, slow)
+    assert not finished.wait(0.5)
+
+
+def test_concurrent_runs_with_one_idle_thread():
+    # a race, so try it a few times
+    for _ in range(50):
+        watchdog = CommandWatchdog(workers=8)
+        # leaves one idle thread behind
+        watchdog.run(1.0, lambda: None)
+
+        start = threading.Barrier(2)
+        both = threading.Barrier(2)
+        results = []
+
+        def invoke():
+            start.wait()
+            # the callbacks only finish if both of them run
+            results.append(watchdog.run(1.0, both.wait, 1.0))
+
+        threads = [threading.Thread(target=invoke) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert sorted(results) == [0, 1]
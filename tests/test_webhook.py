@@ -0,0 +1,98 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+
+from telegram.ext.commands import WebhookServer, testing
+from telegram.ext.commands.webhook import SECRET_TOKEN_HEADER
+
+
+def test_start_webhook_leaves_the_updater_alone(bot, stub):
+    server = bot.start_webhook(port=0, webhook_url="https://example.com/hook")
+    try:
+        assert server.running
+        assert not bot.updater.running
+        assert bot.dispatcher.running
+        endpoint, data = stub.calls[-1]
+        assert endpoint == "setWebhook"
+        assert "secret_token" not in data
+    finally:
+        bot.stop()
+
+    assert not server.running
+    assert not bot.dispatcher.running
+
+
+def test_secret_token_is_registered(bot, stub):
+    bot.start_webhook(
+        port=0, webhook_url="https://example.com/hook", secret_token="secret"
+    )
+    try:
+        endpoint, data = stub.calls[-1]
+        assert endpoint == "setWebhook"
+        assert data["secret_token"] == "secret"
+    finally:
+        bot.stop()
+
+
+def test_secret_token_needs_support(bot, stub, monkeypatch):
+    def set_webhook(url=None, max_connections=40, drop_pending_updates=None):
+        return True
+
+    monkeypatch.setattr(stub, "set_webhook", set_webhook)
+
+    with pytest.raises(TypeError):
+        bot.start_webhook(
+            port=0, webhook_url="https://example.com/hook", secret_token="secret"
+        )
+    assert bot.webhook_server is None
+    assert not bot.dispatcher.running
+
+
+def test_stop_without_start(stub):
+    server = WebhookServer(stub, None, port=0)
+    server.stop()
+    assert not server.running
+
+
+def post(server, data, secret_token=None):
+    headers = {"Content-Type": "application/json"}
+    if secret_token is not None:
+        headers[SECRET_TOKEN_HEADER] = secret_token
+    request = urllib.request.Request(
+        "http://{}:{}/hook".format(*server.address),
+        data=json.dumps(data).encode("utf-8"),
+        headers=headers,
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=5) as response:
+            return response.status
+    except urllib.error.HTTPError as exc:
+        return exc.code
+
+
+def test_posted_updates_run_commands(bot, stub):
+    ran = threading.Event()
+
+    @bot.command()
+    def hello(ctx):
+        ctx.send("hi")
+        ran.set()
+
+    server = bot.start_webhook(port=0, url_path="hook", secret_token="secret")
+    try:
+        data = testing.update_data("/hello")
+        assert post(server, data, secret_token="wrong") == 403
+        assert post(server, data) == 403
+        assert not ran.wait(0.2)
+
+        assert post(server, data, secret_token="secret") == 200
+        assert ran.wait(5.0)
+    finally:
+        bot.stop()
+
+    assert server.received == 1
+    sent = [data["text"] for endpoint, data in stub.calls if endpoint == "sendMessage"]
+    assert sent == ["hi"]